@@ -1,35 +1,18 @@
 import os
-import pandas as pd
-import openpyxl
-import xlwings as xw
 import json
 import sys
 import logging
-from openpyxl import load_workbook, Workbook
-from openpyxl.styles import Alignment, Font, PatternFill, Border, Side, Protection
-from openpyxl.worksheet.datavalidation import DataValidation
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.formatting.rule import FormulaRule
-from datetime import datetime
-from concurrent_log_handler import ConcurrentRotatingFileHandler
-
-# --- CUSTOM TIMESTAMPED ROTATING HANDLER ---
-class TimestampedConcurrentRotatingFileHandler(ConcurrentRotatingFileHandler):
-    def doRollover(self):
-        if self.stream:
-            self.stream.close()
-            self.stream = None
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        dirname, basename = os.path.split(self.baseFilename)
-        new_logname = os.path.join(dirname, f"master_{timestamp}.log")
-
-        if os.path.exists(self.baseFilename):
-            os.rename(self.baseFilename, new_logname)
-
-        # All timestamped logs will be kept
-
-        self.stream = self._open()
+import tempfile
+from master_log import attach_master_log
+from ledger import open_ledger
+from scan_index import ScanIndex
+import csv_schemas
+from labelling import create_label_backend, Labeller
+from metrics import Metrics
+from sync_manifest import PARTIAL_SUFFIX
+from copy_queue import CopyQueue
+# pandas and openpyxl (csv_schemas.py, sheet_layouts.py) are imported by the functions that
+# convert a file, so a run that finds nothing new only pays for the scan
 
 # --- CONFIG DECLARATION BLOCK ---
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -40,279 +23,402 @@ with open(config_path, 'r') as f:
 raw_file_source = config['raw_file_source']
 bp_process_dest = config['bp_process_dest']
 serum_process_dest = config['serum_process_dest']
-bp_copy_source = config['bp_copy_source']
-serum_copy_source = config['serum_copy_source']
-bp_copy_dest = config['bp_copy_dest']
-serum_copy_dest = config['serum_copy_dest']
 interval_minutes = config['interval_minutes']
 record_process = config['record_process']
+record_ledger = config.get('record_ledger', os.path.splitext(record_process)[0] + '.db')
+record_export_xlsx = config.get('record_export_xlsx', False)
+process_workers = config.get('process_workers', 1) or os.cpu_count() or 1
+sensitivity_label_enabled = config.get('sensitivity_label_enabled', True)
+label_backend_name = config.get('label_backend', 'excel') if sensitivity_label_enabled else 'none'
+label_async = config.get('label_async', False)
+streaming_threshold_mb = config.get('streaming_threshold_mb', 50)
+csv_chunk_rows = config.get('csv_chunk_rows', 10000)
+precompute_derived_values = config.get('precompute_derived_values', False)
+scan_index_path = config.get('scan_index_path', record_ledger)
+input_stable_seconds = config.get('input_stable_seconds', 30)
+input_hash_check = config.get('input_hash_check', False)
+CSV_SCHEMAS = csv_schemas.load_schemas(config.get('csv_schemas'))
+csv_use_pyarrow = config.get('csv_use_pyarrow', True)
+metrics_enabled = config.get('metrics_enabled', True)
+metrics_folder = config.get('metrics_folder', os.path.join(script_dir, 'logs'))
+copy_queue_path = config.get('copy_queue', os.path.join(script_dir, 'copy_queue.db'))
 log_folder = config['log_folder']
 # --- END CONFIG DECLARATION BLOCK ---
 
 # --- LOGGER SETUP BLOCK ---
 formatter = logging.Formatter('[%(asctime)s] [%(name)s][%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 blood_logger = logging.getLogger("BP")
-blood_handler = TimestampedConcurrentRotatingFileHandler(
-    log_path, maxBytes=20*1024*1024, encoding='utf-8'
-)
+# Master.log directly, or through the scheduler's log server (master_log.py)
+blood_handler = attach_master_log(blood_logger, formatter, log_path)
 blood_stream = logging.StreamHandler(sys.stdout)
-blood_handler.setFormatter(formatter)
 blood_stream.setFormatter(formatter)
 blood_logger.setLevel(logging.INFO)
-blood_logger.addHandler(blood_handler)
 blood_logger.addHandler(blood_stream)
 blood_logger.propagate = False
 serum_logger = logging.getLogger("SERUM")
-serum_handler = TimestampedConcurrentRotatingFileHandler(
-    log_path, maxBytes=20*1024*1024, encoding='utf-8'
-)
+serum_handler = attach_master_log(serum_logger, formatter, log_path)
 serum_stream = logging.StreamHandler(sys.stdout)
-serum_handler.setFormatter(formatter)
 serum_stream.setFormatter(formatter)
 serum_logger.setLevel(logging.INFO)
-serum_logger.addHandler(serum_handler)
 serum_logger.addHandler(serum_stream)
 serum_logger.propagate = False
 # --- END LOGGER SETUP BLOCK ---
 
-# --- Open and read value in record_process xlsx file ---
-def load_or_create_record(record_path):
+# --- Sensitivity labelling: the backend is per process, the Labeller is started by main() ---
+label_backend = create_label_backend(label_backend_name)
+labeller = None
+
+# --- Per-stage spans (metrics.py), written to metrics_folder at the end of each run ---
+metrics = Metrics("process", metrics_folder, metrics_enabled)
+
+# --- Open the processed-files ledger, importing the legacy record_process xlsx once ---
+def load_or_create_record(ledger_path, record_path):
     try:
-        if os.path.exists(record_path):
-            record_wb = load_workbook(record_path)
-            record_ws = record_wb.active
-        else:
-            record_wb = Workbook()
-            record_ws = record_wb.active
-            record_ws.title = "Sheet1"
-            record_ws.append(["Processed Files"])
-            record_wb.save(record_path)
-        processed_files = {cell.value for cell in record_ws['A'] if cell.value}
-        return record_wb, record_ws, processed_files
+        ledger, imported = open_ledger(ledger_path, record_path)
+        if imported is not None:
+            blood_logger.info(f"Imported {imported} processed file entries from {record_path} into {ledger_path}")
+        return ledger
     except Exception as e:
-        blood_logger.error(f"Error loading/creating record workbook: {e}")
+        blood_logger.error(f"Error loading/creating record ledger: {e}")
         sys.exit(1)
 
-def update_record(file_name, record_ws, record_wb, record_path):
-    record_ws.append([file_name])
-    record_wb.save(record_path)
+# The finished output is handed to robocopy.py through the copy queue
+def update_record(kind, file_name, ledger, scan_index, copy_queue):
+    with metrics.span("record", file=file_name):
+        ledger.add(file_name)
+        scan_index.mark_processed(file_name)
+        if copy_queue is not None:
+            try:
+                copy_queue.enqueue([output_path_for(kind, file_name)])
+            except Exception as e:
+                blood_logger.warning(f"Failed to queue {file_name} for copying, the next sweep will pick it up: {e}")
 
-# --- Function to apply sensitivity label ---
-def apply_sensitivity_label(output_path, logger):
+def open_copy_queue():
+    if not copy_queue_path:
+        return None
     try:
-        xl_app = xw.App(visible=False)
-        xl_book = xl_app.books.open(output_path)
-        try:
-            label_info = xl_book.api.SensitivityLabel.CreateLabelInfo()
-            label_info.AssignmentMethod = 2
-            label_info.LabelId = "f48041ff-f5de-4583-8841-e2a1851ee5d2"
-            label_info.LabelName = "Confidential"
-            label_info.SiteId = "771c9c47-7f24-44dc-958e-34f8713a8394t"
-            xl_book.api.SensitivityLabel.SetLabel(label_info, label_info)
-        except Exception as e:
-            logger.warning(f"Failed to apply sensitivity label to {output_path}: {e}")
-        xl_book.save()
-        xl_book.close()
-        xl_app.quit()
+        return CopyQueue(copy_queue_path)
     except Exception as e:
-        logger.error(f"Error applying sensitivity label to {output_path}: {e}")
-
-# --- first type of file format processing ---
-def format_serum_excel(ws):
-    ws["E1"] = "Weight (kg)"
-    ws["G1"] = "Total Weight (kg)"
-    ws["J1"] = "Total Litres Processed"
-    for col in ws.columns:
-        for cell in col:
-            col_letter = cell.column_letter
-            if col_letter == 'D':
-                cell.number_format = "0"
-            elif col_letter in ['E', 'G']:
-                cell.number_format = "0.000"
-            elif col_letter in ['F', 'H', 'I']:
-                cell.number_format = "0.00"
-            else:
-                cell.number_format = "0.00"
-            cell.alignment = Alignment(horizontal="left")
-    for col in ['B', 'C']:
-        ws.column_dimensions[col].auto_size = True
-    ws.column_dimensions['A'].width = 28
-    ws.column_dimensions['E'].width = 8
-    ws.column_dimensions['G'].width = 12
-    ws.column_dimensions['H'].width = 14
-    ws.column_dimensions['I'].width = 14
-    ws.column_dimensions['J'].width = 11
-    header_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-    border = Border(bottom=Side(style='thin'), right=Side(style='thin'), left=Side(style='thin'), top=Side(style='thin'))
-    for cell in ws[1]:
-        cell.font = Font(bold=True)
-        cell.fill = header_fill
-        cell.border = border
-        cell.alignment = Alignment(wrap_text=True)
-    ws.protection.sheet = True
-    ws.protection.set_password("password")
-    ws.protection.enable_selection = 'UnlockedCells'
-
-# --- Second type of file format processing ---
-def format_bp_excel(ws):
-    ws.insert_cols(7)
-    ws['G1'] = "SFF Net Weight (kg)"
-    for row in ws.iter_rows(min_row=2, min_col=7, max_col=7):
-        for cell in row:
-            cell.protection = Protection(locked=False)
-    red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-    formula = 'AND(P2<>"", ABS(P2 - SUM(F2:F1087)) > 0.2)'
-    rule = FormulaRule(formula=[formula], fill=red_fill)
-    ws.conditional_formatting.add('P2', rule)
-    highlight_fill = PatternFill(start_color="EC4F28", end_color="EC4F28", fill_type="solid")
-    rule2 = FormulaRule(formula=['AND(G2<>"", M2="Accept")'], fill=highlight_fill)
-    ws.conditional_formatting.add(f'G2:G{ws.max_row}', rule2)
-    ws.insert_cols(9)
-    ws['I1'] = "Volume (L)"
-    for row in range(2, ws.max_row + 1):
-        formula = f'=IF(G{row}="", H{row}, G{row}*0.959)'
-        ws[f'I{row}'] = formula
-    for col in ws.columns:
-        for cell in col:
-            cell.alignment = Alignment(horizontal='left')
-    for col_letter in ['D']:
-        for cell in ws[col_letter]:
-            cell.number_format = '0'
-    for col_letter in ['E', 'F', 'G', 'J', 'K']:
-        for cell in ws[col_letter]:
-            cell.number_format = '0.000'
-    for col_letter in ['H', 'I', 'L', 'N', 'O', 'Q']:
-        for cell in ws[col_letter]:
-            cell.number_format = '0.00'
-    ws['E1'] = "Gross Weight (kg)"
-    ws['F1'] = "Net Weight (kg)"
-    ws['G1'] = "SFF Net Weight (kg)"
-    ws['H1'] = "Volume Recorded (L)"
-    ws['I1'] = "Volume (L)"
-    ws['J1'] = "Total Gross Weight (kg)"
-    ws['K1'] = "Total Net Weight (kg)"
-    ws['L1'] = "Total Volume (L)"
-    ws['M1'] = "Accept / Reject"
-    ws['N1'] = "Total Litres Rejected"
-    ws['O1'] = "Total Litres Accepted"
-    ws['P1'] = "Total SFF Net Weight (kg)"
-    ws['Q1'] = "SFF Litres"
-    ws['N2'] = '=SUMIF(M:M, "Reject", I:I)'
-    ws['O2'] = '=IF(ISBLANK(P2), SUMIF(M2:M1048576, "Accept", I2:I1048576), Q2-N2)'
-    ws['Q2'] = "=P2*0.959"
-    dv = DataValidation(type="list", formula1='"Accept,Reject"', showDropDown=False, allowBlank=False,
-                        showErrorMessage=True, errorTitle="Invalid Entry",
-                        error="Please select either Accept or Reject from the dropdown list")
-    ws.add_data_validation(dv)
-    dv.add("M2:M1048")
-    yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-    ws['O2'].fill = yellow_fill
-    for cell in ws['K']:
-        cell.fill = yellow_fill
-    header_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
-    bold_font = Font(bold=True)
-    thin_border = Border(bottom=Side(style='thin'), right=Side(style='thin'), left=Side(style='thin'), top=Side(style='thin'))
-    for cell in ws[1]:
-        cell.font = bold_font
-        cell.fill = header_fill
-        cell.border = thin_border
-        cell.alignment = Alignment(wrap_text=True)
-    ws.row_dimensions[1].height = 30
-    column_widths = {
-        'A': 29, 'B': 23, 'C': 10.5, 'D': 9, 'E': 12, 'F': 11, 'G': 12,
-        'H': 13, 'I': 12, 'J': 12, 'K': 12, 'L': 11, 'M': 11, 'N': 11, 'O': 13, 'P': 13
-    }
-    for col, width in column_widths.items():
-        ws.column_dimensions[col].width = width
-    for row in ws.iter_rows():
-        for cell in row:
-            cell.protection = Protection(locked=True)
-    for row in ws.iter_rows(min_row=2, min_col=13, max_col=13):
-        for cell in row:
-            cell.protection = Protection(locked=False)
-    ws['P2'].protection = Protection(locked=False)
-    for row in ws.iter_rows(min_row=2, min_col=7, max_col=7):
-        for cell in row:
-            cell.protection = Protection(locked=False)
-    ws.protection.sheet = True
-    ws.protection.set_password("password")
-    ws.protection.enable_selection = 'UnlockedCells'
-
-# --- first type of file apply password and sensitivity label, processing with the format_serum_excel ---
-def process_serum_file(file_name, csv_path):
+        blood_logger.warning(f"Copy queue unavailable ({copy_queue_path}), outputs are left to the copy sweep: {e}")
+        return None
+
+def export_record(ledger, record_path):
     try:
-        df = pd.read_csv(csv_path)
+        ledger.export_xlsx(record_path)
     except Exception as e:
-        serum_logger.error(f"Error reading {file_name}: {e}")
-        return False
+        blood_logger.warning(f"Failed to export record ledger to {record_path}: {e}")
+
+# --- Build each output workbook in one pass from its declarative layout (sheet_layouts.py) ---
+# Returns the workbook and the cached values computed for its total formulas.
+def build_workbook(layout, csv_header, chunks, write_only=False):
+    from openpyxl import Workbook
+    from sheet_layouts import write_sheet
+    wb = Workbook(write_only=write_only)
+    ws = wb.create_sheet("Sheet") if write_only else wb.active
     try:
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        for r in dataframe_to_rows(df, index=False, header=True):
-            ws.append(r)
-        output_path = os.path.join(serum_process_dest, file_name.replace(".csv", ".xlsx"))
-        wb.save(output_path)
-        apply_sensitivity_label(output_path, serum_logger)
+        cached_values = write_sheet(wb, ws, layout, csv_header, chunks, precompute_derived_values)
+    except Exception:
+        if write_only:
+            discard_write_only_sheet(ws)
+        raise
+    return wb, cached_values
+
+# A write-only sheet that failed part way (e.g. a bad value in a later chunk) still holds an open
+# temp file; close and remove it instead of leaving it to the garbage collector.
+def discard_write_only_sheet(ws):
+    try:
+        ws.close()
+        os.remove(ws._writer.out)
+    except Exception:
+        pass
+
+def build_serum_workbook(df):
+    from sheet_layouts import SERUM_LAYOUT
+    return build_workbook(SERUM_LAYOUT, list(df.columns), [df])
+
+def build_bp_workbook(df):
+    from sheet_layouts import BP_LAYOUT
+    return build_workbook(BP_LAYOUT, list(df.columns), [df])
+
+# --- Schema-driven CSV parsing (csv_schemas.py): declared dtypes, header checked up front ---
+def check_csv(kind, csv_path):
+    return csv_schemas.check_header(csv_schemas.read_header(csv_path), CSV_SCHEMAS[kind])
+
+def read_csv_file(kind, csv_path):
+    return csv_schemas.read_csv(csv_path, CSV_SCHEMAS[kind], csv_use_pyarrow)
+
+# --- Streaming conversion for large exports: chunked CSV reads into a write-only worksheet ---
+# Rows are written to disk as they are appended, so peak memory depends on csv_chunk_rows,
+# not on the size of the export.
+def use_streaming(csv_path):
+    return os.path.getsize(csv_path) >= streaming_threshold_mb * 1024 * 1024
+
+def stream_workbook(layout, kind, csv_header, csv_path, span):
+    chunks = csv_schemas.read_csv_chunks(csv_path, CSV_SCHEMAS[kind], csv_chunk_rows)
+    return build_workbook(layout, csv_header, count_rows(chunks, span), write_only=True)
+
+def count_rows(chunks, span):
+    span["rows"] = 0
+    for chunk in chunks:
+        span["rows"] += len(chunk)
+        yield chunk
+
+# --- Save once; formulas with precomputed results get their cached values filled in on the way ---
+# The file is written as <name>.part next to the output and renamed into place, so the copier
+# never picks up a half-written xlsx and the rename moves the folder mtime its manifest watches.
+def save_workbook(wb, output_path, layout, cached_values):
+    from sheet_layouts import cached_columns, write_cached_values
+    label_backend.prepare(wb)
+    columns = cached_columns(layout, precompute_derived_values)
+    part_path = output_path + PARTIAL_SUFFIX
+    try:
+        if not cached_values and not columns:
+            wb.save(part_path)
+        else:
+            fd, tmp_path = tempfile.mkstemp(suffix=".xlsx")
+            os.close(fd)
+            try:
+                wb.save(tmp_path)
+                write_cached_values(tmp_path, part_path, cached_values, columns)
+            finally:
+                os.remove(tmp_path)
+        os.replace(part_path, output_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+def output_path_for(kind, file_name):
+    process_dest = serum_process_dest if kind == "serum" else bp_process_dest
+    return os.path.join(process_dest, file_name.replace(".csv", ".xlsx"))
+
+# --- Optional post-processing stages that need to reopen the finished file ---
+# Pool workers drop the labeller (init_worker); the parent labels their outputs through its own session.
+def post_process_output(output_path, logger):
+    if labeller is not None:
+        labeller.submit(output_path, logger)
+
+# --- first type of file: one write from SERUM_LAYOUT, then the optional label stage ---
+# Both processors return True once the output is written, False on an error (retried on the
+# next run) and None when the file fails its schema check (skipped until it changes).
+def process_serum_file(file_name, csv_path):
+    from sheet_layouts import SERUM_LAYOUT
+    output_path = output_path_for("serum", file_name)
+    streaming = use_streaming(csv_path)
+    with metrics.span("read", file=file_name, bytes=os.path.getsize(csv_path)) as span:
         try:
-            xl_app = xw.App(visible=False)
-            xl_book = xl_app.books.open(output_path)
-            xl_sheet = xl_book.sheets[0]
-            xl_sheet.range("J2").formula = '=SUM(MAXIFS(F2:F1048576,D2:D1048576,UNIQUE(D2:D1048576)))'
-            xl_book.save()
-            xl_book.close()
-            xl_app.quit()
+            csv_header = check_csv("serum", csv_path)
         except Exception as e:
-            serum_logger.warning(f"Failed to insert formula in {output_path}: {e}")
-        wb = load_workbook(output_path)
-        ws = wb.active
-        format_serum_excel(ws)
-        wb.save(output_path)
-        serum_logger.info(f"First Type of file processed: {file_name} -> {output_path}")
+            serum_logger.error(f"Rejected {file_name} (skipped until it changes): {e}")
+            return None
+        try:
+            df = None if streaming else read_csv_file("serum", csv_path)
+        except Exception as e:
+            serum_logger.error(f"Error reading {file_name}: {e}")
+            return False
+        if df is not None:
+            span["rows"] = len(df)
+    try:
+        with metrics.span("build", file=file_name) as span:
+            if streaming:
+                wb, cached_values = stream_workbook(SERUM_LAYOUT, "serum", csv_header, csv_path, span)
+            else:
+                wb, cached_values = build_serum_workbook(df)
+                span["rows"] = len(df)
+        with metrics.span("save", file=file_name) as span:
+            save_workbook(wb, output_path, SERUM_LAYOUT, cached_values)
+            span["bytes"] = os.path.getsize(output_path)
+        post_process_output(output_path, serum_logger)
+        mode = " (streaming)" if streaming else ""
+        serum_logger.info(f"First Type of file processed{mode}: {file_name} -> {output_path}")
         return True
     except Exception as e:
         serum_logger.error(f"Error processing serum file {file_name}: {e}")
         return False
 
-# --- second type of file apply password and sensitivity label, processing with the format_bp_excel ---
+# --- second type of file: one write from BP_LAYOUT, then the optional label stage ---
 def process_bp_file(file_name, csv_path):
+    from sheet_layouts import BP_LAYOUT
+    output_path = output_path_for("bp", file_name)
+    streaming = use_streaming(csv_path)
+    with metrics.span("read", file=file_name, bytes=os.path.getsize(csv_path)) as span:
+        try:
+            csv_header = check_csv("bp", csv_path)
+        except Exception as e:
+            blood_logger.error(f"Rejected {file_name} (skipped until it changes): {e}")
+            return None
+        try:
+            df = None if streaming else read_csv_file("bp", csv_path)
+        except Exception as e:
+            blood_logger.error(f"Error reading {file_name}: {e}")
+            return False
+        if df is not None:
+            span["rows"] = len(df)
     try:
-        df = pd.read_csv(csv_path)
-    except Exception as e:
-        blood_logger.error(f"Error reading {file_name}: {e}")
-        return False
-    try:
-        wb = Workbook()
-        ws = wb.active
-        for r in dataframe_to_rows(df, index=False, header=True):
-            ws.append(r)
-        output_path = os.path.join(bp_process_dest, file_name.replace(".csv", ".xlsx"))
-        wb.save(output_path)
-        apply_sensitivity_label(output_path, blood_logger)
-        wb = load_workbook(output_path)
-        ws = wb.active
-        format_bp_excel(ws)
-        wb.save(output_path)
-        blood_logger.info(f"Second Type of file processed: {file_name} -> {output_path}")
+        with metrics.span("build", file=file_name) as span:
+            if streaming:
+                wb, cached_values = stream_workbook(BP_LAYOUT, "bp", csv_header, csv_path, span)
+            else:
+                wb, cached_values = build_bp_workbook(df)
+                span["rows"] = len(df)
+        with metrics.span("save", file=file_name) as span:
+            save_workbook(wb, output_path, BP_LAYOUT, cached_values)
+            span["bytes"] = os.path.getsize(output_path)
+        post_process_output(output_path, blood_logger)
+        mode = " (streaming)" if streaming else ""
+        blood_logger.info(f"Second Type of file processed{mode}: {file_name} -> {output_path}")
         return True
     except Exception as e:
         blood_logger.error(f"Error processing BP file {file_name}: {e}")
         return False
 
-def main():
-    record_wb, record_ws, processed_files = load_or_create_record(record_process)
+FILE_PROCESSORS = {
+    "serum": (process_serum_file, serum_logger),
+    "bp": (process_bp_file, blood_logger),
+}
+
+def classify_file(file_name):
+    if file_name.startswith("F") and file_name.endswith(".csv"):
+        return "serum"
+    if file_name.endswith(".csv") and "NZL" in file_name:
+        return "bp"
+    return None
+
+# --- Incremental scan: only new or changed inputs that have finished being written ---
+# file_names restricts the scan to the files an event-driven scheduler reported.
+def find_new_files(ledger, scan_index, file_names=None):
+    jobs = []
+    with metrics.span("scan") as span:
+        candidates = scan_index.scan(raw_file_source, classify_file, lambda file_name: file_name in ledger, file_names)
+        span["files"] = len(candidates)
+    for candidate in candidates:
+        if candidate.reason == "modified":
+            FILE_PROCESSORS[candidate.kind][1].info(f"Input changed since it was processed, reprocessing: {candidate.file_name}")
+        jobs.append((candidate.kind, candidate.file_name, candidate.path))
+    if scan_index.waiting:
+        blood_logger.info(f"Waiting for {len(scan_index.waiting)} file(s) still being written: {', '.join(sorted(scan_index.waiting))}")
+    return jobs
+
+def process_files_serial(jobs, ledger, scan_index, copy_queue):
     new_files_processed = 0
-    for file_name in os.listdir(raw_file_source):
-        csv_path = os.path.join(raw_file_source, file_name)
-        if file_name.startswith("F") and file_name.endswith(".csv") and file_name not in processed_files:
-            if process_serum_file(file_name, csv_path):
-                update_record(file_name, record_ws, record_wb, record_process)
-                new_files_processed += 1
-        elif file_name.endswith(".csv") and "NZL" in file_name and file_name not in processed_files:
-            if process_bp_file(file_name, csv_path):
-                update_record(file_name, record_ws, record_wb, record_process)
+    for kind, file_name, csv_path in jobs:
+        process_file, logger = FILE_PROCESSORS[kind]
+        with metrics.span("file", file=file_name, kind=kind) as span:
+            span["ok"] = process_file(file_name, csv_path)
+        if span["ok"]:
+            update_record(kind, file_name, ledger, scan_index, copy_queue)
+            new_files_processed += 1
+        elif span["ok"] is None:
+            scan_index.mark_rejected(file_name)
+    return new_files_processed
+
+# --- Process pool workers: log records are buffered and handed back to the parent ---
+class RecordBufferHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        # Flatten the message so the record pickles cleanly back to the parent
+        record.msg = self.format(record) if record.exc_info else record.getMessage()
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        self.records.append(record)
+
+worker_buffer = None
+
+def init_worker():
+    global worker_buffer, labeller
+    # A forked worker inherits the parent's labeller; outputs are labelled by the parent only
+    labeller = None
+    worker_buffer = RecordBufferHandler()
+    for worker_logger in (blood_logger, serum_logger):
+        for handler in list(worker_logger.handlers):
+            worker_logger.removeHandler(handler)
+            handler.close()
+        worker_logger.addHandler(worker_buffer)
+
+def run_file_job(kind, file_name, csv_path):
+    worker_buffer.records = []
+    metrics.records = []
+    process_file, logger = FILE_PROCESSORS[kind]
+    with metrics.span("file", file=file_name, kind=kind) as span:
+        try:
+            span["ok"] = process_file(file_name, csv_path)
+        except Exception as e:
+            logger.error(f"Unhandled error processing {file_name}: {e}")
+            span["ok"] = False
+    return span["ok"], worker_buffer.records, metrics.records
+
+def process_files_parallel(jobs, ledger, scan_index, copy_queue, workers):
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    new_files_processed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = {
+            pool.submit(run_file_job, kind, file_name, csv_path): (kind, file_name)
+            for kind, file_name, csv_path in jobs
+        }
+        for future in as_completed(futures):
+            kind, file_name = futures[future]
+            logger = FILE_PROCESSORS[kind][1]
+            try:
+                ok, records, spans = future.result()
+            except Exception as e:
+                logger.error(f"Worker failed while processing {file_name}: {e}")
+                continue
+            for record in records:
+                logger.handle(record)
+            metrics.records.extend(spans)
+            if ok:
+                post_process_output(output_path_for(kind, file_name), logger)
+                update_record(kind, file_name, ledger, scan_index, copy_queue)
                 new_files_processed += 1
-    if new_files_processed == 0:
-        blood_logger.info("Nothing new to process.")
+            elif ok is None:
+                scan_index.mark_rejected(file_name)
+    return new_files_processed
+
+# Returns the number of files processed plus those still being written: either means inputs are
+# arriving, so the scheduler's adaptive interval stays at its minimum
+def main(file_names=None):
+    global labeller
+    ledger = load_or_create_record(record_ledger, record_process)
+    scan_index = ScanIndex(scan_index_path, input_stable_seconds, input_hash_check)
+    copy_queue = open_copy_queue()
+    new_files_processed = 0
+    waiting = 0
+    try:
+        jobs = find_new_files(ledger, scan_index, file_names)
+        waiting = len(scan_index.waiting)
+        if jobs:
+            # The label session (and its thread) is only started once there is something to label
+            labeller = Labeller(label_backend, run_async=label_async, metrics=metrics)
+            if process_workers > 1 and len(jobs) > 1:
+                new_files_processed = process_files_parallel(
+                    jobs, ledger, scan_index, copy_queue, min(process_workers, len(jobs)))
+            else:
+                new_files_processed = process_files_serial(jobs, ledger, scan_index, copy_queue)
+        if new_files_processed == 0 and not waiting:
+            blood_logger.info("Nothing new to process.")
+        elif new_files_processed and record_export_xlsx:
+            export_record(ledger, record_process)
+    finally:
+        if labeller is not None:
+            labeller.close()
+            labeller = None
+        if any(record["stage"] == "file" for record in metrics.records):
+            metrics.log_summary(blood_logger)
+        metrics.flush(blood_logger)
+        if copy_queue is not None:
+            copy_queue.close()
+        scan_index.close()
+        ledger.close()
+    return new_files_processed + waiting
+
+# Optional arguments: raw file names to check instead of scanning the whole folder.
+# Also called directly by the scheduler's persistent worker (task_worker.py).
+def cli(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    return main([os.path.basename(arg) for arg in argv] or None)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()
\ No newline at end of file
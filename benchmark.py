@@ -0,0 +1,551 @@
+import os
+import csv
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import date, datetime, timedelta
+
+# PythonTask sets up its Master.log handler on import, so make sure logs/ exists first
+script_dir = os.path.dirname(os.path.abspath(__file__))
+os.makedirs(os.path.join(script_dir, 'logs'), exist_ok=True)
+
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Alignment, Font, PatternFill, Border, Side, Protection
+from openpyxl.worksheet.datavalidation import DataValidation
+from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.worksheet.formula import ArrayFormula
+import PythonTask
+import csv_schemas
+from ledger import ProcessedLedger
+from scan_index import ScanIndex
+from sync_manifest import SyncManifest
+from labelling import NoOpLabelBackend
+from sheet_layouts import SERUM_TOTAL_FORMULA, SERUM_LAYOUT, BP_LAYOUT
+
+# --- SYNTHETIC INPUT GENERATORS ---
+SERUM_HEADER = ["Sample Name", "Operator", "Collection Date", "Donor ID", "Weight",
+                "Litres", "Total Weight", "Volume", "Adjusted Volume"]
+BP_HEADER = ["Bag Number", "Product", "Batch", "Donor ID", "Gross Weight", "Net Weight",
+             "Volume Recorded", "Total Gross Weight", "Total Net Weight", "Total Volume",
+             "Decision", "Litres Rejected", "Litres Accepted", "SFF Net Weight", "SFF Litres"]
+
+def generate_serum_csv(path, rows, seed=0):
+    rng = random.Random(seed)
+    start = date(2024, 1, 1)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(SERUM_HEADER)
+        for i in range(rows):
+            weight = round(rng.uniform(0.2, 0.9), 3)
+            writer.writerow([
+                f"SER-{i:07d}", rng.choice(["AB", "CD", "EF", "GH"]),
+                (start + timedelta(days=i // 500)).isoformat(), 100000 + i // 4,
+                weight, round(weight * 1.04, 2), round(weight * 4, 3),
+                round(rng.uniform(1, 5), 2), round(rng.uniform(1, 5), 2),
+            ])
+    return path
+
+def generate_bp_csv(path, rows, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(BP_HEADER)
+        for i in range(rows):
+            gross = round(rng.uniform(0.25, 0.32), 3)
+            net = round(gross - 0.03, 3)
+            writer.writerow([
+                f"NZL{i:09d}", rng.choice(["FFP", "CPD", "PLS"]), f"B{i // 200:05d}",
+                200000 + i, gross, net, round(net / 1.026, 2),
+                "", "", "", "", "", "", "", "",
+            ])
+    return path
+
+GENERATORS = {
+    "serum": (generate_serum_csv, "F_bench.csv"),
+    "bp": (generate_bp_csv, "BENCH_NZL.csv"),
+}
+
+# --- REFERENCE FORMATTERS: the per-cell format functions the style plan replaced ---
+def legacy_format_serum_excel(ws):
+    ws["E1"] = "Weight (kg)"
+    ws["G1"] = "Total Weight (kg)"
+    ws["J1"] = "Total Litres Processed"
+    ws["J2"] = ArrayFormula("J2", SERUM_TOTAL_FORMULA)
+    for col in ws.columns:
+        for cell in col:
+            col_letter = cell.column_letter
+            if col_letter == 'D':
+                cell.number_format = "0"
+            elif col_letter in ['E', 'G']:
+                cell.number_format = "0.000"
+            elif col_letter in ['F', 'H', 'I']:
+                cell.number_format = "0.00"
+            else:
+                cell.number_format = "0.00"
+            cell.alignment = Alignment(horizontal="left")
+    for col in ['B', 'C']:
+        ws.column_dimensions[col].auto_size = True
+    ws.column_dimensions['A'].width = 28
+    ws.column_dimensions['E'].width = 8
+    ws.column_dimensions['G'].width = 12
+    ws.column_dimensions['H'].width = 14
+    ws.column_dimensions['I'].width = 14
+    ws.column_dimensions['J'].width = 11
+    header_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
+    border = Border(bottom=Side(style='thin'), right=Side(style='thin'), left=Side(style='thin'), top=Side(style='thin'))
+    for cell in ws[1]:
+        cell.font = Font(bold=True)
+        cell.fill = header_fill
+        cell.border = border
+        cell.alignment = Alignment(wrap_text=True)
+    ws.protection.sheet = True
+    ws.protection.set_password("password")
+    ws.protection.enable_selection = 'UnlockedCells'
+
+def legacy_format_bp_excel(ws):
+    ws.insert_cols(7)
+    ws['G1'] = "SFF Net Weight (kg)"
+    for row in ws.iter_rows(min_row=2, min_col=7, max_col=7):
+        for cell in row:
+            cell.protection = Protection(locked=False)
+    red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
+    formula = 'AND(P2<>"", ABS(P2 - SUM(F2:F1087)) > 0.2)'
+    rule = FormulaRule(formula=[formula], fill=red_fill)
+    ws.conditional_formatting.add('P2', rule)
+    highlight_fill = PatternFill(start_color="EC4F28", end_color="EC4F28", fill_type="solid")
+    rule2 = FormulaRule(formula=['AND(G2<>"", M2="Accept")'], fill=highlight_fill)
+    ws.conditional_formatting.add(f'G2:G{ws.max_row}', rule2)
+    ws.insert_cols(9)
+    ws['I1'] = "Volume (L)"
+    for row in range(2, ws.max_row + 1):
+        formula = f'=IF(G{row}="", H{row}, G{row}*0.959)'
+        ws[f'I{row}'] = formula
+    for col in ws.columns:
+        for cell in col:
+            cell.alignment = Alignment(horizontal='left')
+    for col_letter in ['D']:
+        for cell in ws[col_letter]:
+            cell.number_format = '0'
+    for col_letter in ['E', 'F', 'G', 'J', 'K']:
+        for cell in ws[col_letter]:
+            cell.number_format = '0.000'
+    for col_letter in ['H', 'I', 'L', 'N', 'O', 'Q']:
+        for cell in ws[col_letter]:
+            cell.number_format = '0.00'
+    ws['E1'] = "Gross Weight (kg)"
+    ws['F1'] = "Net Weight (kg)"
+    ws['G1'] = "SFF Net Weight (kg)"
+    ws['H1'] = "Volume Recorded (L)"
+    ws['I1'] = "Volume (L)"
+    ws['J1'] = "Total Gross Weight (kg)"
+    ws['K1'] = "Total Net Weight (kg)"
+    ws['L1'] = "Total Volume (L)"
+    ws['M1'] = "Accept / Reject"
+    ws['N1'] = "Total Litres Rejected"
+    ws['O1'] = "Total Litres Accepted"
+    ws['P1'] = "Total SFF Net Weight (kg)"
+    ws['Q1'] = "SFF Litres"
+    ws['N2'] = '=SUMIF(M:M, "Reject", I:I)'
+    ws['O2'] = '=IF(ISBLANK(P2), SUMIF(M2:M1048576, "Accept", I2:I1048576), Q2-N2)'
+    ws['Q2'] = "=P2*0.959"
+    dv = DataValidation(type="list", formula1='"Accept,Reject"', showDropDown=False, allowBlank=False,
+                        showErrorMessage=True, errorTitle="Invalid Entry",
+                        error="Please select either Accept or Reject from the dropdown list")
+    ws.add_data_validation(dv)
+    dv.add("M2:M1048")
+    yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+    ws['O2'].fill = yellow_fill
+    for cell in ws['K']:
+        cell.fill = yellow_fill
+    header_fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
+    bold_font = Font(bold=True)
+    thin_border = Border(bottom=Side(style='thin'), right=Side(style='thin'), left=Side(style='thin'), top=Side(style='thin'))
+    for cell in ws[1]:
+        cell.font = bold_font
+        cell.fill = header_fill
+        cell.border = thin_border
+        cell.alignment = Alignment(wrap_text=True)
+    ws.row_dimensions[1].height = 30
+    column_widths = {
+        'A': 29, 'B': 23, 'C': 10.5, 'D': 9, 'E': 12, 'F': 11, 'G': 12,
+        'H': 13, 'I': 12, 'J': 12, 'K': 12, 'L': 11, 'M': 11, 'N': 11, 'O': 13, 'P': 13
+    }
+    for col, width in column_widths.items():
+        ws.column_dimensions[col].width = width
+    for row in ws.iter_rows():
+        for cell in row:
+            cell.protection = Protection(locked=True)
+    for row in ws.iter_rows(min_row=2, min_col=13, max_col=13):
+        for cell in row:
+            cell.protection = Protection(locked=False)
+    ws['P2'].protection = Protection(locked=False)
+    for row in ws.iter_rows(min_row=2, min_col=7, max_col=7):
+        for cell in row:
+            cell.protection = Protection(locked=False)
+    ws.protection.sheet = True
+    ws.protection.set_password("password")
+    ws.protection.enable_selection = 'UnlockedCells'
+
+def legacy_build_workbook(df):
+    wb = Workbook()
+    ws = wb.active
+    for r in dataframe_to_rows(df, index=False, header=True):
+        ws.append(r)
+    return wb, ws
+
+BUILDERS = {
+    "serum": (PythonTask.build_serum_workbook, legacy_format_serum_excel, SERUM_LAYOUT),
+    "bp": (PythonTask.build_bp_workbook, legacy_format_bp_excel, BP_LAYOUT),
+}
+
+# --- PER-FILE PIPELINE COMPARISON (Excel labelling excluded: it needs a desktop session) ---
+def run_round_trip(kind, csv_path, output_path):
+    # Original pipeline: save raw data, reload, format, save again
+    format_excel = BUILDERS[kind][1]
+    df = pd.read_csv(csv_path)
+    wb, ws = legacy_build_workbook(df)
+    wb.save(output_path)
+    wb = load_workbook(output_path)
+    format_excel(wb.active)
+    wb.save(output_path)
+
+def run_single_pass(kind, csv_path, output_path):
+    build, format_excel, layout = BUILDERS[kind]
+    df = PythonTask.read_csv_file(kind, csv_path)
+    wb, cached_values = build(df)
+    PythonTask.save_workbook(wb, output_path, layout, cached_values)
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def compare_pipelines(rows, repeat, work_dir):
+    results = []
+    for kind, (generate, file_name) in GENERATORS.items():
+        csv_path = generate(os.path.join(work_dir, file_name), rows)
+        output_path = os.path.join(work_dir, file_name.replace(".csv", ".xlsx"))
+        round_trip = best_of(repeat, run_round_trip, kind, csv_path, output_path)
+        single_pass = best_of(repeat, run_single_pass, kind, csv_path, output_path)
+        results.append((kind, rows, round_trip, single_pass))
+    return results
+
+# --- FORMATTING COMPARISON: per-cell format functions vs the compiled style plan (no save) ---
+def run_legacy_format(kind, df):
+    wb, ws = legacy_build_workbook(df)
+    BUILDERS[kind][1](ws)
+
+def run_style_plan(kind, df):
+    BUILDERS[kind][0](df)
+
+def compare_formatting(row_counts, repeat, work_dir):
+    results = []
+    for rows in row_counts:
+        for kind, (generate, file_name) in GENERATORS.items():
+            df = pd.read_csv(generate(os.path.join(work_dir, file_name), rows))
+            legacy = best_of(repeat, run_legacy_format, kind, df)
+            plan = best_of(repeat, run_style_plan, kind, df)
+            results.append((kind, rows, legacy, plan))
+    return results
+
+# --- PARSE COMPARISON: inferred dtypes vs declared schema (C parser, then pyarrow if installed) ---
+def compare_parsing(row_counts, repeat, work_dir):
+    results = []
+    for rows in row_counts:
+        for kind, (generate, file_name) in GENERATORS.items():
+            csv_path = generate(os.path.join(work_dir, file_name), rows)
+            schema = PythonTask.CSV_SCHEMAS[kind]
+            inferred = best_of(repeat, pd.read_csv, csv_path)
+            declared = best_of(repeat, csv_schemas.read_csv, csv_path, schema, False)
+            arrow = None
+            if csv_schemas.PYARROW_AVAILABLE:
+                arrow = best_of(repeat, csv_schemas.read_csv, csv_path, schema, True)
+            results.append((kind, rows, inferred, declared, arrow))
+    return results
+
+# --- STAGE TIMINGS: each step of the per-file pipeline on its own ---
+def time_stages(row_counts, repeat, work_dir):
+    results = []
+    for rows in row_counts:
+        for kind, (generate, file_name) in GENERATORS.items():
+            csv_path = generate(os.path.join(work_dir, file_name), rows)
+            output_path = os.path.join(work_dir, file_name.replace(".csv", ".xlsx"))
+            build, format_excel, layout = BUILDERS[kind]
+            df = PythonTask.read_csv_file(kind, csv_path)
+            wb, cached_values = build(df)
+            results.append({
+                "kind": kind,
+                "rows": rows,
+                "csv_bytes": os.path.getsize(csv_path),
+                "parse": best_of(repeat, PythonTask.read_csv_file, kind, csv_path),
+                "dataframe_to_rows": best_of(repeat, lambda: list(dataframe_to_rows(df, index=False, header=True))),
+                "format_funcs": best_of(repeat, run_legacy_format, kind, df),
+                "style_plan": best_of(repeat, run_style_plan, kind, df),
+                "save": best_of(repeat, PythonTask.save_workbook, wb, output_path, layout, cached_values),
+                "xlsx_bytes": os.path.getsize(output_path),
+            })
+    return results
+
+# --- LEDGER: durable per-file updates, membership checks and reopening a large ledger ---
+def time_ledger(entries, work_dir):
+    db_path = os.path.join(work_dir, "ledger_bench.db")
+    names = [f"F{i:07d}.csv" for i in range(entries)]
+    ledger = ProcessedLedger(db_path)
+    start = time.perf_counter()
+    for name in names:
+        ledger.add(name)
+    add_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    found = sum(1 for name in names if name in ledger)
+    lookup_seconds = time.perf_counter() - start
+    ledger.close()
+    start = time.perf_counter()
+    ProcessedLedger(db_path).close()
+    open_seconds = time.perf_counter() - start
+    return {
+        "entries": entries,
+        "add_per_file_ms": add_seconds / entries * 1000,
+        "lookup_per_file_us": lookup_seconds / max(found, 1) * 1e6,
+        "open": open_seconds,
+    }
+
+# --- COPY: robocopy.copy_missing_or_updated_files over a synthetic tree ---
+def generate_tree(root, files, files_per_dir=1000, size=2048):
+    payload = os.urandom(size)
+    for i in range(files):
+        folder = os.path.join(root, f"batch_{i // files_per_dir:04d}")
+        if i % files_per_dir == 0:
+            os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"F{i:07d}.xlsx"), 'wb') as f:
+            f.write(payload)
+    return root
+
+def time_copy(file_counts, worker_counts, repeat, work_dir):
+    import robocopy
+    results = []
+    # One log line per copied file would dominate the timing (and flood Master.log)
+    level = robocopy.logger.level
+    robocopy.logger.setLevel(logging.WARNING)
+    robocopy.metrics.enabled = False
+    try:
+        for files in file_counts:
+            source = generate_tree(os.path.join(work_dir, f"copy_src_{files}"), files)
+            for workers in worker_counts:
+                destination = os.path.join(work_dir, f"copy_dest_{files}_{workers}")
+                start = time.perf_counter()
+                copied = robocopy.copy_missing_or_updated_files(source, destination, workers)
+                cold = time.perf_counter() - start
+                # Nothing changed since the first pass: this is the cost of every idle run
+                warm = best_of(repeat, robocopy.copy_missing_or_updated_files, source, destination, workers)
+                # The same idle run with the sync manifest, recorded by one full pass beforehand
+                manifest = SyncManifest(os.path.join(work_dir, f"copy_manifest_{files}_{workers}.db"))
+                try:
+                    robocopy.copy_missing_or_updated_files(source, destination, workers, manifest, True)
+                    manifest_warm = best_of(repeat, robocopy.copy_missing_or_updated_files,
+                                            source, destination, workers, manifest)
+                finally:
+                    manifest.close()
+                results.append({"files": files, "workers": workers, "copied": copied, "cold": cold, "warm": warm,
+                                "manifest_warm": manifest_warm})
+                shutil.rmtree(destination, ignore_errors=True)
+            shutil.rmtree(source, ignore_errors=True)
+    finally:
+        robocopy.logger.setLevel(level)
+    return results
+
+# One large file: shutil.copy2 against robocopy's atomic copy, with and without checksum verification
+def time_large_copy(size_mb, repeat, work_dir):
+    import robocopy
+    source = os.path.join(work_dir, "large_src.bin")
+    with open(source, 'wb') as f:
+        block = random.Random(7).randbytes(1024 * 1024)
+        for _ in range(size_mb):
+            f.write(block)
+    destination = os.path.join(work_dir, "large_dest.bin")
+    try:
+        return {
+            "size_mb": size_mb,
+            "copy2": best_of(repeat, shutil.copy2, source, destination),
+            "atomic": best_of(repeat, robocopy.atomic_copy, source, destination),
+            "atomic_verify": best_of(repeat, robocopy.atomic_copy, source, destination, True),
+        }
+    finally:
+        for path in (source, destination):
+            if os.path.exists(path):
+                os.remove(path)
+
+# --- SCHEDULER TICK: fixed cost of one idle run (interpreter start, imports, input scan) ---
+def run_python(code):
+    subprocess.run([sys.executable, "-c", code], cwd=script_dir, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def time_scheduler_tick(raw_files, repeat, work_dir):
+    raw_dir = os.path.join(work_dir, "tick_raw")
+    os.makedirs(raw_dir, exist_ok=True)
+    for i in range(raw_files):
+        open(os.path.join(raw_dir, f"F{i:07d}.csv"), 'w').close()
+    index = ScanIndex(os.path.join(work_dir, "tick_index.db"), stable_seconds=0)
+    index.scan(raw_dir, PythonTask.classify_file, lambda name: True)
+    try:
+        idle_scan = best_of(repeat, index.scan, raw_dir, PythonTask.classify_file, lambda name: True)
+    finally:
+        index.close()
+    return {
+        "raw_files": raw_files,
+        "interpreter_start": best_of(repeat, run_python, "pass"),
+        "import_PythonTask": best_of(repeat, run_python, "import PythonTask"),
+        "import_robocopy": best_of(repeat, run_python, "import robocopy"),
+        "idle_scan": idle_scan,
+    }
+
+# --- STARTUP BUDGET: import cost of each entry point, from python -X importtime ---
+# A run that finds nothing new must not load the libraries only file conversion needs.
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "pyarrow", "xlwings")
+STARTUP_SCRIPTS = ("PythonTask", "robocopy")
+
+# Returns {module: cumulative import seconds} for everything importing module pulls in
+def import_profile(module):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=script_dir,
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            modules[fields[2].strip()] = int(fields[1]) / 1e6
+    return modules
+
+def check_startup(budget_ms, repeat):
+    results = {}
+    for script in STARTUP_SCRIPTS:
+        profiles = [import_profile(script) for _ in range(repeat)]
+        seconds = min(profile[script] for profile in profiles)
+        heavy = sorted(name for name in profiles[0] if name in HEAVY_MODULES)
+        results[script] = {"import": seconds, "heavy_imports": heavy,
+                           "ok": seconds * 1000 <= budget_ms and not heavy}
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=script_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def write_results(path, args, results):
+    import openpyxl
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+        "openpyxl": openpyxl.__version__,
+        "pyarrow": csv_schemas.PYARROW_AVAILABLE,
+        "args": vars(args),
+        "results": results,
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+SUITES = ["pipeline", "format", "parse", "stages", "ledger", "copy", "tick", "startup"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CSV -> xlsx processing pipeline.")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--format-rows", type=int, nargs="*", default=[10000, 100000])
+    parser.add_argument("--stage-rows", type=int, nargs="*", default=[1000, 10000])
+    parser.add_argument("--ledger-entries", type=int, default=2000)
+    parser.add_argument("--copy-files", type=int, nargs="*", default=[10000, 100000])
+    parser.add_argument("--copy-workers", type=int, nargs="*", default=[1, 8])
+    parser.add_argument("--copy-large-mb", type=int, default=256)
+    parser.add_argument("--tick-files", type=int, default=10000)
+    parser.add_argument("--startup-budget-ms", type=float, default=250)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="*", choices=SUITES, default=SUITES)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+    # Excel labelling needs a desktop session; the no-op backend keeps the suite headless
+    PythonTask.label_backend = NoOpLabelBackend()
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="watchdog_bench_")
+    try:
+        if "pipeline" in args.only:
+            print(f"{'file':<6} {'rows':>8} {'round trip (s)':>15} {'single pass (s)':>16} {'speedup':>8}")
+            results["pipeline"] = []
+            for kind, rows, round_trip, single_pass in compare_pipelines(args.rows, args.repeat, work_dir):
+                print(f"{kind:<6} {rows:>8} {round_trip:>15.3f} {single_pass:>16.3f} {round_trip / single_pass:>7.2f}x")
+                results["pipeline"].append({"kind": kind, "rows": rows, "round_trip": round_trip, "single_pass": single_pass})
+            print()
+        if "format" in args.only:
+            print(f"{'file':<6} {'rows':>8} {'format funcs (s)':>17} {'style plan (s)':>15} {'speedup':>8}")
+            results["format"] = []
+            for kind, rows, legacy, plan in compare_formatting(args.format_rows, args.repeat, work_dir):
+                print(f"{kind:<6} {rows:>8} {legacy:>17.3f} {plan:>15.3f} {legacy / plan:>7.2f}x")
+                results["format"].append({"kind": kind, "rows": rows, "format_funcs": legacy, "style_plan": plan})
+            print()
+        if "parse" in args.only:
+            print(f"{'file':<6} {'rows':>8} {'inferred (s)':>13} {'schema (s)':>11} {'pyarrow (s)':>12}")
+            results["parse"] = []
+            for kind, rows, inferred, declared, arrow in compare_parsing(args.format_rows, args.repeat, work_dir):
+                arrow_text = f"{arrow:>12.3f}" if arrow is not None else f"{'n/a':>12}"
+                print(f"{kind:<6} {rows:>8} {inferred:>13.3f} {declared:>11.3f} {arrow_text}")
+                results["parse"].append({"kind": kind, "rows": rows, "inferred": inferred, "schema": declared, "pyarrow": arrow})
+            print()
+        if "stages" in args.only:
+            stages = ["parse", "dataframe_to_rows", "format_funcs", "style_plan", "save"]
+            print(f"{'file':<6} {'rows':>8} " + " ".join(f"{stage + ' (s)':>22}" for stage in stages))
+            results["stages"] = time_stages(args.stage_rows, args.repeat, work_dir)
+            for row in results["stages"]:
+                print(f"{row['kind']:<6} {row['rows']:>8} " + " ".join(f"{row[stage]:>22.3f}" for stage in stages))
+            print()
+        if "ledger" in args.only:
+            results["ledger"] = time_ledger(args.ledger_entries, work_dir)
+            ledger_result = results["ledger"]
+            print(f"ledger ({ledger_result['entries']} entries): add {ledger_result['add_per_file_ms']:.3f} ms/file, "
+                  f"lookup {ledger_result['lookup_per_file_us']:.3f} us/file, open {ledger_result['open']:.3f} s")
+            print()
+        if "copy" in args.only:
+            print(f"{'files':>8} {'workers':>8} {'copied':>8} {'cold copy (s)':>14} {'idle sweep (s)':>15} "
+                  f"{'with manifest (s)':>18}")
+            results["copy"] = time_copy(args.copy_files, args.copy_workers, args.repeat, work_dir)
+            for row in results["copy"]:
+                print(f"{row['files']:>8} {row['workers']:>8} {row['copied']:>8} {row['cold']:>14.3f} {row['warm']:>15.3f} "
+                      f"{row['manifest_warm']:>18.3f}")
+            results["copy_large"] = time_large_copy(args.copy_large_mb, args.repeat, work_dir)
+            large = results["copy_large"]
+            print(f"{large['size_mb']} MB file: copy2 {large['copy2']:.3f} s, atomic {large['atomic']:.3f} s, "
+                  f"atomic + verify {large['atomic_verify']:.3f} s")
+            print()
+        if "tick" in args.only:
+            results["tick"] = time_scheduler_tick(args.tick_files, args.repeat, work_dir)
+            print(", ".join(f"{name} {value:.3f} s" for name, value in results["tick"].items() if name != "raw_files")
+                  + f" ({results['tick']['raw_files']} raw files)")
+            print()
+        if "startup" in args.only:
+            results["startup"] = check_startup(args.startup_budget_ms, args.repeat)
+            for script, startup in results["startup"].items():
+                heavy = f", imports {', '.join(startup['heavy_imports'])}" if startup["heavy_imports"] else ""
+                print(f"import {script}: {startup['import'] * 1000:.0f} ms (budget {args.startup_budget_ms:g} ms{heavy}) "
+                      f"{'ok' if startup['ok'] else 'OVER BUDGET'}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    write_results(args.output, args, results)
+    print(f"Results written to {args.output}")
+    # Non-zero exit when an entry point is over its startup budget, so the check can gate a build
+    if not all(startup["ok"] for startup in results.get("startup", {}).values()):
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
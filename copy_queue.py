@@ -0,0 +1,49 @@
+import os
+import time
+import sqlite3
+
+# --- COPY HAND-OFF QUEUE ---
+# PythonTask.py enqueues every output it finishes; robocopy.py copies exactly those files on its
+# next run instead of discovering them by walking the whole tree. A path enqueued again while it
+# is being copied keeps its entry (the enqueue time no longer matches), so a newer version is
+# never dropped. The full sweep still runs now and then to reconcile anything the queue missed.
+class CopyQueue:
+    def __init__(self, db_path):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # A lost entry is picked up by the next reconciliation sweep
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS copy_queue (path TEXT PRIMARY KEY, enqueued REAL NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS copy_queue_meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def enqueue(self, paths):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO copy_queue (path, enqueued) VALUES (?, ?)",
+                [(os.path.abspath(path), now) for path in paths],
+            )
+
+    # Returns [(path, enqueued)] oldest first
+    def pending(self):
+        return self.conn.execute("SELECT path, enqueued FROM copy_queue ORDER BY enqueued").fetchall()
+
+    def done(self, entries):
+        with self.conn:
+            self.conn.executemany("DELETE FROM copy_queue WHERE path = ? AND enqueued = ?", entries)
+
+    def reconcile_due(self, interval_minutes):
+        row = self.conn.execute("SELECT value FROM copy_queue_meta WHERE key = 'last_reconcile'").fetchone()
+        return time.time() - float(row[0] if row else 0) >= interval_minutes * 60
+
+    def mark_reconciled(self):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO copy_queue_meta (key, value) VALUES ('last_reconcile', ?)", (str(time.time()),))
+
+    def close(self):
+        self.conn.close()
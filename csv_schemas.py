@@ -0,0 +1,85 @@
+import csv
+import importlib.util
+
+# --- CSV SCHEMAS ---
+# One dtype per CSV column, in file order. "headers" is optional; when given, the header row
+# must match it exactly. Overridden per file type by the "csv_schemas" entry in config.json.
+DEFAULT_SCHEMAS = {
+    "serum": {
+        "dtypes": ["str", "str", "str", "Int64", "float64", "float64", "float64", "float64", "float64"],
+        "headers": None,
+    },
+    "bp": {
+        "dtypes": ["str", "str", "str", "Int64", "float64", "float64", "float64", "float64", "float64",
+                   "float64", "str", "float64", "float64", "float64", "float64"],
+        "headers": None,
+    },
+}
+
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# pandas is only imported once a CSV is actually parsed, so a run with nothing new never loads it
+
+def load_schemas(overrides=None):
+    schemas = {kind: dict(schema) for kind, schema in DEFAULT_SCHEMAS.items()}
+    for kind, schema in (overrides or {}).items():
+        schemas.setdefault(kind, {"dtypes": [], "headers": None}).update(schema)
+    return schemas
+
+class SchemaError(ValueError):
+    pass
+
+def read_header(csv_path):
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        return next(csv.reader(f), [])
+
+# --- Cheap header check: runs on the first line only, before any parsing or workbook work ---
+# Blank trailing columns (a trailing comma on every line) are tolerated and dropped by usecols.
+def check_header(header, schema):
+    expected = len(schema["dtypes"])
+    if len(header) < expected:
+        raise SchemaError(f"expected {expected} columns, found {len(header)}")
+    extra = [name for name in header[expected:] if name.strip()]
+    if extra:
+        raise SchemaError(f"expected {expected} columns, found unexpected extra columns {extra}")
+    if schema.get("headers") and header[:expected] != list(schema["headers"]):
+        raise SchemaError(f"header {header[:expected]} does not match {list(schema['headers'])}")
+    return header[:expected]
+
+# The C parser is slow on nullable integers, so those columns are parsed as float64 and checked
+# for whole numbers afterwards. Either way they end up as Python ints with None for blanks,
+# because openpyxl cannot write pd.NA.
+def parse_dtypes(dtypes):
+    return {index: "float64" if dtype == "Int64" else dtype for index, dtype in enumerate(dtypes)}
+
+def writable(df, dtypes):
+    for index, dtype in enumerate(dtypes):
+        if dtype != "Int64" or index >= df.shape[1]:
+            continue
+        column = df.iloc[:, index]
+        present = column.notna()
+        if column.dtype.kind == "f" and (column[present] % 1 != 0).any():
+            raise SchemaError(f"column {df.columns[index]} has non-integer values")
+        values = column.astype("Int64").astype(object)
+        df.isetitem(index, values.where(present, None))
+    return df
+
+# The pyarrow engine only takes column names, so it is used when the header names are unique;
+# otherwise the C parser selects the columns by position.
+def read_csv(csv_path, schema, use_pyarrow=True):
+    import pandas as pd
+    dtypes = schema["dtypes"]
+    header = read_header(csv_path)
+    if use_pyarrow and PYARROW_AVAILABLE and len(set(header)) == len(header):
+        df = pd.read_csv(csv_path, engine="pyarrow", dtype=dict(zip(header, dtypes)))
+        return writable(df.iloc[:, :len(dtypes)], dtypes)
+    df = pd.read_csv(csv_path, usecols=list(range(len(dtypes))), dtype=parse_dtypes(dtypes))
+    return writable(df, dtypes)
+
+# The pyarrow engine cannot read in chunks, so streaming always uses the C parser
+def read_csv_chunks(csv_path, schema, chunk_rows):
+    import pandas as pd
+    dtypes = schema["dtypes"]
+    chunks = pd.read_csv(csv_path, usecols=list(range(len(dtypes))), dtype=parse_dtypes(dtypes), chunksize=chunk_rows)
+    for chunk in chunks:
+        yield writable(chunk, dtypes)
@@ -0,0 +1,80 @@
+import os
+import time
+import threading
+
+# --- FILESYSTEM EVENT BATCHING ---
+# Notifications arrive in bursts (one copy can raise several created/modified events), so each
+# path is only released once it has been quiet for its settle time. Everything that is ready
+# at the same moment is handed out as one batch.
+def normalize_dir(path):
+    return os.path.normcase(os.path.abspath(path))
+
+class EventBatcher:
+    def __init__(self, raw_dir, processed_dirs, raw_settle_seconds, processed_settle_seconds):
+        self.raw_dir = normalize_dir(raw_dir)
+        self.processed_dirs = sorted({normalize_dir(path) for path in processed_dirs})
+        self.settle_seconds = {"raw": raw_settle_seconds, "processed": processed_settle_seconds}
+        self.pending = {"raw": {}, "processed": {}}
+        self.lock = threading.Lock()
+
+    def categories(self, path):
+        path = normalize_dir(path)
+        found = []
+        if os.path.dirname(path) == self.raw_dir:
+            found.append("raw")
+        if any(path.startswith(processed_dir + os.sep) for processed_dir in self.processed_dirs):
+            found.append("processed")
+        return found
+
+    def record(self, path, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            for category in self.categories(path):
+                self.pending[category][path] = now
+
+    # Returns {"raw": [paths], "processed": [paths]} for paths that have settled
+    def pop_ready(self, now=None):
+        now = time.monotonic() if now is None else now
+        ready = {}
+        with self.lock:
+            for category, paths in self.pending.items():
+                settled = [path for path, seen in paths.items() if now - seen >= self.settle_seconds[category]]
+                for path in settled:
+                    del paths[path]
+                ready[category] = sorted(settled)
+        return ready
+
+    def clear(self):
+        with self.lock:
+            for paths in self.pending.values():
+                paths.clear()
+
+# --- Observer (watchdog library: inotify on Linux, ReadDirectoryChangesW on Windows) ---
+# Returns None when watchdog is not installed so the caller can fall back to polling.
+def start_observer(batcher, logger):
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        logger.warning("watchdog is not installed; event-driven mode unavailable")
+        return None
+
+    class BatchingHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.is_directory or event.event_type not in ("created", "modified", "moved", "closed"):
+                return
+            batcher.record(getattr(event, "dest_path", "") or event.src_path)
+
+    observer = Observer()
+    handler = BatchingHandler()
+    watched = set()
+    for path, recursive in [(batcher.raw_dir, False)] + [(path, True) for path in batcher.processed_dirs]:
+        if path in watched:
+            continue
+        if not os.path.isdir(path):
+            logger.warning(f"Watch directory missing: {path}")
+            continue
+        observer.schedule(handler, path, recursive=recursive)
+        watched.add(path)
+    observer.start()
+    return observer
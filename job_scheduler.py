@@ -0,0 +1,216 @@
+import time
+import threading
+from datetime import datetime, timedelta
+
+# --- JOB SCHEDULER ---
+# Each job has its own schedule: a fixed-rate interval (run times do not drift with run
+# duration), a cron expression, or "after" another job (started whenever that job finishes).
+# Jobs run on their own threads. What happens when a job comes due while it is still running
+# is its overlap policy: "skip" that run, "queue" one more run for when it finishes, or
+# "concurrent" to start another run alongside.
+OVERLAP_POLICIES = ("skip", "queue", "concurrent")
+
+class IntervalSchedule:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def first(self, now):
+        return now
+
+    # Slots stay anchored to the first run; slots missed while busy or asleep are not made up
+    def next(self, previous, now):
+        if previous + self.seconds > now:
+            return previous + self.seconds
+        return now + self.seconds - (now - previous) % self.seconds
+
+    def describe(self):
+        return f"every {self.seconds / 60:g} minutes"
+
+# Interval that follows the workload: back to min_seconds as soon as a run finds work, and
+# multiplied by factor (up to max_seconds) after every run that finds nothing
+class AdaptiveSchedule(IntervalSchedule):
+    def __init__(self, min_seconds, max_seconds, factor=2):
+        super().__init__(min_seconds)
+        self.min_seconds = min_seconds
+        self.max_seconds = max(min_seconds, max_seconds)
+        self.factor = factor
+        self.idle_runs = 0
+
+    # Returns the reason for the new interval
+    def adapt(self, found_work):
+        if found_work:
+            self.idle_runs = 0
+            self.seconds = self.min_seconds
+            return "new work found, polling at the minimum interval"
+        self.idle_runs += 1
+        self.seconds = min(self.max_seconds, self.seconds * self.factor)
+        if self.seconds == self.max_seconds:
+            return f"nothing new for {self.idle_runs} run(s), polling at the maximum interval"
+        return f"nothing new for {self.idle_runs} run(s), backing off"
+
+    def describe(self):
+        return f"adaptive, every {self.min_seconds / 60:g} to {self.max_seconds / 60:g} minutes"
+
+# Five fields: minute hour day-of-month month day-of-week (0 or 7 = Sunday), each "*", a
+# value, a range "a-b", a step "*/n" or "a-b/n", or a comma-separated list of those
+class CronSchedule:
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        self.expression = expression
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expression!r}")
+        fields = [self.parse_field(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def parse_field(field, low, high):
+        values = set()
+        for item in field.split(","):
+            value_range, _, step = item.partition("/")
+            if value_range == "*":
+                start, end = low, high
+            elif "-" in value_range:
+                start, end = (int(value) for value in value_range.split("-", 1))
+            else:
+                start = end = int(value_range)
+            if start < low or end > high or start > end:
+                raise ValueError(f"cron field {field!r} is outside {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    # Standard cron: when both day fields are restricted, either one matching is enough
+    def day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def first(self, now):
+        return self.next(now, now)
+
+    def next(self, previous, now):
+        moment = datetime.fromtimestamp(max(previous, now)).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment.year + 5
+        while moment.year <= limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self.day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"cron expression never matches: {self.expression!r}")
+
+    def describe(self):
+        return f"cron {self.expression}"
+
+class ScheduledJob:
+    def __init__(self, name, func, schedule=None, after=None, overlap="skip"):
+        if overlap not in OVERLAP_POLICIES:
+            raise ValueError(f"overlap for job {name} must be one of {', '.join(OVERLAP_POLICIES)}")
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.after = after
+        self.overlap = overlap
+        self.next_run = None
+        self.active = 0
+        self.queued = False
+
+class JobScheduler:
+    def __init__(self, jobs, logger):
+        self.jobs = jobs
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.threads = set()
+        self.stopping = False
+
+    def start(self, job, reason):
+        with self.lock:
+            if self.stopping:
+                return
+            if job.active and job.overlap == "skip":
+                self.logger.warning(f"Skipping {reason} run of {job.name}: previous run still in progress")
+                return
+            if job.active and job.overlap == "queue":
+                job.queued = True
+                return
+            job.active += 1
+            thread = threading.Thread(target=self.run_job, args=(job,), name=f"job-{job.name}")
+            self.threads.add(thread)
+        thread.start()
+
+    def run_job(self, job):
+        started = time.time()
+        try:
+            # True when the run found work, False when it found nothing, None when unknown
+            self.report(job, job.func(), started)
+        except Exception as e:
+            self.logger.error(f"Job {job.name} failed: {e}")
+        finally:
+            with self.lock:
+                job.active -= 1
+                rerun = job.queued and job.active == 0
+                if rerun:
+                    job.queued = False
+                self.threads.discard(threading.current_thread())
+            for follower in self.jobs:
+                if follower.after == job.name:
+                    self.start(follower, f"after {job.name}")
+            if rerun:
+                self.start(job, "queued")
+
+    # Work found by any job tightens every adaptive job; an idle run only backs off its own job
+    def report(self, job, found_work, started):
+        if found_work is None:
+            return
+        for target in (self.jobs if found_work else [job]):
+            schedule = target.schedule
+            if not isinstance(schedule, AdaptiveSchedule):
+                continue
+            previous = schedule.seconds
+            reason = schedule.adapt(found_work)
+            now = time.time()
+            if target is job:
+                # The next slot is re-anchored to the start of this run with the new interval
+                target.next_run = schedule.next(started, now)
+            elif schedule.seconds != previous:
+                target.next_run = min(target.next_run, now + schedule.seconds)
+            if schedule.seconds != previous:
+                self.logger.info(f"Job {target.name} interval {schedule.seconds / 60:g} minutes: {reason}")
+
+    # is_running() going False (SIGTERM) stops new runs; runs in progress are waited for
+    def run(self, is_running):
+        now = time.time()
+        for job in self.jobs:
+            if job.schedule is not None:
+                job.next_run = job.schedule.first(now)
+                self.logger.info(f"Job {job.name}: {job.schedule.describe()}, overlap {job.overlap}")
+            elif job.after:
+                self.logger.info(f"Job {job.name}: after {job.after}, overlap {job.overlap}")
+        while is_running():
+            now = time.time()
+            for job in self.jobs:
+                if job.next_run is not None and job.next_run <= now:
+                    # Set before starting, so a run that reports back quickly has the last word
+                    job.next_run = job.schedule.next(job.next_run, now)
+                    self.start(job, "scheduled")
+            upcoming = [job.next_run for job in self.jobs if job.next_run is not None]
+            # Short sleeps keep shutdown responsive
+            time.sleep(min([1.0] + [max(0.0, next_run - time.time()) for next_run in upcoming]))
+        with self.lock:
+            self.stopping = True
+            threads = list(self.threads)
+        if threads:
+            self.logger.info(f"Waiting for {len(threads)} running job(s) to finish...")
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,195 @@
+import uuid
+import queue
+import threading
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from process_tree import register_helper_pid, unregister_helper_pid
+
+# --- SENSITIVITY LABEL ---
+LABEL_ID = "f48041ff-f5de-4583-8841-e2a1851ee5d2"
+LABEL_NAME = "Confidential"
+SITE_ID = "771c9c47-7f24-44dc-958e-34f8713a8394t"
+ASSIGNMENT_METHOD = 2
+# MsoAssignmentMethod values as written to the MSIP_Label_*_Method document property
+ASSIGNMENT_METHOD_NAMES = {0: "Standard", 1: "Privileged", 2: "Auto"}
+
+# --- Label backend interface ---
+# prepare() runs on the in-memory workbook before its single save; label() runs on the saved
+# file. A backend only implements the stage it needs.
+class LabelBackend:
+    name = "none"
+
+    def prepare(self, wb):
+        pass
+
+    def label(self, output_path, logger):
+        pass
+
+    def label_batch(self, output_paths, logger_for):
+        for output_path in output_paths:
+            self.label(output_path, logger_for(output_path))
+
+    def close(self):
+        pass
+
+# --- No-op backend: records what would have been labelled (tests, Linux workers) ---
+class NoOpLabelBackend(LabelBackend):
+    name = "none"
+
+    def __init__(self):
+        self.labelled = []
+
+    def label(self, output_path, logger):
+        self.labelled.append(output_path)
+
+# --- Persistent Excel session: one Excel instance for the whole run instead of one per file ---
+class ExcelSessionLabelBackend(LabelBackend):
+    name = "excel"
+
+    def __init__(self):
+        self.app = None
+
+    def get_app(self):
+        if self.app is None:
+            import xlwings as xw
+            self.app = xw.App(visible=False, add_book=False)
+            # Excel is started by COM, not as our child: the scheduler needs its PID to stop it
+            # along with a timed-out run
+            register_helper_pid(self.app.pid)
+            self.app.display_alerts = False
+        return self.app
+
+    def label(self, output_path, logger):
+        try:
+            xl_book = self.get_app().books.open(output_path)
+        except Exception as e:
+            logger.error(f"Error applying sensitivity label to {output_path}: {e}")
+            # The Excel session may have died; start a fresh one for the next file
+            self.close()
+            return
+        try:
+            try:
+                label_info = xl_book.api.SensitivityLabel.CreateLabelInfo()
+                label_info.AssignmentMethod = ASSIGNMENT_METHOD
+                label_info.LabelId = LABEL_ID
+                label_info.LabelName = LABEL_NAME
+                label_info.SiteId = SITE_ID
+                xl_book.api.SensitivityLabel.SetLabel(label_info, label_info)
+            except Exception as e:
+                logger.warning(f"Failed to apply sensitivity label to {output_path}: {e}")
+            xl_book.save()
+        except Exception as e:
+            logger.error(f"Error applying sensitivity label to {output_path}: {e}")
+        finally:
+            try:
+                xl_book.close()
+            except Exception:
+                pass
+
+    def close(self):
+        if self.app is not None:
+            try:
+                pid = self.app.pid
+                self.app.quit()
+                unregister_helper_pid(pid)
+            except Exception:
+                pass
+            self.app = None
+
+# --- Headless backend: writes the MSIP label properties into docProps/custom.xml ---
+class DocPropsLabelBackend(LabelBackend):
+    name = "docprops"
+
+    def label_properties(self):
+        prefix = f"MSIP_Label_{LABEL_ID}_"
+        return {
+            prefix + "Enabled": "true",
+            prefix + "SetDate": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            prefix + "Method": ASSIGNMENT_METHOD_NAMES.get(ASSIGNMENT_METHOD, "Standard"),
+            prefix + "Name": LABEL_NAME,
+            prefix + "SiteId": SITE_ID,
+            prefix + "ActionId": str(uuid.uuid4()),
+            prefix + "ContentBits": "0",
+        }
+
+    def prepare(self, wb):
+        from openpyxl.packaging.custom import StringProperty
+        for name, value in self.label_properties().items():
+            wb.custom_doc_props.append(StringProperty(name=name, value=value))
+
+LABEL_BACKENDS = {
+    "excel": ExcelSessionLabelBackend,
+    "docprops": DocPropsLabelBackend,
+    "none": NoOpLabelBackend,
+}
+
+def create_label_backend(name):
+    if name not in LABEL_BACKENDS:
+        raise ValueError(f"Unknown label backend '{name}', expected one of {sorted(LABEL_BACKENDS)}")
+    return LABEL_BACKENDS[name]()
+
+# --- Runs the label stage inline, or on a background thread so the next file is not blocked ---
+class Labeller:
+    def __init__(self, backend, run_async=False, metrics=None):
+        self.backend = backend
+        self.run_async = run_async
+        self.metrics = metrics
+        self.loggers = {}
+        self.pending = queue.Queue()
+        self.thread = None
+        if run_async:
+            self.thread = threading.Thread(target=self.worker, name="labeller", daemon=True)
+            self.thread.start()
+
+    def span(self, **fields):
+        return self.metrics.span("label", **fields) if self.metrics else nullcontext({})
+
+    def submit(self, output_path, logger):
+        if not self.run_async:
+            with self.span(file=output_path):
+                self.backend.label(output_path, logger)
+            return
+        self.loggers[output_path] = logger
+        self.pending.put(output_path)
+
+    def worker(self):
+        com_initialized = False
+        try:
+            import pythoncom
+            pythoncom.CoInitialize()
+            com_initialized = True
+        except ImportError:
+            pass
+        try:
+            stop = False
+            while not stop:
+                # Label everything that queued up while the previous batch ran in one go
+                batch = [self.pending.get()]
+                while True:
+                    try:
+                        batch.append(self.pending.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in batch:
+                    stop = True
+                    batch = [path for path in batch if path is not None]
+                if batch:
+                    try:
+                        with self.span(files=len(batch)):
+                            self.backend.label_batch(batch, self.loggers.pop)
+                    except Exception as e:
+                        for output_path in batch:
+                            logger = self.loggers.pop(output_path, None)
+                            if logger:
+                                logger.error(f"Error applying sensitivity label to {output_path}: {e}")
+            self.backend.close()
+        finally:
+            if com_initialized:
+                pythoncom.CoUninitialize()
+
+    def close(self):
+        if self.run_async:
+            self.pending.put(None)
+            self.thread.join()
+        else:
+            self.backend.close()
@@ -0,0 +1,128 @@
+import os
+import sys
+import sqlite3
+import argparse
+from datetime import datetime
+
+# --- PROCESSED FILES LEDGER ---
+# SQLite-backed replacement for the RecordsSim.xlsx ledger. Every processed file
+# is one indexed row, so recording a file is a single INSERT instead of
+# re-saving the whole workbook, and startup only reads one narrow column.
+class ProcessedLedger:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        # WAL + synchronous=FULL: each commit is durable once add() returns,
+        # and a crash mid-run never leaves a half-written ledger behind.
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed_files ("
+            "file_name TEXT PRIMARY KEY, processed_at TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ledger_meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.conn.commit()
+        self.processed_files = {
+            row[0] for row in self.conn.execute("SELECT file_name FROM processed_files")
+        }
+
+    def __contains__(self, file_name):
+        return file_name in self.processed_files
+
+    def __len__(self):
+        return len(self.processed_files)
+
+    def add(self, file_name):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO processed_files (file_name, processed_at) VALUES (?, ?)",
+                (file_name, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+        self.processed_files.add(file_name)
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM ledger_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ledger_meta (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    # --- One-time import of the legacy xlsx ledger (column A, header row skipped) ---
+    def import_xlsx(self, xlsx_path):
+        from openpyxl import load_workbook
+        wb = load_workbook(xlsx_path, read_only=True)
+        try:
+            ws = wb.active
+            names = [
+                str(row[0]) for row in ws.iter_rows(min_row=2, max_col=1, values_only=True)
+                if row and row[0]
+            ]
+        finally:
+            wb.close()
+        imported_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO processed_files (file_name, processed_at) VALUES (?, ?)",
+                ((name, imported_at) for name in names),
+            )
+            imported = self.conn.total_changes - before
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ledger_meta (key, value) VALUES (?, ?)",
+                ("xlsx_imported_from", os.path.abspath(xlsx_path)),
+            )
+        self.processed_files.update(names)
+        return imported
+
+    # --- Optional xlsx export for people who read the spreadsheet ---
+    def export_xlsx(self, xlsx_path):
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Sheet1")
+        ws.append(["Processed Files"])
+        for (file_name,) in self.conn.execute("SELECT file_name FROM processed_files ORDER BY rowid"):
+            ws.append([file_name])
+        tmp_path = xlsx_path + ".tmp"
+        wb.save(tmp_path)
+        os.replace(tmp_path, xlsx_path)
+        return len(self.processed_files)
+
+    def close(self):
+        self.conn.close()
+
+def open_ledger(db_path, xlsx_path=None):
+    ledger = ProcessedLedger(db_path)
+    imported = None
+    if xlsx_path and os.path.exists(xlsx_path) and ledger.get_meta("xlsx_imported_from") is None:
+        imported = ledger.import_xlsx(xlsx_path)
+    return ledger, imported
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or convert the processed-files ledger.")
+    parser.add_argument("action", choices=["import", "export", "count"])
+    parser.add_argument("db_path")
+    parser.add_argument("xlsx_path", nargs="?")
+    args = parser.parse_args()
+    if args.action != "count" and not args.xlsx_path:
+        parser.error(f"{args.action} requires xlsx_path")
+    ledger = ProcessedLedger(args.db_path)
+    try:
+        if args.action == "import":
+            print(f"Imported {ledger.import_xlsx(args.xlsx_path)} entries from {args.xlsx_path}")
+        elif args.action == "export":
+            print(f"Exported {ledger.export_xlsx(args.xlsx_path)} entries to {args.xlsx_path}")
+        else:
+            print(len(ledger))
+    except Exception as e:
+        print(f"Ledger {args.action} failed: {e}")
+        sys.exit(1)
+    finally:
+        ledger.close()
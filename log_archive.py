@@ -0,0 +1,212 @@
+import io
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import logging
+import argparse
+import importlib.util
+
+# --- ROTATED LOG ARCHIVE ---
+# Master.log rotates to master_<timestamp>.log (master_log.py). The scheduler's log maintenance
+# job compresses every rotated log that has settled, records the first and last timestamp of
+# each archive in INDEX_NAME, and removes the oldest archives once they are older than the
+# retention period or together take more than the size limit. gzip is always available; zstd
+# needs the zstandard package and falls back to gzip without it. Rotated metrics files
+# (metrics_<timestamp>.jsonl, metrics.py) are compressed and expired the same way, with their own
+# size limit, and are left out of the index.
+ROTATED_REGEX = re.compile(r"^master_\d{8}_\d{6}\.log(\.gz|\.zst)?$")
+METRICS_REGEX = re.compile(r"^metrics_\d{8}_\d{6}\.jsonl(\.gz|\.zst)?$")
+TIMESTAMP_REGEX = re.compile(rb"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]")
+INDEX_NAME = "master_logs_index.json"
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+# A log rotated this recently may still be closed by a process that wrote to it
+SETTLE_SECONDS = 60
+
+def compression_method(requested, logger=None):
+    if requested == "zstd":
+        if importlib.util.find_spec("zstandard") is None:
+            if logger:
+                logger.warning("zstandard is not installed, compressing rotated logs with gzip")
+            return "gzip"
+    return requested if requested in EXTENSIONS else None
+
+def open_log(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        import zstandard
+        # Buffered, so the archive can be read line by line like the others
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+    return open(path, "rb")
+
+# Wraps an open file; closing the writer leaves the file open
+def compressed_writer(raw, method, name, mtime):
+    if method == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=10).stream_writer(raw, closefd=False)
+    return gzip.GzipFile(filename=name, mode="wb", compresslevel=6, fileobj=raw, mtime=mtime)
+
+# Index entry for one log: its first and last timestamp, line count and size on disk
+def scan_lines(lines, entry):
+    for line in lines:
+        entry["lines"] += 1
+        match = TIMESTAMP_REGEX.match(line)
+        if match:
+            stamp = match.group(1).decode("ascii")
+            if entry["first"] is None:
+                entry["first"] = stamp
+            entry["last"] = stamp
+    return entry
+
+def new_entry():
+    return {"first": None, "last": None, "lines": 0, "size": 0}
+
+def index_log(path):
+    with open_log(path) as f:
+        entry = scan_lines(f, new_entry())
+    entry["size"] = os.path.getsize(path)
+    return entry
+
+# Writes <archive>.part, renames it into place, then removes the plain log. The index entry
+# is built from the same pass over the lines.
+def compress_log(path, method):
+    archive_path = path + EXTENSIONS[method]
+    part_path = archive_path + ".part"
+    mtime = os.path.getmtime(path)
+    entry = new_entry()
+    try:
+        with open(path, "rb") as src, open(part_path, "wb") as raw:
+            with compressed_writer(raw, method, os.path.basename(path), mtime) as dst:
+                for line in src:
+                    scan_lines((line,), entry)
+                    dst.write(line)
+        os.utime(part_path, (mtime, mtime))
+        os.replace(part_path, archive_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    os.remove(path)
+    entry["size"] = os.path.getsize(archive_path)
+    return archive_path, entry
+
+# --- Sidecar index: {file name: entry} for every rotated log, plain or compressed ---
+def load_index(folder):
+    try:
+        with open(os.path.join(folder, INDEX_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_index(folder, index):
+    index_path = os.path.join(folder, INDEX_NAME)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, index_path)
+
+# Rotated logs oldest first (the rotation time is in the name)
+def rotated_logs(folder, pattern=ROTATED_REGEX):
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
+    return sorted(name for name in names if pattern.match(name))
+
+# Oldest first: past max_age_days, then until the rest fit in max_total_mb. 0 turns either off.
+def expired_logs(folder, names, max_age_days, max_total_mb):
+    sizes = {name: os.path.getsize(os.path.join(folder, name)) for name in names}
+    expired = []
+    if max_age_days:
+        cutoff = time.time() - max_age_days * 86400
+        expired = [name for name in names if os.path.getmtime(os.path.join(folder, name)) < cutoff]
+    if max_total_mb:
+        kept = [name for name in names if name not in expired]
+        total = sum(sizes[name] for name in kept)
+        while kept and total > max_total_mb * 1024 * 1024:
+            name = kept.pop(0)
+            total -= sizes[name]
+            expired.append(name)
+    return expired
+
+def is_compressed(name):
+    return name.endswith(tuple(EXTENSIONS.values()))
+
+# Compresses the settled plain files among names; index (rotated logs only) gets an entry for
+# every file. Returns (names compressed, bytes before, bytes after).
+def compress_settled(folder, names, method, logger, index=None):
+    compressed = []
+    raw_bytes = archived_bytes = 0
+    for name in names:
+        path = os.path.join(folder, name)
+        if method and not is_compressed(name) and time.time() - os.path.getmtime(path) >= SETTLE_SECONDS:
+            try:
+                size = os.path.getsize(path)
+                archive_path, entry = compress_log(path, method)
+            except Exception as e:
+                logger.error(f"Could not compress {name}: {e}")
+                continue
+            if index is not None:
+                index.pop(name, None)
+                index[os.path.basename(archive_path)] = entry
+            compressed.append(name)
+            raw_bytes += size
+            archived_bytes += entry["size"]
+        elif index is not None and name not in index:
+            try:
+                index[name] = index_log(path)
+            except Exception as e:
+                logger.error(f"Could not index {name}: {e}")
+    return compressed, raw_bytes, archived_bytes
+
+def remove_expired(folder, names, max_age_days, max_total_mb, logger):
+    removed = []
+    for name in expired_logs(folder, names, max_age_days, max_total_mb):
+        try:
+            os.remove(os.path.join(folder, name))
+            removed.append(name)
+        except OSError as e:
+            logger.error(f"Could not remove {name}: {e}")
+    return removed
+
+def maintain_files(folder, pattern, kind, method, max_age_days, max_total_mb, logger, index=None):
+    compressed, raw_bytes, archived_bytes = compress_settled(folder, rotated_logs(folder, pattern), method, logger, index)
+    names = rotated_logs(folder, pattern)
+    removed = remove_expired(folder, names, max_age_days, max_total_mb, logger)
+    if compressed:
+        logger.info(f"Compressed {len(compressed)} rotated {kind} with {method}: "
+                    f"{raw_bytes / (1024 * 1024):.1f} MB -> {archived_bytes / (1024 * 1024):.1f} MB")
+    if removed:
+        logger.info(f"Removed {len(removed)} rotated {kind} past retention: {', '.join(removed)}")
+    return compressed, set(names) - set(removed), removed
+
+# Returns (files compressed, files removed); metrics_folder defaults to folder
+def maintain_logs(folder, compression="gzip", max_age_days=90, max_total_mb=1024, logger=None, metrics_folder=None):
+    logger = logger or logging.getLogger(__name__)
+    method = compression_method(compression, logger)
+    index = load_index(folder)
+    compressed, present, removed = maintain_files(
+        folder, ROTATED_REGEX, "log(s)", method, max_age_days, max_total_mb, logger, index)
+    save_index(folder, {name: entry for name, entry in index.items() if name in present})
+    metrics_compressed, _, metrics_removed = maintain_files(
+        metrics_folder or folder, METRICS_REGEX, "metrics file(s)", method, max_age_days, max_total_mb, logger)
+    return len(compressed) + len(metrics_compressed), len(removed) + len(metrics_removed)
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Compress and prune rotated master_*.log and metrics_*.jsonl files.")
+    parser.add_argument("action", choices=["maintain", "list"])
+    parser.add_argument("--folder", default=os.path.join(script_dir, "logs"))
+    parser.add_argument("--compression", choices=["gzip", "zstd", "none"], default="gzip")
+    parser.add_argument("--retention-days", type=float, default=90)
+    parser.add_argument("--max-mb", type=float, default=1024)
+    parser.add_argument("--metrics-folder", help="where metrics_*.jsonl are rotated, if not --folder")
+    args = parser.parse_args()
+    if args.action == "list":
+        for name, entry in sorted(load_index(args.folder).items()):
+            print(f"{name}\t{entry['first']}\t{entry['last']}\t{entry['lines']} lines\t{entry['size']} bytes")
+    else:
+        logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+        maintain_logs(args.folder, args.compression, args.retention_days, args.max_mb, metrics_folder=args.metrics_folder)
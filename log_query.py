@@ -0,0 +1,282 @@
+import os
+import re
+import mmap
+import bisect
+import threading
+import argparse
+from datetime import datetime, timedelta
+from log_archive import ROTATED_REGEX, TIMESTAMP_REGEX, load_index, open_log
+
+# --- LOG QUERY ---
+# Answers time-range, logger and level queries over Master.log and the rotated logs without
+# reading them from the start. Every plain log gets a SparseIndex: the timestamp and offset of
+# one record per INDEX_STEP bytes, found by seeking through a memory map, so a query bisects to
+# the checkpoint before its start time and reads from there. The index of the growing Master.log
+# is extended rather than rebuilt. Compressed archives cannot be seeked; the archive index
+# (log_archive.py) skips those outside the time range and the rest are read through. Records
+# are in time order apart from the few written in the same batch, so a query stops reading a
+# file at the first record past its end time.
+INDEX_STEP = 64 * 1024
+# MULTILINE so that ^ also matches at a line start in the middle of a mapped file
+LINE_START_REGEX = re.compile(TIMESTAMP_REGEX.pattern, re.MULTILINE)
+RECORD_REGEX = re.compile(rb"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] \[([^\]]+)\]\[([A-Z]+)\]")
+LOGGER_NAMES = ("BP", "SERUM", "ROBOCOPY", "SCHEDULER", "WATCHDOG")
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+TIME_FORMATS = (("%Y-%m-%d %H:%M:%S", 0), ("%Y-%m-%d %H:%M", 59), ("%Y-%m-%d", 86399))
+
+# "2026-10-17" or "2026-10-17 08:30" as an until time covers the whole day or minute
+def normalize_time(text, until=False):
+    for time_format, span in TIME_FORMATS:
+        try:
+            moment = datetime.strptime(text.strip(), time_format)
+        except ValueError:
+            continue
+        if until:
+            moment += timedelta(seconds=span)
+        return moment.strftime("%Y-%m-%d %H:%M:%S")
+    raise ValueError(f"not a time: {text!r} (expected YYYY-MM-DD [HH:MM[:SS]])")
+
+def map_file(f, size):
+    return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+def file_identity(stat):
+    return stat.st_dev, stat.st_ino
+
+# First line starting with a timestamp in [pos, limit), or None
+def record_start(m, pos, limit):
+    if pos > 0:
+        newline = m.find(b"\n", pos - 1, limit)
+        if newline < 0:
+            return None
+        pos = newline + 1
+    while pos < limit:
+        if LINE_START_REGEX.match(m, pos):
+            return pos
+        newline = m.find(b"\n", pos, limit)
+        if newline < 0:
+            return None
+        pos = newline + 1
+    return None
+
+def last_stamp(m, size):
+    end = size
+    while end > 0:
+        newline = m.rfind(b"\n", 0, end - 1)
+        match = LINE_START_REGEX.match(m, newline + 1)
+        if match:
+            return match.group(1).decode("ascii")
+        end = newline + 1
+    return None
+
+class SparseIndex:
+    def __init__(self, path):
+        self.path = path
+        self.reset(None)
+
+    def reset(self, identity):
+        self.identity = identity
+        self.size = 0
+        self.stamps = []
+        self.offsets = []
+        self.last = None
+
+    # Extends the index over whatever was appended; starts over if the file was replaced
+    def refresh(self):
+        stat = os.stat(self.path)
+        if file_identity(stat) != self.identity or stat.st_size < self.size:
+            self.reset(file_identity(stat))
+        if stat.st_size == self.size:
+            return self
+        with open(self.path, "rb") as f, map_file(f, stat.st_size) as m:
+            pos = self.offsets[-1] + INDEX_STEP if self.offsets else 0
+            while pos < stat.st_size:
+                start = record_start(m, pos, min(pos + INDEX_STEP, stat.st_size))
+                if start is not None:
+                    self.stamps.append(LINE_START_REGEX.match(m, start).group(1).decode("ascii"))
+                    self.offsets.append(start)
+                pos += INDEX_STEP
+            self.last = last_stamp(m, stat.st_size)
+        self.size = stat.st_size
+        return self
+
+    # Offset of the last checkpoint before since; every record from since on comes after it
+    def offset_for(self, since):
+        if since is None:
+            return 0
+        position = bisect.bisect_left(self.stamps, since) - 1
+        return self.offsets[position] if position >= 0 else 0
+
+# Which records a query keeps; lines without a timestamp belong to the record above them
+class RecordFilter:
+    def __init__(self, since=None, until=None, loggers=None, levels=None):
+        self.since = since
+        self.until = until
+        self.loggers = {name.upper().encode() for name in loggers} if loggers else None
+        self.levels = {level.upper().encode() for level in levels} if levels else None
+        self.keeping = False
+
+    # True to keep the line, False to drop it, None once past the end of the range
+    def check(self, line):
+        match = TIMESTAMP_REGEX.match(line)
+        if not match:
+            return self.keeping
+        stamp = match.group(1).decode("ascii")
+        if self.until is not None and stamp > self.until:
+            return None
+        record = RECORD_REGEX.match(line)
+        self.keeping = (self.since is None or stamp >= self.since) and (
+            (self.loggers is None and self.levels is None) or (
+                record is not None
+                and (self.loggers is None or record.group(2) in self.loggers)
+                and (self.levels is None or record.group(3) in self.levels)))
+        return self.keeping
+
+# Pages through the matching records, oldest first. Plain logs are mapped only for the length of
+# a fetch() (Windows cannot rename a mapped file, so Master.log could not rotate); an archive stays
+# open until it has been read through or close() is called.
+class LogCursor:
+    def __init__(self, sources, record_filter):
+        # [path, identity (plain logs) or None (archives), next offset]
+        self.sources = sources
+        self.filter = record_filter
+        self.reader = None
+        self.done = not sources
+
+    def fetch(self, count):
+        lines = []
+        while self.sources and len(lines) < count:
+            source = self.sources[0]
+            finished = self.fetch_plain(source, lines, count) if source[1] else self.fetch_archive(source, lines, count)
+            if finished:
+                self.sources.pop(0)
+                self.filter.keeping = False
+        self.done = not self.sources
+        return lines
+
+    def fetch_plain(self, source, lines, count):
+        path, identity, offset = source
+        try:
+            stat = os.stat(path)
+            if file_identity(stat) != identity:
+                # Rotated since the query started; its records have moved to an older file
+                return True
+            if stat.st_size == 0:
+                return True
+            with open(path, "rb") as f, map_file(f, stat.st_size) as m:
+                while offset < stat.st_size and len(lines) < count:
+                    newline = m.find(b"\n", offset)
+                    end = stat.st_size if newline < 0 else newline + 1
+                    line = m[offset:end]
+                    keep = self.filter.check(line)
+                    if keep is None:
+                        return True
+                    if keep:
+                        lines.append(line.decode("utf-8", errors="replace").rstrip("\r\n"))
+                    offset = end
+        except OSError:
+            return True
+        source[2] = offset
+        return offset >= stat.st_size
+
+    def fetch_archive(self, source, lines, count):
+        try:
+            if self.reader is None:
+                self.reader = open_log(source[0])
+            for line in self.reader:
+                keep = self.filter.check(line)
+                if keep is None:
+                    break
+                if keep:
+                    lines.append(line.decode("utf-8", errors="replace").rstrip("\r\n"))
+                    if len(lines) >= count:
+                        return False
+        except (OSError, EOFError):
+            pass
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        return True
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        self.sources = []
+        self.done = True
+
+class LogQuery:
+    def __init__(self, folder, live_name="Master.log"):
+        self.folder = folder
+        self.live_name = live_name
+        # Kept between queries, so the dashboard only indexes what was appended since the last one
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def log_files(self):
+        try:
+            names = sorted(name for name in os.listdir(self.folder) if ROTATED_REGEX.match(name))
+        except OSError:
+            return []
+        if os.path.exists(os.path.join(self.folder, self.live_name)):
+            names.append(self.live_name)
+        return names
+
+    def index(self, path):
+        if path not in self.indexes:
+            self.indexes[path] = SparseIndex(path)
+        return self.indexes[path].refresh()
+
+    # since/until are "YYYY-MM-DD HH:MM:SS" strings (normalize_time), or None for no bound
+    def query(self, since=None, until=None, loggers=None, levels=None):
+        with self.lock:
+            return LogCursor(self.sources(since, until), RecordFilter(since, until, loggers, levels))
+
+    def sources(self, since, until):
+        archive_index = load_index(self.folder)
+        sources = []
+        for name in self.log_files():
+            path = os.path.join(self.folder, name)
+            if name.endswith(".log"):
+                try:
+                    index = self.index(path)
+                except (OSError, ValueError):
+                    continue
+                first, last, offset = (index.stamps[0] if index.stamps else None), index.last, index.offset_for(since)
+                source = [path, index.identity, offset]
+            else:
+                entry = archive_index.get(name, {})
+                first, last = entry.get("first"), entry.get("last")
+                source = [path, None, 0]
+            if since is not None and last is not None and last < since:
+                continue
+            if until is not None and first is not None and first > until:
+                continue
+            sources.append(source)
+        for path in list(self.indexes):
+            if not os.path.exists(path):
+                del self.indexes[path]
+        return sources
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Search Master.log and the rotated logs.")
+    parser.add_argument("--folder", default=os.path.join(script_dir, "logs"))
+    parser.add_argument("--since", help="YYYY-MM-DD [HH:MM[:SS]]")
+    parser.add_argument("--until", help="YYYY-MM-DD [HH:MM[:SS]], inclusive")
+    parser.add_argument("--logger", action="append", help=f"repeatable: {', '.join(LOGGER_NAMES)}")
+    parser.add_argument("--level", action="append", help=f"repeatable: {', '.join(LEVELS)}")
+    parser.add_argument("--limit", type=int, default=1000, help="at most this many lines (0 for all)")
+    args = parser.parse_args()
+    try:
+        since = normalize_time(args.since) if args.since else None
+        until = normalize_time(args.until, until=True) if args.until else None
+    except ValueError as e:
+        parser.error(str(e))
+    cursor = LogQuery(args.folder).query(since, until, args.logger, args.level)
+    printed = 0
+    while not cursor.done and (not args.limit or printed < args.limit):
+        lines = cursor.fetch(min(1000, args.limit - printed) if args.limit else 1000)
+        for line in lines:
+            print(line)
+        printed += len(lines)
+    cursor.close()
@@ -0,0 +1,230 @@
+import os
+import time
+import queue
+import atexit
+import socket
+import struct
+import logging
+import secrets
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from concurrent_log_handler import ConcurrentRotatingFileHandler
+
+# --- MASTER LOG ---
+# By default every logger writes Master.log itself through a TimestampedConcurrentRotatingFileHandler,
+# taking the cross-process file lock for every record. With log_mode "queue" the scheduler runs a
+# MasterLogServer: the only writer of Master.log, which takes the lock once per batch of records.
+# Processes it starts find the server through LOG_SERVER_ENV and log through a QueueHandler, so a
+# logging call never waits on the file; a background thread sends the formatted lines over a
+# loopback socket. Without the server (a script run by hand, the dashboard), or when it stops
+# answering, records go to the file directly as before.
+LOG_SERVER_ENV = "WATCHDOG_LOG_SERVER"
+MAX_BYTES = 20 * 1024 * 1024
+RECONNECT_SECONDS = 30
+
+class TimestampedConcurrentRotatingFileHandler(ConcurrentRotatingFileHandler):
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        dirname, basename = os.path.split(self.baseFilename)
+        new_logname = os.path.join(dirname, f"master_{timestamp}.log")
+
+        if os.path.exists(self.baseFilename):
+            os.rename(self.baseFilename, new_logname)
+
+        # Compressed and pruned later by the scheduler's log maintenance job (log_archive.py)
+
+        self.stream = self._open()
+
+def master_file_handler(log_path, formatter=None):
+    handler = TimestampedConcurrentRotatingFileHandler(log_path, maxBytes=MAX_BYTES, encoding='utf-8')
+    handler.setFormatter(formatter or logging.Formatter('%(message)s'))
+    return handler
+
+# Frames are a 4-byte length and the UTF-8 text; the first frame on a connection is the token
+def send_frame(sock, text):
+    data = text.encode('utf-8')
+    sock.sendall(struct.pack(">L", len(data)) + data)
+
+def read_exact(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+def read_frame(conn):
+    header = read_exact(conn, 4)
+    if header is None:
+        return None
+    data = read_exact(conn, struct.unpack(">L", header)[0])
+    return None if data is None else data.decode('utf-8', errors='replace')
+
+# --- Writer side (owned by the scheduler) ---
+class MasterLogServer:
+    def __init__(self, log_path, flush_seconds=0.5, max_batch=1000):
+        self.log_path = log_path
+        self.handler = master_file_handler(log_path)
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        # Formatted lines, from this process's QueueHandlers and from client connections
+        self.lines = queue.Queue()
+        self.token = secrets.token_hex(16)
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        host, port = self.sock.getsockname()[:2]
+        self.address = f"{host}:{port}"
+        self.threads = []
+        # (logger, queue handler) pairs to hand back to the file on stop()
+        self.taken = []
+
+    def start(self):
+        for target in (self.accept_loop, self.write_loop):
+            thread = threading.Thread(target=target, name=f"log-{target.__name__}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        os.environ[LOG_SERVER_ENV] = f"{self.address}/{self.token}"
+        return self
+
+    def accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.read_loop, args=(conn,), name="log-client", daemon=True).start()
+
+    def read_loop(self, conn):
+        with conn:
+            if read_frame(conn) != self.token:
+                return
+            while True:
+                try:
+                    line = read_frame(conn)
+                except OSError:
+                    return
+                if line is None:
+                    return
+                self.lines.put(line)
+
+    # Waits up to flush_seconds after the first line for more, then writes them under one lock
+    def write_loop(self):
+        stop = False
+        while not stop:
+            batch = [self.lines.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.lines.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if None in batch:
+                stop = True
+                batch = [line for line in batch if line is not None]
+            if batch:
+                self.handler.emit(logging.makeLogRecord({"msg": "\n".join(batch)}))
+
+    # Replaces the logger's Master.log handler with a queue into this writer
+    def take_over(self, logger):
+        for handler in list(logger.handlers):
+            if isinstance(handler, TimestampedConcurrentRotatingFileHandler):
+                queue_handler = LineQueueHandler(self.lines, handler.formatter)
+                logger.removeHandler(handler)
+                logger.addHandler(queue_handler)
+                handler.close()
+                self.taken.append((logger, queue_handler))
+
+    def stop(self):
+        os.environ.pop(LOG_SERVER_ENV, None)
+        for logger, queue_handler in self.taken:
+            logger.removeHandler(queue_handler)
+            logger.addHandler(master_file_handler(self.log_path, queue_handler.formatter))
+        self.sock.close()
+        self.lines.put(None)
+        for thread in self.threads:
+            thread.join(5)
+        self.handler.close()
+
+# QueueHandler that queues the formatted line rather than the record
+class LineQueueHandler(QueueHandler):
+    def __init__(self, lines, formatter):
+        super().__init__(lines)
+        self.setFormatter(formatter)
+
+    def prepare(self, record):
+        return self.format(record)
+
+# --- Client side (every process started under the server) ---
+class LogServerClient(logging.Handler):
+    def __init__(self, address, log_path):
+        super().__init__()
+        self.address, _, self.token = address.partition("/")
+        self.log_path = log_path
+        self.sock = None
+        self.retry_at = 0
+        self.fallback = None
+
+    def connect(self):
+        if time.monotonic() < self.retry_at:
+            return False
+        host, _, port = self.address.rpartition(":")
+        try:
+            self.sock = socket.create_connection((host, int(port)), timeout=5)
+            send_frame(self.sock, self.token)
+            return True
+        except (OSError, ValueError):
+            self.sock = None
+            self.retry_at = time.monotonic() + RECONNECT_SECONDS
+            return False
+
+    def emit(self, record):
+        line = record.msg
+        if self.sock is not None or self.connect():
+            try:
+                send_frame(self.sock, line)
+                return
+            except OSError:
+                self.sock.close()
+                self.sock = None
+                self.retry_at = time.monotonic() + RECONNECT_SECONDS
+        if self.fallback is None:
+            self.fallback = master_file_handler(self.log_path)
+        self.fallback.emit(record)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.fallback is not None:
+            self.fallback.close()
+        super().close()
+
+# One queue, sender thread and connection per process, shared by all its loggers
+client_queue = None
+
+def client_handler(address, log_path, formatter):
+    global client_queue
+    if client_queue is None:
+        client_queue = queue.Queue()
+        listener = QueueListener(client_queue, LogServerClient(address, log_path))
+        listener.start()
+        atexit.register(listener.stop)
+    handler = QueueHandler(client_queue)
+    handler.setFormatter(formatter)
+    return handler
+
+# Adds the Master.log handler for this process: through the scheduler's log server when one is
+# running, otherwise straight to the file
+def attach_master_log(logger, formatter, log_path):
+    address = os.environ.get(LOG_SERVER_ENV)
+    if address:
+        handler = client_handler(address, log_path, formatter)
+    else:
+        handler = master_file_handler(log_path, formatter)
+    logger.addHandler(handler)
+    return handler
@@ -0,0 +1,158 @@
+import os
+import json
+import math
+import time
+from contextlib import contextmanager
+
+# --- STAGE METRICS ---
+# A span times one stage of one file: a perf_counter pair, a dict and a list append. Spans are
+# kept in memory and written once per run, appended to metrics.jsonl and rewritten as a
+# Prometheus textfile-collector file (one per component) holding each stage's last-run figures.
+# metrics.jsonl is renamed to metrics_<timestamp>.jsonl once it passes ROTATE_BYTES; the scheduler's
+# log maintenance job (log_archive.py) compresses and expires the rotated files with the old logs.
+ROTATE_BYTES = 20 * 1024 * 1024
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+class Metrics:
+    def __init__(self, component, folder, enabled=True):
+        self.component = component
+        self.folder = folder
+        self.enabled = enabled
+        self.runs = 0
+        self.run = self.new_run_id()
+        self.records = []
+        # Records of each stage's most recent flush. The scheduler flushes after every job, so the
+        # textfile keeps the stages of the other jobs instead of only those of the last one.
+        self.latest = {}
+
+    # A long-lived process (the scheduler's persistent worker) flushes once per run
+    def new_run_id(self):
+        self.runs += 1
+        run = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        return run if self.runs == 1 else f"{run}-{self.runs}"
+
+    @contextmanager
+    def span(self, stage, **fields):
+        record = dict(fields)
+        if not self.enabled:
+            yield record
+            return
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record["error"] = True
+            raise
+        finally:
+            record["duration"] = round(time.perf_counter() - start, 6)
+            record["stage"] = stage
+            record["ts"] = round(time.time(), 3)
+            self.records.append(record)
+
+    def stages(self, records=None):
+        grouped = {}
+        for record in self.records if records is None else records:
+            grouped.setdefault(record["stage"], []).append(record)
+        return grouped
+
+    def summary(self):
+        parts = []
+        for stage, records in self.stages().items():
+            durations = [record["duration"] for record in records]
+            parts.append(
+                f"{stage} n={len(durations)} p50={percentile(durations, 0.5) * 1000:.1f}ms "
+                f"p95={percentile(durations, 0.95) * 1000:.1f}ms"
+            )
+        return "; ".join(parts)
+
+    def log_summary(self, logger):
+        if self.enabled and self.records:
+            logger.info(f"Stage timings: {self.summary()}")
+
+    # Another writer may have rotated it already, and Windows cannot rename it while it is open
+    # elsewhere; either way the next flush tries again
+    def rotate_jsonl(self, path):
+        try:
+            if os.path.getsize(path) < ROTATE_BYTES:
+                return
+            rotated_path = os.path.join(self.folder, f"metrics_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+            if not os.path.exists(rotated_path):
+                os.rename(path, rotated_path)
+        except OSError:
+            pass
+
+    def write_jsonl(self, records):
+        jsonl_path = os.path.join(self.folder, "metrics.jsonl")
+        self.rotate_jsonl(jsonl_path)
+        lines = []
+        for record in records:
+            lines.append(json.dumps({"component": self.component, "run": self.run, **record}, default=str))
+        # One append per run keeps concurrent writers (processor, copier, scheduler) from interleaving
+        with open(jsonl_path, 'a', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+
+    def write_prometheus(self, records):
+        labels = f'component="{self.component}"'
+        lines = [
+            "# HELP watchdog_stage_duration_seconds Stage durations in the stage's last run.",
+            "# TYPE watchdog_stage_duration_seconds summary",
+        ]
+        self.latest.update(self.stages(records))
+        stages = sorted(self.latest.items())
+        totals = []
+        for stage, stage_records in stages:
+            durations = [record["duration"] for record in stage_records]
+            stage_labels = f'{labels},stage="{stage}"'
+            for q in (0.5, 0.95):
+                lines.append(f'watchdog_stage_duration_seconds{{{stage_labels},quantile="{q}"}} {percentile(durations, q):.6f}')
+            lines.append(f"watchdog_stage_duration_seconds_sum{{{stage_labels}}} {sum(durations):.6f}")
+            lines.append(f"watchdog_stage_duration_seconds_count{{{stage_labels}}} {len(durations)}")
+            for field in ("rows", "bytes"):
+                values = [record[field] for record in stage_records if record.get(field) is not None]
+                if values:
+                    totals.append(f"watchdog_stage_{field}{{{stage_labels}}} {sum(values)}")
+        lines.append("# HELP watchdog_stage_rows Rows handled in the stage's last run.")
+        lines.append("# TYPE watchdog_stage_rows gauge")
+        lines.extend(line for line in totals if line.startswith("watchdog_stage_rows"))
+        lines.append("# HELP watchdog_stage_bytes Bytes handled in the stage's last run.")
+        lines.append("# TYPE watchdog_stage_bytes gauge")
+        lines.extend(line for line in totals if line.startswith("watchdog_stage_bytes"))
+        # Child runs launched by the scheduler carry their exit status
+        status = [(stage, stage_records) for stage, stage_records in stages
+                  if any("exit_code" in record or record.get("timed_out") for record in stage_records)]
+        if status:
+            lines.append("# HELP watchdog_stage_exit_code Exit code of the stage's last run (-1 when it had none).")
+            lines.append("# TYPE watchdog_stage_exit_code gauge")
+            for stage, stage_records in status:
+                code = stage_records[-1].get("exit_code")
+                lines.append(f'watchdog_stage_exit_code{{{labels},stage="{stage}"}} {-1 if code is None else code}')
+            lines.append("# HELP watchdog_stage_timeouts Runs of the stage stopped for passing their timeout.")
+            lines.append("# TYPE watchdog_stage_timeouts gauge")
+            for stage, stage_records in status:
+                timeouts = sum(1 for record in stage_records if record.get("timed_out"))
+                lines.append(f'watchdog_stage_timeouts{{{labels},stage="{stage}"}} {timeouts}')
+        lines.append("# HELP watchdog_last_run_timestamp_seconds When the component last finished a run.")
+        lines.append("# TYPE watchdog_last_run_timestamp_seconds gauge")
+        lines.append(f"watchdog_last_run_timestamp_seconds{{{labels}}} {time.time():.3f}")
+        # The collector may read at any moment, so never leave a half-written file in place
+        prom_path = os.path.join(self.folder, f"watchdog_{self.component}.prom")
+        tmp_path = prom_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, prom_path)
+
+    # The records are swapped out first, so spans finished by other threads meanwhile are kept
+    def flush(self, logger):
+        if not self.enabled or not self.records:
+            return
+        records, self.records = self.records, []
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            self.write_jsonl(records)
+            self.write_prometheus(records)
+        except Exception as e:
+            logger.warning(f"Failed to write metrics to {self.folder}: {e}")
+        self.run = self.new_run_id()
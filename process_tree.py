@@ -0,0 +1,186 @@
+import os
+import sys
+import signal
+import subprocess
+
+# --- CHILD PROCESS CONTROL ---
+# Task scripts run in a process group of their own (a new session on POSIX, a new console
+# process group on Windows), so a run that outlives its timeout is stopped together with
+# everything it started: a graceful signal first, a kill after the grace period. Excel instances
+# opened through COM are not children of the script, so the label backend registers their PIDs
+# in the file named by HELPER_PIDS_ENV, and those are stopped with the tree.
+HELPER_PIDS_ENV = "WATCHDOG_HELPER_PIDS"
+
+class ChildLimits:
+    def __init__(self, timeout_seconds=None, cpu_seconds=None, memory_mb=None, grace_seconds=30):
+        self.timeout_seconds = timeout_seconds or None
+        self.cpu_seconds = cpu_seconds or None
+        self.memory_mb = memory_mb or None
+        self.grace_seconds = grace_seconds
+
+    def describe(self):
+        parts = []
+        if self.timeout_seconds:
+            parts.append(f"timeout {self.timeout_seconds / 60:g} minutes")
+        if self.cpu_seconds:
+            parts.append(f"CPU {self.cpu_seconds:g} s")
+        if self.memory_mb:
+            parts.append(f"memory {self.memory_mb:g} MB")
+        return ", ".join(parts) or "no limits"
+
+# --- Helper PIDs (written by the child, read by the scheduler) ---
+def read_helper_pids(path):
+    try:
+        with open(path) as f:
+            return {int(line) for line in f if line.strip()}
+    except (OSError, ValueError):
+        return set()
+
+def write_helper_pids(path, pids):
+    with open(path, 'w') as f:
+        f.write("".join(f"{pid}\n" for pid in sorted(pids)))
+
+def register_helper_pid(pid):
+    path = os.environ.get(HELPER_PIDS_ENV)
+    if path and pid:
+        write_helper_pids(path, read_helper_pids(path) | {pid})
+
+def unregister_helper_pid(pid):
+    path = os.environ.get(HELPER_PIDS_ENV)
+    if path and pid:
+        write_helper_pids(path, read_helper_pids(path) - {pid})
+
+# --- Resource limits ---
+# POSIX: rlimits set in the child itself (RLIMIT_CPU, and RLIMIT_AS for memory, which counts
+# address space rather than resident memory). cpu_used lets a long-lived worker give each run
+# its own CPU budget.
+def apply_rlimits(cpu_seconds=None, memory_mb=None, cpu_used=0):
+    import resource
+    if cpu_seconds:
+        # SIGXCPU (fatal by default) at the soft limit. Only the soft limit moves, since an
+        # unprivileged process cannot raise its hard limit again for the next run.
+        hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+        soft = int(cpu_used + cpu_seconds)
+        resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+    if memory_mb:
+        limit = int(memory_mb * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def cpu_time_used():
+    times = os.times()
+    return times.user + times.system
+
+# Windows: a job object carrying the limits (needs pywin32, which xlwings already installs).
+# The handle must stay open for as long as the limits should hold.
+def limit_windows_process(pid, cpu_seconds=None, memory_mb=None):
+    import win32api
+    import win32con
+    import win32job
+    job = win32job.CreateJobObject(None, "")
+    info = win32job.QueryInformationJobObject(job, win32job.JobObjectExtendedLimitInformation)
+    flags = 0
+    if cpu_seconds:
+        # In 100 ns units; applies to every process in the job
+        info['BasicLimitInformation']['PerProcessUserTimeLimit'] = int(cpu_seconds * 10_000_000)
+        flags |= win32job.JOB_OBJECT_LIMIT_PROCESS_TIME
+    if memory_mb:
+        info['ProcessMemoryLimit'] = int(memory_mb * 1024 * 1024)
+        flags |= win32job.JOB_OBJECT_LIMIT_PROCESS_MEMORY
+    info['BasicLimitInformation']['LimitFlags'] = flags
+    win32job.SetInformationJobObject(job, win32job.JobObjectExtendedLimitInformation, info)
+    handle = win32api.OpenProcess(win32con.PROCESS_SET_QUOTA | win32con.PROCESS_TERMINATE, False, pid)
+    try:
+        win32job.AssignProcessToJobObject(job, handle)
+    finally:
+        win32api.CloseHandle(handle)
+    return job
+
+# On POSIX the limits are applied by this module running as a launcher, which then execs the
+# real command (same PID, so the process group is unchanged)
+def launch_command(command, limits):
+    if os.name == "nt" or not (limits.cpu_seconds or limits.memory_mb):
+        return list(command)
+    return [sys.executable, os.path.abspath(__file__), str(limits.cpu_seconds or 0), str(limits.memory_mb or 0),
+            *command]
+
+def popen_group_options():
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+# Returns the job object holding the limits on Windows (None elsewhere); raises if they cannot be set
+def limit_started_process(process, limits):
+    if os.name == "nt" and (limits.cpu_seconds or limits.memory_mb):
+        return limit_windows_process(process.pid, limits.cpu_seconds, limits.memory_mb)
+    return None
+
+# --- Stopping a tree ---
+def descendants(pid):
+    try:
+        import psutil
+        return psutil.Process(pid).children(recursive=True)
+    except Exception:
+        # Without psutil the process group (POSIX) or taskkill /T (Windows) has to find them
+        return []
+
+def signal_pid(pid, kill):
+    try:
+        if os.name == "nt":
+            # Without /F taskkill asks the process to close
+            subprocess.run(["taskkill", *(["/F"] if kill else []), "/PID", str(pid)], capture_output=True)
+        else:
+            os.kill(pid, signal.SIGKILL if kill else signal.SIGTERM)
+    except OSError:
+        pass
+
+def signal_tree(process, kill):
+    try:
+        if os.name == "nt":
+            if kill:
+                subprocess.run(["taskkill", "/T", "/F", "/PID", str(process.pid)], capture_output=True)
+            elif hasattr(process, "send_signal"):
+                # Only reaches a child started with CREATE_NEW_PROCESS_GROUP
+                process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+    except OSError:
+        pass
+
+def wait_for_exit(process, seconds):
+    if hasattr(process, "join"):
+        process.join(seconds)
+        return not process.is_alive()
+    try:
+        process.wait(seconds)
+        return True
+    except subprocess.TimeoutExpired:
+        return False
+
+# Graceful signal to the tree and its helpers, a kill after grace_seconds. process is a Popen
+# or a multiprocessing.Process. Returns "terminated" or "killed".
+def stop_tree(process, grace_seconds, helper_pids_path=None):
+    children = descendants(process.pid)
+    helpers = read_helper_pids(helper_pids_path) if helper_pids_path else set()
+    signal_tree(process, kill=False)
+    for child in children:
+        signal_pid(child.pid, kill=False)
+    for pid in helpers:
+        signal_pid(pid, kill=False)
+    outcome = "terminated" if wait_for_exit(process, grace_seconds) else "killed"
+    # Whatever is left of the group is killed even when the main process exited in time
+    signal_tree(process, kill=True)
+    wait_for_exit(process, grace_seconds)
+    # Stragglers: children outside the group, helpers that ignored the signal
+    for child in children:
+        if child.is_running():
+            signal_pid(child.pid, kill=True)
+    for pid in helpers:
+        signal_pid(pid, kill=True)
+    if helper_pids_path:
+        write_helper_pids(helper_pids_path, set())
+    return outcome
+
+if __name__ == "__main__":
+    cpu_seconds, memory_mb = float(sys.argv[1]), float(sys.argv[2])
+    apply_rlimits(cpu_seconds, memory_mb)
+    os.execv(sys.argv[3], sys.argv[3:])
@@ -2,25 +2,17 @@ import shutil
 import os
 import json
 import sys
+import errno
 import logging
-from datetime import datetime
-from concurrent_log_handler import ConcurrentRotatingFileHandler
-
-# --- CUSTOM TIMESTAMPED ROTATING HANDLER ---
-class TimestampedConcurrentRotatingFileHandler(ConcurrentRotatingFileHandler):
-    def doRollover(self):
-        if self.stream:
-            self.stream.close()
-            self.stream = None
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        dirname, basename = os.path.split(self.baseFilename)
-        new_logname = os.path.join(dirname, f"master_{timestamp}.log")
-
-        if os.path.exists(self.baseFilename):
-            os.rename(self.baseFilename, new_logname)
-
-        self.stream = self._open()
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from master_log import attach_master_log
+from metrics import Metrics
+from sync_manifest import SyncManifest, PARTIAL_SUFFIX
+from scan_index import file_hash
+from sync_plan import configured_jobs, plan_jobs
+from copy_queue import CopyQueue
 
 # --- LOGGER SETUP BLOCK ---
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -28,13 +20,9 @@ log_path = os.path.join(script_dir,'logs','Master.log')
 formatter = logging.Formatter('[%(asctime)s] [ROBOCOPY][%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 logger = logging.getLogger("ROBOCOPY")
 
-# --- USE CUSTOM TIMESTAMPED HANDLER ---
-file_handler = TimestampedConcurrentRotatingFileHandler(
-    log_path, maxBytes=20*1024*1024, encoding='utf-8'
-)
-file_handler.setFormatter(formatter)
+# --- Master.log directly, or through the scheduler's log server (master_log.py) ---
+file_handler = attach_master_log(logger, formatter, log_path)
 logger.setLevel(logging.INFO)
-logger.addHandler(file_handler)
 
 # (Optional) Also log to console
 stream_handler = logging.StreamHandler(sys.stdout)
@@ -55,45 +43,397 @@ except Exception as e:
     logger.error(f"Failed to load config: {e}")
     sys.exit(1)
 
-bp_copy_source = config['bp_copy_source']
-serum_copy_source = config['serum_copy_source']
-bp_copy_dest = config['bp_copy_dest']
-serum_copy_dest = config['serum_copy_dest']
+copy_jobs = configured_jobs(config)
+copy_workers = config.get('copy_workers', 1)
+copy_manifest = config.get('copy_manifest', os.path.join(script_dir, 'sync_manifest.db'))
+copy_full_verify_hours = config.get('copy_full_verify_hours', 24)
+copy_verify = config.get('copy_verify', False)
+copy_queue_path = config.get('copy_queue', os.path.join(script_dir, 'copy_queue.db'))
+copy_reconcile_minutes = config.get('copy_reconcile_minutes', 60)
+metrics = Metrics("robocopy", config.get('metrics_folder', os.path.join(script_dir, 'logs')), config.get('metrics_enabled', True))
+
+# --- Atomic copy: write <dest>.part, then rename it over the destination ---
+# Readers only ever see the old file or the complete new one. Bytes are moved by the kernel
+# (copy_file_range, then sendfile) where the platform and filesystems allow it, otherwise
+# through a plain read/write loop.
+COPY_CHUNK = 8 * 1024 * 1024
+# Interrupted copies of files at least this large are resumed; smaller ones simply restart
+RESUME_MIN_BYTES = 64 * 1024 * 1024
+FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM, errno.EBADF}
+
+class SourceChanged(Exception):
+    pass
+
+# src and dest are unbuffered file objects; returns the offset reached (short if the source shrank)
+def copy_range(src, dest, offset, end):
+    method = "copy_file_range" if hasattr(os, "copy_file_range") else "sendfile" if sys.platform.startswith("linux") else "read"
+    buffer = None
+    while offset < end:
+        count = min(COPY_CHUNK, end - offset)
+        try:
+            if method == "copy_file_range":
+                copied = os.copy_file_range(src.fileno(), dest.fileno(), count, offset, offset)
+            elif method == "sendfile":
+                dest.seek(offset)
+                copied = os.sendfile(dest.fileno(), src.fileno(), offset, count)
+            else:
+                if buffer is None:
+                    buffer = memoryview(bytearray(COPY_CHUNK))
+                src.seek(offset)
+                dest.seek(offset)
+                copied = dest.write(buffer[:src.readinto(buffer[:count])])
+        except OSError as e:
+            if method == "read" or e.errno not in FALLBACK_ERRNOS:
+                raise
+            # Not supported for this pair of files: step down to the next method
+            method = "sendfile" if method == "copy_file_range" and sys.platform.startswith("linux") else "read"
+            continue
+        if copied == 0:
+            break
+        offset += copied
+    return offset
+
+def resume_path(tmp_file):
+    return tmp_file[:-len(PARTIAL_SUFFIX)] + ".resume" + PARTIAL_SUFFIX
+
+# A partial copy is only resumed when it was started from the same source version
+def resume_offset(tmp_file, src_stat):
+    try:
+        with open(resume_path(tmp_file), 'r', encoding='utf-8') as f:
+            started_from = json.load(f)
+        partial_size = os.path.getsize(tmp_file)
+    except (OSError, ValueError):
+        return 0
+    if started_from != {"size": src_stat.st_size, "mtime_ns": src_stat.st_mtime_ns}:
+        return 0
+    # Whole chunks only, in case the last write was cut short
+    return min(partial_size, src_stat.st_size) // COPY_CHUNK * COPY_CHUNK
+
+def remove_partial(tmp_file):
+    for path in (tmp_file, resume_path(tmp_file)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+# Returns (bytes written, resumed from offset, sha256 of the copy or None)
+def atomic_copy(src_file, dest_file, verify=False):
+    tmp_file = dest_file + PARTIAL_SUFFIX
+    with open(src_file, 'rb', buffering=0) as src:
+        src_stat = os.fstat(src.fileno())
+        resumable = src_stat.st_size >= RESUME_MIN_BYTES
+        offset = resume_offset(tmp_file, src_stat) if resumable else 0
+        if resumable and offset == 0:
+            with open(resume_path(tmp_file), 'w', encoding='utf-8') as f:
+                json.dump({"size": src_stat.st_size, "mtime_ns": src_stat.st_mtime_ns}, f)
+        try:
+            with open(tmp_file, 'r+b' if offset else 'wb', buffering=0) as dest:
+                dest.truncate(offset)
+                end = copy_range(src, dest, offset, src_stat.st_size)
+            now = os.fstat(src.fileno())
+            if end != src_stat.st_size or (now.st_size, now.st_mtime_ns) != (src_stat.st_size, src_stat.st_mtime_ns):
+                raise SourceChanged("source changed during copy")
+        except SourceChanged:
+            remove_partial(tmp_file)
+            raise
+        except BaseException:
+            # Large copies keep their partial file for the next attempt
+            if not resumable:
+                remove_partial(tmp_file)
+            raise
+    digest = None
+    if verify:
+        digest = file_hash(src_file)
+        if file_hash(tmp_file) != digest:
+            remove_partial(tmp_file)
+            raise OSError(f"checksum mismatch after copying {src_file}")
+    shutil.copystat(src_file, tmp_file)
+    os.replace(tmp_file, dest_file)
+    if resumable:
+        remove_partial(tmp_file)
+    return src_stat.st_size - offset, offset, digest
+
+# Only actual copies get a span, so an idle sweep adds nothing per file
+def timed_copy(src_file, dest_file):
+    with metrics.span("copy", file=src_file) as span:
+        span["bytes"], resumed_from, digest = atomic_copy(src_file, dest_file, copy_verify)
+        if resumed_from:
+            span["resumed_from"] = resumed_from
+            logger.info(f"Resumed interrupted copy of {src_file} at {resumed_from} bytes")
+    return digest
+
+# Returns (status, checksum): status is "new", "updated", "failed", or None when the destination
+# is already up to date; checksum is only set when copy_verify is on.
+# src_mtime comes from the caller's cached DirEntry stat when it has one.
+def copy_if_newer(src_file, dest_file, src_mtime=None):
+    try:
+        try:
+            dest_mtime = os.stat(dest_file).st_mtime
+        except FileNotFoundError:
+            digest = timed_copy(src_file, dest_file)
+            logger.info(f"Copied new file: {src_file} -> {dest_file}")
+            return "new", digest
+        if src_mtime is None:
+            src_mtime = os.path.getmtime(src_file)
+        if src_mtime > dest_mtime:
+            digest = timed_copy(src_file, dest_file)
+            logger.info(f"Updated file: {src_file} -> {dest_file}")
+            return "updated", digest
+    except Exception as e:
+        logger.error(f"Failed to copy {src_file} to {dest_file}: {e}")
+        return "failed", None
+    return None, None
+
+# --- Copy engine: per-file checks and copies run on a bounded thread pool ---
+# On a network share each file costs several round trips, so keeping a few in flight hides the
+# latency. Callers create destination directories before submitting any of their files.
+# Submissions with a key get (key, status, checksum) appended to results once wait() returns.
+class CopyEngine:
+    def __init__(self, workers=1):
+        self.workers = max(1, workers)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="copy") if self.workers > 1 else None
+        self.pending = deque()
+        # Cap on queued futures so a 100k-file sweep does not hold one future per file
+        self.max_pending = self.workers * 64
+        self.counts = Counter()
+        self.results = []
+
+    def collect(self, key, outcome):
+        status, digest = outcome
+        self.counts[status] += 1
+        if key is not None:
+            self.results.append((key, status, digest))
+
+    def submit(self, src_file, dest_file, src_mtime=None, key=None):
+        if self.pool is None:
+            self.collect(key, copy_if_newer(src_file, dest_file, src_mtime))
+            return
+        if len(self.pending) >= self.max_pending:
+            self.collect(*self.next_result())
+        self.pending.append((key, self.pool.submit(copy_if_newer, src_file, dest_file, src_mtime)))
 
-# --- Copy missing file or file with outdated timestamp ---
-def copy_missing_or_updated_files(source, destination):
-    copied_count = 0
+    def next_result(self):
+        key, future = self.pending.popleft()
+        return key, future.result()
+
+    def wait(self):
+        while self.pending:
+            self.collect(*self.next_result())
+        if self.pool is not None:
+            self.pool.shutdown()
+        return self.counts
+
+def copied_total(counts):
+    return counts["new"] + counts["updated"]
+
+def log_counts(label, counts):
+    if copied_total(counts) or counts["failed"]:
+        logger.info(f"{label}: {counts['new']} new, {counts['updated']} updated, {counts['failed']} failed")
+
+# --- Sweep one source tree with os.scandir ---
+# With a manifest, directories whose mtime has not changed are not listed and files whose size
+# and mtime match the manifest are not compared, so an idle sweep costs one stat per directory.
+# full_verify (or no manifest) compares every file against the destination, as a plain walk would.
+def copy_missing_or_updated_files(source, destination, workers=1, manifest=None, full_verify=False):
     if not os.path.exists(source):
         logger.warning(f"Source directory missing: {source}")
-        return copied_count
-    for root, dirs, files in os.walk(source):
-        rel_path = os.path.relpath(root, source)
-        rel_path = "" if rel_path == "." else rel_path
-        dest_dir = os.path.normpath(os.path.join(destination, rel_path))
-        os.makedirs(dest_dir, exist_ok=True)
-        for file in files:
-            src_file = os.path.join(root, file)
-            dest_file = os.path.join(dest_dir, file)
+        return 0
+    pair = manifest.pair(source, destination) if manifest else None
+    verify = full_verify or pair is None
+    engine = CopyEngine(workers)
+    listed_dirs = {}
+    seen_files = set()
+    seen_dirs = set()
+    try:
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            src_dir = os.path.join(source, rel_dir) if rel_dir else source
             try:
-                if not os.path.exists(dest_file):
-                    shutil.copy2(src_file, dest_file)
-                    logger.info(f"Copied new file: {src_file} -> {dest_file}")
-                    copied_count += 1
-                else:
-                    if os.path.getmtime(src_file) > os.path.getmtime(dest_file):
-                        shutil.copy2(src_file, dest_file)
-                        logger.info(f"Updated file: {src_file} -> {dest_file}")
-                        copied_count += 1
-            except Exception as e:
-                logger.error(f"Failed to copy {src_file} to {dest_file}: {e}")
-    return copied_count
-
-def main():
+                dir_stat = os.stat(src_dir)
+            except FileNotFoundError:
+                continue
+            seen_dirs.add(rel_dir)
+            if not verify and pair.dir_unchanged(rel_dir, dir_stat):
+                stack.extend(pair.child_dirs(rel_dir))
+                continue
+            dest_dir = os.path.normpath(os.path.join(destination, rel_dir))
+            os.makedirs(dest_dir, exist_ok=True)
+            # Stat taken before listing: anything added meanwhile moves the mtime again
+            listed_dirs[rel_dir] = dir_stat.st_mtime_ns
+            with os.scandir(src_dir) as entries:
+                for entry in entries:
+                    rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                    if entry.is_dir():
+                        stack.append(rel_path)
+                        continue
+                    if not entry.is_file() or entry.name.endswith(PARTIAL_SUFFIX):
+                        continue
+                    stat = entry.stat()
+                    seen_files.add(rel_path)
+                    if not verify and pair.file_unchanged(rel_path, stat):
+                        continue
+                    engine.submit(entry.path, os.path.join(dest_dir, entry.name), stat.st_mtime,
+                                  (rel_path, stat.st_size, stat.st_mtime_ns))
+    finally:
+        counts = engine.wait()
+    if pair is not None:
+        update_manifest(manifest, pair, engine.results, listed_dirs)
+        if full_verify:
+            manifest.prune(pair, seen_files, seen_dirs)
+    log_counts(f"{source} -> {destination}", counts)
+    return copied_total(counts)
+
+# A directory is only marked as done when none of its files failed, so failures are retried
+def update_manifest(manifest, pair, results, listed_dirs):
+    failed_dirs = set()
+    for (rel_path, size, mtime_ns), status, digest in results:
+        if status == "failed":
+            failed_dirs.add(os.path.dirname(rel_path))
+        else:
+            pair.record_file(rel_path, size, mtime_ns, digest)
+    for rel_dir, mtime_ns in listed_dirs.items():
+        if rel_dir not in failed_dirs:
+            pair.record_dir(rel_dir, mtime_ns)
+    manifest.save(pair)
+
+# --- Event-driven and queued runs: copy only the given source files, through every pair that covers them ---
+# Returns (files copied, paths whose copy failed)
+def copy_changed_files(paths, pairs, workers=1, label="Changed files"):
+    engine = CopyEngine(workers)
+    created_dirs = set()
+    try:
+        for src_file in paths:
+            src_file = os.path.abspath(src_file)
+            if src_file.endswith(PARTIAL_SUFFIX) or not os.path.isfile(src_file):
+                continue
+            for source, destination in pairs:
+                source = os.path.abspath(source)
+                if os.path.commonpath([os.path.normcase(source), os.path.normcase(src_file)]) != os.path.normcase(source):
+                    continue
+                dest_file = os.path.join(destination, os.path.relpath(src_file, source))
+                dest_dir = os.path.dirname(dest_file)
+                if dest_dir not in created_dirs:
+                    try:
+                        os.makedirs(dest_dir, exist_ok=True)
+                    except Exception as e:
+                        logger.error(f"Failed to create {dest_dir}: {e}")
+                        continue
+                    created_dirs.add(dest_dir)
+                engine.submit(src_file, dest_file, key=src_file)
+    finally:
+        counts = engine.wait()
+    log_counts(label, counts)
+    return copied_total(counts), {src_file for src_file, status, _ in engine.results if status == "failed"}
+
+def open_manifest():
+    if not copy_manifest:
+        return None
+    try:
+        return SyncManifest(copy_manifest)
+    except Exception as e:
+        logger.warning(f"Sync manifest unavailable ({copy_manifest}), comparing every file: {e}")
+        return None
+
+def open_copy_queue():
+    if not copy_queue_path:
+        return None
+    try:
+        return CopyQueue(copy_queue_path)
+    except Exception as e:
+        logger.warning(f"Copy queue unavailable ({copy_queue_path}), sweeping every run: {e}")
+        return None
+
+# Outputs queued by PythonTask.py; failed copies stay queued and are retried on the next run
+def copy_queued_files(queue, pairs):
+    entries = queue.pending()
+    if not entries:
+        return 0
+    with metrics.span("queue", files=len(entries)) as span:
+        copied, failed = copy_changed_files([path for path, _ in entries], pairs, copy_workers, "Queued outputs")
+        span["copied"] = copied
+    queue.done([(path, enqueued) for path, enqueued in entries if path not in failed])
+    return copied
+
+# Rejected jobs are logged on every run; merges only with the (daily) full verify pass
+def plan():
+    jobs, rejected = plan_jobs(copy_jobs)
+    for job, reason in rejected:
+        logger.error(f"Skipping copy job {job.name} ({job.source} -> {job.destination}): {reason}")
+    return jobs
+
+def log_merges(jobs):
+    for job in jobs:
+        for name, reason in job.merged:
+            logger.info(f"Copy job {name} merged into {job.name}: {reason}")
+
+# The queue is drained on every run. The full sweep runs when reconciliation is due, on a full
+# verify, or on every run when the queue is disabled. Returns the number of files copied.
+def main(paths=None, full_verify=False, reconcile=False):
+    jobs = plan()
+    pairs = [(job.source, job.destination) for job in jobs]
     total_copied = 0
-    total_copied += copy_missing_or_updated_files(bp_copy_source, bp_copy_dest)
-    total_copied += copy_missing_or_updated_files(serum_copy_source, serum_copy_dest)
+    queue = open_copy_queue()
+    try:
+        if queue is not None:
+            total_copied += copy_queued_files(queue, pairs)
+        if paths:
+            with metrics.span("changed_files", files=len(paths)) as span:
+                span["copied"], _ = copy_changed_files(paths, pairs, copy_workers)
+            total_copied += span["copied"]
+        else:
+            manifest = open_manifest()
+            try:
+                full_verify = full_verify or (manifest is not None and manifest.full_verify_due(copy_full_verify_hours))
+                if reconcile or full_verify or queue is None or queue.reconcile_due(copy_reconcile_minutes):
+                    total_copied += sweep(jobs, manifest, full_verify)
+                    if queue is not None:
+                        queue.mark_reconciled()
+            finally:
+                if manifest is not None:
+                    manifest.close()
+    finally:
+        if queue is not None:
+            queue.close()
     if total_copied == 0:
         logger.info("Nothing new to copy over.")
+    else:
+        metrics.log_summary(logger)
+    metrics.flush(logger)
+    return total_copied
+
+def sweep(jobs, manifest, full_verify):
+    if full_verify and manifest is not None:
+        logger.info("Running full verify pass over all copy sources")
+    if full_verify:
+        log_merges(jobs)
+    copied = 0
+    for job in jobs:
+        with metrics.span("sweep", job=job.name, source=job.source, full_verify=full_verify) as span:
+            span["copied"] = copy_missing_or_updated_files(job.source, job.destination, job.workers, manifest, full_verify)
+        copied += span["copied"]
+    if full_verify and manifest is not None:
+        manifest.mark_full_verify()
+    return copied
+
+def print_plan():
+    for job in plan():
+        print(f"{job.name}: {job.source} -> {job.destination} ({job.workers} worker(s))")
+        for name, reason in job.merged:
+            print(f"  includes {name}: {reason}")
+
+# Also called directly by the scheduler's persistent worker (task_worker.py)
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Copy new or updated output files to their destinations.")
+    parser.add_argument("paths", nargs="*", help="changed source files to copy instead of sweeping every copy job")
+    parser.add_argument("--full-verify", action="store_true", help="compare every file, ignoring the sync manifest")
+    parser.add_argument("--reconcile", action="store_true", help="sweep every copy job now, even if not yet due")
+    parser.add_argument("--plan", action="store_true", help="show the copy jobs after merging, without copying")
+    args = parser.parse_args(argv)
+    if args.plan:
+        print_plan()
+        return None
+    return main(args.paths or None, args.full_verify, args.reconcile)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()
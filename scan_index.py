@@ -0,0 +1,156 @@
+import os
+import time
+import sqlite3
+import hashlib
+from stat import S_ISREG
+
+# --- INPUT SCAN INDEX ---
+# Remembers the fingerprint (size, mtime, optional content hash) each input had when it was
+# processed. A scan lists the directory with os.scandir, stats only the entries whose name is an
+# input, and looks up the fingerprints of those names alone, so neither cost grows with the rest of
+# the folder or with the history in the table. Nothing is written for unchanged files.
+# Files rejected by their schema check are remembered the same way (scan_rejected) and skipped
+# until their size or mtime changes, instead of being read and rejected again on every scan.
+# Names per IN (...) lookup, well under SQLite's limit on bound parameters
+LOOKUP_BATCH = 500
+
+class ScanEntry:
+    def __init__(self, kind, file_name, path, size, mtime_ns, content_hash=None, reason="new"):
+        self.kind = kind
+        self.file_name = file_name
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.content_hash = content_hash
+        self.reason = reason
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ScanIndex:
+    def __init__(self, db_path, stable_seconds=30, hash_check=False):
+        self.stable_seconds = stable_seconds
+        self.hash_check = hash_check
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Losing the newest rows after a power cut only means a file is fingerprinted again
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS scan_index ("
+            "file_name TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, content_hash TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS scan_rejected ("
+            "file_name TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL)"
+        )
+        self.conn.commit()
+        # Fingerprints of the names seen by the last scan
+        self.processed = {}
+        self.rejected = {}
+        self.candidates = {}
+        self.waiting = []
+
+    def save(self, rows):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO scan_index (file_name, size, mtime_ns, content_hash) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        for file_name, size, mtime_ns, content_hash in rows:
+            self.processed[file_name] = (size, mtime_ns, content_hash)
+
+    # {file name: the row's other columns} for the given names
+    def lookup(self, query, names):
+        found = {}
+        for start in range(0, len(names), LOOKUP_BATCH):
+            batch = names[start:start + LOOKUP_BATCH]
+            for row in self.conn.execute(query.format(",".join("?" * len(batch))), batch):
+                found[row[0]] = tuple(row[1:])
+        return found
+
+    # Yields (name, kind, path, stat) for the regular files in directory (or only the given names)
+    # that classify(name) recognises; other entries are never stat'ed
+    def list_files(self, directory, classify, names=None):
+        if names is None:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    kind = classify(entry.name)
+                    if kind and entry.is_file():
+                        yield entry.name, kind, entry.path, entry.stat()
+            return
+        for name in names:
+            kind = classify(name)
+            if not kind:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if S_ISREG(stat.st_mode):
+                yield name, kind, path, stat
+
+    # classify(name) returns the file kind or None; already_processed(name) covers files that
+    # were processed before the index existed, whose current state becomes their baseline.
+    # names limits the scan to those files (event-driven runs) instead of listing the directory.
+    def scan(self, directory, classify, already_processed, names=None):
+        now = time.time()
+        self.candidates = {}
+        self.waiting = []
+        baseline = []
+        files = list(self.list_files(directory, classify, names))
+        file_names = [name for name, kind, path, stat in files]
+        self.processed = self.lookup(
+            "SELECT file_name, size, mtime_ns, content_hash FROM scan_index WHERE file_name IN ({})", file_names)
+        self.rejected = self.lookup("SELECT file_name, size, mtime_ns FROM scan_rejected WHERE file_name IN ({})", file_names)
+        for name, kind, path, stat in files:
+            known = self.processed.get(name)
+            if known and known[:2] == (stat.st_size, stat.st_mtime_ns):
+                continue
+            if self.rejected.get(name) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            if now - stat.st_mtime < self.stable_seconds:
+                # Still being written (or only just landed): wait until it has settled
+                self.waiting.append(name)
+                continue
+            content_hash = file_hash(path) if self.hash_check else None
+            if (known is None and already_processed(name)) or (
+                    known and content_hash is not None and content_hash == known[2]):
+                # Processed before the index existed, or touched without changing:
+                # record the current fingerprint, nothing to redo
+                baseline.append((name, stat.st_size, stat.st_mtime_ns, content_hash))
+                continue
+            self.candidates[name] = ScanEntry(
+                kind, name, path, stat.st_size, stat.st_mtime_ns, content_hash,
+                reason="modified" if known else "new",
+            )
+        if baseline:
+            self.save(baseline)
+        return sorted(self.candidates.values(), key=lambda candidate: candidate.file_name)
+
+    def mark_processed(self, file_name):
+        candidate = self.candidates.pop(file_name, None)
+        if candidate:
+            self.save([(candidate.file_name, candidate.size, candidate.mtime_ns, candidate.content_hash)])
+            if file_name in self.rejected:
+                with self.conn:
+                    self.conn.execute("DELETE FROM scan_rejected WHERE file_name = ?", (file_name,))
+                del self.rejected[file_name]
+
+    # Skipped by later scans until the file's size or mtime changes
+    def mark_rejected(self, file_name):
+        candidate = self.candidates.pop(file_name, None)
+        if candidate:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO scan_rejected (file_name, size, mtime_ns) VALUES (?, ?, ?)",
+                    (file_name, candidate.size, candidate.mtime_ns),
+                )
+            self.rejected[file_name] = (candidate.size, candidate.mtime_ns)
+
+    def close(self):
+        self.conn.close()
@@ -1,43 +1,21 @@
 import time
 import signal
 import sys
+import threading
 import subprocess
 import os
 import json
 import logging
-from datetime import datetime
-from concurrent_log_handler import ConcurrentRotatingFileHandler
-
-# --- CUSTOM TIMESTAMPED ROTATING HANDLER ---
-class TimestampedConcurrentRotatingFileHandler(ConcurrentRotatingFileHandler):
-    def doRollover(self):
-        """
-        Override to use timestamped filenames for rotated logs.
-        """
-        if self.stream:
-            self.stream.close()
-            self.stream = None
-
-        # Get timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        dirname, basename = os.path.split(self.baseFilename)
-        new_logname = os.path.join(dirname, f"master_{timestamp}.log")
-
-        # Rename current log to timestamped name
-        if os.path.exists(self.baseFilename):
-            os.rename(self.baseFilename, new_logname)
-
-        # Remove old backups if exceeding backupCount
-        # backups = sorted([
-        #     f for f in os.listdir(dirname)
-        #     if f.startswith("master_") and f.endswith(".log")
-        # ])
-        # while len(backups) > self.backupCount:
-        #     os.remove(os.path.join(dirname, backups[0]))
-        #     backups.pop(0)
-
-        # Reopen the log file
-        self.stream = self._open()
+import tempfile
+from master_log import attach_master_log, MasterLogServer
+from log_archive import maintain_logs
+from fs_watch import EventBatcher, start_observer
+from metrics import Metrics
+from sync_plan import configured_jobs
+from task_worker import TaskWorker
+from process_tree import (ChildLimits, HELPER_PIDS_ENV, launch_command, popen_group_options, limit_started_process,
+                          stop_tree, wait_for_exit, read_helper_pids, signal_pid)
+from job_scheduler import JobScheduler, ScheduledJob, IntervalSchedule, AdaptiveSchedule, CronSchedule
 
 # --- CONFIG & LOGGER SETUP BLOCK ---
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -57,17 +35,37 @@ process_script = config.get('process_script', 'PythonBPTask.py')
 robocopy_script = config.get('robocopy_script', 'robocopy.py')
 process_path = os.path.join(script_dir, process_script)
 robocopy_path = os.path.join(script_dir, robocopy_script)
+watch_mode = config.get('watch_mode', False)
+watch_debounce_seconds = config.get('watch_debounce_seconds', 2)
+watch_rescan_minutes = config.get('watch_rescan_minutes', 60)
+input_stable_seconds = config.get('input_stable_seconds', 30)
+raw_file_source = config.get('raw_file_source')
+metrics = Metrics("scheduler", config.get('metrics_folder', os.path.join(script_dir, 'logs')), config.get('metrics_enabled', True))
+copy_sources = [job.source for job in configured_jobs(config)]
+adaptive_interval = config.get('adaptive_interval', False)
+min_interval_minutes = config.get('min_interval_minutes', 1)
+max_interval_minutes = config.get('max_interval_minutes', 60)
+interval_backoff_factor = config.get('interval_backoff_factor', 2)
+worker_mode = config.get('worker_mode', 'subprocess')
+worker_max_runs = config.get('worker_max_runs', 50)
+worker_max_memory_mb = config.get('worker_max_memory_mb', 1024)
+job_timeout_minutes = config.get('job_timeout_minutes', 0)
+job_cpu_limit_seconds = config.get('job_cpu_limit_seconds', 0)
+job_memory_limit_mb = config.get('job_memory_limit_mb', 0)
+job_kill_grace_seconds = config.get('job_kill_grace_seconds', 30)
+log_mode = config.get('log_mode', 'direct')
+log_flush_seconds = config.get('log_flush_seconds', 0.5)
+log_compression = config.get('log_compression', 'gzip')
+log_retention_days = config.get('log_retention_days', 90)
+log_retention_max_mb = config.get('log_retention_max_mb', 1024)
+log_maintenance_minutes = config.get('log_maintenance_minutes', 60)
 
 formatter = logging.Formatter('[%(asctime)s] [SCHEDULER][%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 logger = logging.getLogger("SCHEDULER")
 
-# --- USE CUSTOM TIMESTAMPED HANDLER ---
-file_handler = TimestampedConcurrentRotatingFileHandler(
-    log_path, maxBytes=20*1024*1024, encoding='utf-8'
-)
-file_handler.setFormatter(formatter)
+# --- USE CUSTOM TIMESTAMPED HANDLER (handed to the log server in log_mode "queue") ---
+file_handler = attach_master_log(logger, formatter, log_path)
 logger.setLevel(logging.INFO)
-logger.addHandler(file_handler)
 
 # (Optional) Also log to console
 stream_handler = logging.StreamHandler(sys.stdout)
@@ -88,24 +86,299 @@ def graceful_exit(signum, frame):
 signal.signal(signal.SIGTERM, graceful_exit)
 # signal.signal(signal.SIGINT, graceful_exit) # Uncomment if you want Ctrl+C to trigger graceful exit
 
-def run_subprocess(script_path, script_label):
+# What the task scripts log when a run found no work (read by the adaptive interval). PythonTask
+# does not log it while inputs are still being written, so arriving files keep the interval short.
+IDLE_MESSAGES = ("Nothing new to process.", "Nothing new to copy over.")
+
+# --- Per-run limits (process_tree.py): timeout, CPU and memory for each child ---
+# schedule_jobs entries can override the job_* defaults with timeout_minutes,
+# cpu_limit_seconds and memory_limit_mb. 0 means no limit.
+def job_limits(job_config=None):
+    job_config = job_config or {}
+    return ChildLimits(
+        job_config.get('timeout_minutes', job_timeout_minutes) * 60,
+        job_config.get('cpu_limit_seconds', job_cpu_limit_seconds),
+        job_config.get('memory_limit_mb', job_memory_limit_mb),
+        job_kill_grace_seconds,
+    )
+
+default_limits = job_limits()
+
+# Each run (or worker) gets a file the label backend writes its Excel PIDs to
+def new_helper_pids_path():
+    handle, path = tempfile.mkstemp(prefix="watchdog_helpers_", suffix=".pids")
+    os.close(handle)
+    return path
+
+# Helpers still registered after a run ended (Excel that failed to quit) are orphans
+def stop_orphan_helpers(helper_pids_path, script_label):
+    orphans = read_helper_pids(helper_pids_path)
+    if orphans:
+        logger.warning(f"{script_label} left helper process(es) {sorted(orphans)} running, stopping them")
+        for pid in orphans:
+            signal_pid(pid, kill=True)
+
+def pass_output(stream, idle):
+    for line in stream:
+        sys.stdout.write(line)
+        if line.rstrip().endswith(IDLE_MESSAGES):
+            idle.append(line)
+    sys.stdout.flush()
+
+# One line per run with its duration and exit status; stopped is how a timed-out run ended
+def log_finished(script_label, code, started, stopped=None):
+    duration = time.monotonic() - started
+    if stopped:
+        status = "" if code is None else f" (exit code {code})"
+        logger.error(f"{script_label} timed out and was {stopped} after {duration:.1f} s{status}")
+    elif code != 0:
+        logger.warning(f"{script_label} exited with code {code} after {duration:.1f} s")
+    else:
+        logger.info(f"{script_label} finished in {duration:.1f} s")
+
+# Returns True when the run found work, False when it reported nothing new, None on failure.
+# The script's console output is passed through line by line and checked for IDLE_MESSAGES.
+# A run past its timeout is stopped with its whole process tree.
+def run_subprocess(script_path, script_label, args=(), limits=default_limits):
+    helper_pids_path = None
     try:
         logger.info(f"Running {script_label}...")
-        result = subprocess.run([sys.executable, script_path])
-        if result.returncode != 0:
-            logger.warning(f"{script_label} exited with code {result.returncode}")
+        idle = []
+        helper_pids_path = new_helper_pids_path()
+        started = time.monotonic()
+        with metrics.span(script_label, files=len(args)) as span:
+            process = subprocess.Popen(
+                launch_command([sys.executable, script_path, *args], limits), stdout=subprocess.PIPE,
+                text=True, errors="replace", env={**os.environ, HELPER_PIDS_ENV: helper_pids_path},
+                **popen_group_options(),
+            )
+            try:
+                job_object = limit_started_process(process, limits)
+            except Exception as e:
+                job_object = None
+                logger.warning(f"Could not apply resource limits to {script_label}: {e}")
+            reader = threading.Thread(target=pass_output, args=(process.stdout, idle), daemon=True)
+            reader.start()
+            stopped = None
+            if not wait_for_exit(process, limits.timeout_seconds):
+                logger.warning(f"{script_label} passed its {limits.timeout_seconds / 60:g} minute timeout, stopping it")
+                stopped = stop_tree(process, limits.grace_seconds, helper_pids_path)
+                span["timed_out"] = True
+            reader.join(limits.grace_seconds)
+            span["exit_code"] = process.returncode
+            if job_object is not None:
+                job_object.Close()
+        log_finished(script_label, process.returncode, started, stopped)
+        stop_orphan_helpers(helper_pids_path, script_label)
+        if stopped or process.returncode != 0:
+            return None
+        return not idle
     except Exception as e:
         logger.error(f"Failed to run {script_label}: {e}")
+        return None
+    finally:
+        if helper_pids_path:
+            try:
+                os.remove(helper_pids_path)
+            except OSError:
+                pass
+
+# --- Persistent worker mode: the task scripts stay imported between runs (task_worker.py) ---
+# One worker per script, so concurrently scheduled jobs do not wait for each other. A run that
+# finds its worker busy (a concurrent overlap policy) goes to a subprocess instead.
+# Config changes reach the scripts when the worker is next recycled. A worker's CPU and memory
+# limits come from the first job that uses its script; the timeout applies per run.
+task_workers = {}
+task_workers_lock = threading.Lock()
+
+def task_worker_for(script_path, limits):
+    with task_workers_lock:
+        if script_path not in task_workers:
+            task_workers[script_path] = TaskWorker(
+                script_dir, worker_max_runs, worker_max_memory_mb, limits, new_helper_pids_path())
+        return task_workers[script_path]
+
+def run_task(script_path, script_label, args=(), limits=default_limits):
+    if worker_mode != "persistent":
+        return run_subprocess(script_path, script_label, args, limits)
+    task_worker = task_worker_for(script_path, limits)
+    if not task_worker.lock.acquire(blocking=False):
+        return run_subprocess(script_path, script_label, args, limits)
+    try:
+        logger.info(f"Running {script_label} in the task worker...")
+        started = time.monotonic()
+        with metrics.span(script_label, files=len(args), worker=True) as span:
+            try:
+                code, result, recycled = task_worker.run(script_path, args, limits.timeout_seconds)
+            except TimeoutError as e:
+                span["timed_out"] = True
+                log_finished(script_label, None, started, stopped=f"{e} with its worker")
+                return None
+            span["exit_code"] = code
+        log_finished(script_label, code, started)
+        stop_orphan_helpers(task_worker.helper_pids_path, script_label)
+        if recycled:
+            logger.info(f"Task worker recycled after {recycled}")
+        # cli() returns the number of files processed or copied
+        return result > 0 if code == 0 and isinstance(result, int) else None
+    except Exception as e:
+        if not running:
+            logger.warning(f"Task worker stopped during shutdown: {e}")
+            return None
+        logger.warning(f"Task worker failed ({e}), running {script_label} as a subprocess instead")
+        return run_subprocess(script_path, script_label, args, limits)
+    finally:
+        task_worker.lock.release()
+
+def stop_task_workers():
+    with task_workers_lock:
+        for task_worker in task_workers.values():
+            task_worker.stop()
+            try:
+                os.remove(task_worker.helper_pids_path)
+            except OSError:
+                pass
+
+# --- Polling mode: jobs from "schedule_jobs" (job_scheduler.py) ---
+# Without it, processing runs every interval_minutes at a fixed rate and the copy starts as soon
+# as each processing run finishes, so a slow copy never delays the next processing run.
+# "adaptive": true makes an interval job poll between min_interval_minutes (its
+# interval_minutes) and max_interval_minutes, depending on whether runs find new files.
+def job_schedule(job_config):
+    if job_config.get('cron'):
+        return CronSchedule(job_config['cron'])
+    if job_config.get('interval_minutes'):
+        if job_config.get('adaptive'):
+            return AdaptiveSchedule(
+                job_config['interval_minutes'] * 60,
+                job_config.get('max_interval_minutes', max_interval_minutes) * 60,
+                job_config.get('backoff_factor', interval_backoff_factor),
+            )
+        return IntervalSchedule(job_config['interval_minutes'] * 60)
+    return None
+
+def run_scheduled_script(script_path, limits=default_limits):
+    found_work = run_task(script_path, os.path.basename(script_path), limits=limits)
+    metrics.flush(logger)
+    return found_work
+
+def scheduled_jobs(process_path, robocopy_path, interval_minutes):
+    scripts = {"process": process_path, "copy": robocopy_path}
+    job_configs = config.get('schedule_jobs') or [
+        {"name": "process", "interval_minutes": min_interval_minutes if adaptive_interval else interval_minutes,
+         "adaptive": adaptive_interval, "overlap": "skip"},
+        {"name": "copy", "after": "process", "overlap": "queue"},
+    ]
+    jobs = []
+    for job_config in job_configs:
+        name = job_config['name']
+        script_path = os.path.join(script_dir, job_config['script']) if job_config.get('script') else scripts.get(name)
+        if script_path is None:
+            raise ValueError(f"job {name} needs a script")
+        schedule = job_schedule(job_config)
+        if schedule is None and not job_config.get('after'):
+            raise ValueError(f"job {name} needs interval_minutes, cron or after")
+        limits = job_limits(job_config)
+        jobs.append(ScheduledJob(
+            name, lambda script_path=script_path, limits=limits: run_scheduled_script(script_path, limits),
+            schedule, job_config.get('after'), job_config.get('overlap', 'skip'),
+        ))
+    return jobs
 
 def main(process_path, robocopy_path, interval_minutes):
-    while running:
-        run_subprocess(process_path, os.path.basename(process_path))
-        run_subprocess(robocopy_path, os.path.basename(robocopy_path))
-        logger.info(f"Waiting {interval_minutes} minutes before next run...")
-        for i in range(interval_minutes * 60):
-            if not running:
-                break
-            time.sleep(1)
+    try:
+        jobs = scheduled_jobs(process_path, robocopy_path, interval_minutes)
+    except Exception as e:
+        logger.error(f"Invalid schedule_jobs in config: {e}")
+        sys.exit(1)
+    JobScheduler(jobs, logger).run(lambda: running)
+
+# --- Event-driven mode: react to filesystem notifications, with a slow full rescan as a safety net ---
+# Larger batches run as a normal full pass rather than on an overlong command line.
+MAX_BATCH_ARGS = 100
+
+def run_batch(script_path, paths):
+    label = os.path.basename(script_path)
+    if len(paths) > MAX_BATCH_ARGS:
+        run_task(script_path, label)
+    else:
+        logger.info(f"{len(paths)} changed file(s) for {label}")
+        run_task(script_path, label, paths)
+
+def watch_main(process_path, robocopy_path, interval_minutes):
+    # A raw file is only handed over once it has been quiet long enough for PythonTask to accept it
+    batcher = EventBatcher(
+        raw_file_source, copy_sources,
+        max(watch_debounce_seconds, input_stable_seconds), watch_debounce_seconds,
+    )
+    observer = start_observer(batcher, logger) if raw_file_source else None
+    if observer is None:
+        logger.warning(f"Event-driven mode unavailable, polling every {interval_minutes} minutes instead")
+        return main(process_path, robocopy_path, interval_minutes)
+    logger.info(f"Watching {raw_file_source} for changes (full rescan every {watch_rescan_minutes} minutes)")
+    next_rescan = 0
+    try:
+        while running:
+            if time.monotonic() >= next_rescan:
+                run_task(process_path, os.path.basename(process_path))
+                run_task(robocopy_path, os.path.basename(robocopy_path))
+                metrics.flush(logger)
+                next_rescan = time.monotonic() + watch_rescan_minutes * 60
+                continue
+            ready = batcher.pop_ready()
+            if ready["raw"]:
+                run_batch(process_path, [os.path.basename(path) for path in ready["raw"]])
+            if ready["processed"]:
+                run_batch(robocopy_path, ready["processed"])
+            metrics.flush(logger)
+            time.sleep(0.5)
+    finally:
+        observer.stop()
+        observer.join()
+
+# log_mode "queue": this process becomes the only writer of Master.log, and every script it
+# starts sends its log lines here (master_log.py)
+def start_log_server():
+    if log_mode != "queue":
+        return None
+    try:
+        log_server = MasterLogServer(log_path, log_flush_seconds).start()
+    except Exception as e:
+        logger.warning(f"Log server unavailable, scripts will write Master.log directly: {e}")
+        return None
+    log_server.take_over(logger)
+    logger.info(f"Log server listening on {log_server.address}")
+    return log_server
+
+# Rotated logs are compressed and pruned on a thread of their own, in both polling and watch mode
+# (log_archive.py). A log_maintenance_minutes of 0 turns it off.
+def start_log_maintenance():
+    if not log_maintenance_minutes:
+        return None
+    log_folder = os.path.dirname(log_path)
+    job = ScheduledJob(
+        "log_maintenance",
+        lambda: any(maintain_logs(log_folder, log_compression, log_retention_days, log_retention_max_mb, logger,
+                                  metrics.folder)),
+        IntervalSchedule(log_maintenance_minutes * 60),
+    )
+    thread = threading.Thread(target=JobScheduler([job], logger).run, args=(lambda: running,),
+                              name="log-maintenance", daemon=True)
+    thread.start()
+    return thread
 
 if __name__ == "__main__":
-    main(process_path, robocopy_path, interval_minutes)
\ No newline at end of file
+    log_server = start_log_server()
+    log_maintenance = start_log_maintenance()
+    try:
+        if watch_mode:
+            watch_main(process_path, robocopy_path, interval_minutes)
+        else:
+            main(process_path, robocopy_path, interval_minutes)
+    finally:
+        stop_task_workers()
+        if log_maintenance is not None:
+            running = False
+            log_maintenance.join()
+        if log_server is not None:
+            log_server.stop()
@@ -0,0 +1,359 @@
+import re
+import codecs
+import zipfile
+from copy import copy
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, Alignment, Font, PatternFill, Border, Side, Protection
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.worksheet.datavalidation import DataValidation
+from openpyxl.worksheet.formula import ArrayFormula
+
+SHEET_PASSWORD = "password"
+
+# --- Shared style pieces ---
+def solid_fill(color):
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+LEFT = Alignment(horizontal="left")
+LOCKED = Protection(locked=True)
+UNLOCKED = Protection(locked=False)
+THIN_BORDER = Border(bottom=Side(style='thin'), right=Side(style='thin'), left=Side(style='thin'), top=Side(style='thin'))
+HEADER_STYLE = dict(font=Font(bold=True), fill=solid_fill("D3D3D3"), border=THIN_BORDER,
+                    alignment=Alignment(wrap_text=True), protection=LOCKED)
+
+# --- Derived totals computed from the data instead of by Excel ---
+# Fed one DataFrame chunk at a time, so they work the same for streamed and in-memory files.
+class SerumTotals:
+    # J2: sum over donors (column D) of the maximum column F value
+    def __init__(self, plan):
+        self.donor = plan.source("D")
+        self.litres = plan.source("F")
+        self.max_by_donor = {}
+
+    def update(self, chunk):
+        if self.donor is None or self.litres is None or self.litres >= chunk.shape[1]:
+            return
+        litres = pd.to_numeric(chunk.iloc[:, self.litres], errors="coerce")
+        for donor, value in litres.groupby(chunk.iloc[:, self.donor]).max().items():
+            if pd.notna(value) and (donor not in self.max_by_donor or value > self.max_by_donor[donor]):
+                self.max_by_donor[donor] = value
+
+    def values(self):
+        return {"J2": float(sum(self.max_by_donor.values()))}
+
+class BPTotals:
+    # N2/O2/Q2 with column G (SFF Net Weight) still blank, so Volume (I) equals Volume Recorded (H)
+    def __init__(self, plan):
+        self.volume = plan.source("H")
+        self.decision = plan.source("M")
+        self.sff_weight = plan.source("P")
+        self.rejected = 0.0
+        self.accepted = 0.0
+        self.first_sff_weight = None
+        self.seen_first_row = False
+
+    def column(self, chunk, index):
+        if index is None or index >= chunk.shape[1]:
+            return None
+        return chunk.iloc[:, index]
+
+    def update(self, chunk):
+        volume = self.column(chunk, self.volume)
+        decision = self.column(chunk, self.decision)
+        if volume is not None and decision is not None:
+            volume = pd.to_numeric(volume, errors="coerce").fillna(0)
+            decision = decision.astype(str).str.lower()
+            self.rejected += float(volume[decision == "reject"].sum())
+            self.accepted += float(volume[decision == "accept"].sum())
+        sff_weight = self.column(chunk, self.sff_weight)
+        if not self.seen_first_row and len(chunk):
+            self.seen_first_row = True
+            if sff_weight is not None:
+                self.first_sff_weight = pd.to_numeric(sff_weight.iloc[:1], errors="coerce").iloc[0]
+
+    def values(self):
+        sff_blank = self.first_sff_weight is None or pd.isna(self.first_sff_weight)
+        sff_litres = 0.0 if sff_blank else float(self.first_sff_weight) * 0.959
+        accepted = self.accepted if sff_blank else sff_litres - self.rejected
+        return {"N2": self.rejected, "O2": accepted, "Q2": sff_litres}
+
+# --- Declarative sheet layouts ---
+# "styles" are registered as named styles on the output workbook. "columns" is keyed by final
+# column letter; a column with "insert" is placed by the layout (None for a blank entry column,
+# or a formula template using {row}), every other column takes the next CSV column in order.
+# "header" replaces the CSV header text and "first_row" replaces the value in row 2.
+# "totals" computes cached values for the row-2 formulas ("cache_totals": always or only when
+# derived values are precomputed) and "cached_from" caches a formula column as another column's value.
+
+# Sum of the per-donor (column D) maximum of column F, written as an array formula
+SERUM_TOTAL_FORMULA = '=SUM(_xlfn.MAXIFS(F2:F1048576,D2:D1048576,_xlfn.UNIQUE(D2:D1048576)))'
+
+SERUM_LAYOUT = {
+    "styles": {
+        "Serum Header": HEADER_STYLE,
+        "Serum Integer": dict(number_format="0", alignment=LEFT),
+        "Serum Weight": dict(number_format="0.000", alignment=LEFT),
+        "Serum Litres": dict(number_format="0.00", alignment=LEFT),
+    },
+    "header_style": "Serum Header",
+    "default_style": "Serum Litres",
+    "totals": SerumTotals,
+    "cache_totals": "always",
+    "min_columns": 10,
+    "columns": {
+        "A": {"width": 28},
+        "B": {"auto_size": True},
+        "C": {"auto_size": True},
+        "D": {"style": "Serum Integer"},
+        "E": {"header": "Weight (kg)", "style": "Serum Weight", "width": 8},
+        "G": {"header": "Total Weight (kg)", "style": "Serum Weight", "width": 12},
+        "H": {"width": 14},
+        "I": {"width": 14},
+        "J": {"header": "Total Litres Processed", "width": 11,
+              "first_row": ArrayFormula("J2", SERUM_TOTAL_FORMULA)},
+    },
+}
+
+BP_LAYOUT = {
+    "styles": {
+        "BP Header": HEADER_STYLE,
+        "BP Text": dict(alignment=LEFT, protection=LOCKED),
+        "BP Entry": dict(alignment=LEFT, protection=UNLOCKED),
+        "BP Integer": dict(number_format="0", alignment=LEFT, protection=LOCKED),
+        "BP Weight": dict(number_format="0.000", alignment=LEFT, protection=LOCKED),
+        "BP Weight Entry": dict(number_format="0.000", alignment=LEFT, protection=UNLOCKED),
+        "BP Weight Total": dict(number_format="0.000", alignment=LEFT, protection=LOCKED, fill=solid_fill("FFFF00")),
+        "BP Litres": dict(number_format="0.00", alignment=LEFT, protection=LOCKED),
+        "BP Litres Total": dict(number_format="0.00", alignment=LEFT, protection=LOCKED, fill=solid_fill("FFFF00")),
+    },
+    "header_style": "BP Header",
+    "default_style": "BP Text",
+    "totals": BPTotals,
+    "cache_totals": "precompute",
+    "header_height": 30,
+    "min_columns": 17,
+    "columns": {
+        "A": {"width": 29},
+        "B": {"width": 23},
+        "C": {"width": 10.5},
+        "D": {"style": "BP Integer", "width": 9},
+        "E": {"header": "Gross Weight (kg)", "style": "BP Weight", "width": 12},
+        "F": {"header": "Net Weight (kg)", "style": "BP Weight", "width": 11},
+        "G": {"header": "SFF Net Weight (kg)", "style": "BP Weight Entry", "width": 12, "insert": None},
+        "H": {"header": "Volume Recorded (L)", "style": "BP Litres", "width": 13},
+        "I": {"header": "Volume (L)", "style": "BP Litres", "width": 12,
+              "insert": '=IF(G{row}="", H{row}, G{row}*0.959)', "cached_from": "H"},
+        "J": {"header": "Total Gross Weight (kg)", "style": "BP Weight", "width": 12},
+        "K": {"header": "Total Net Weight (kg)", "style": "BP Weight Total", "width": 12},
+        "L": {"header": "Total Volume (L)", "style": "BP Litres", "width": 11},
+        "M": {"header": "Accept / Reject", "style": "BP Entry", "width": 11},
+        "N": {"header": "Total Litres Rejected", "style": "BP Litres", "width": 11,
+              "first_row": '=SUMIF(M:M, "Reject", I:I)'},
+        "O": {"header": "Total Litres Accepted", "style": "BP Litres", "width": 13,
+              "first_row": '=IF(ISBLANK(P2), SUMIF(M2:M1048576, "Accept", I2:I1048576), Q2-N2)',
+              "first_row_style": "BP Litres Total"},
+        "P": {"header": "Total SFF Net Weight (kg)", "width": 13, "first_row_style": "BP Entry"},
+        "Q": {"header": "SFF Litres", "style": "BP Litres", "first_row": "=P2*0.959"},
+    },
+    "conditional_formats": [
+        ("P2", 'AND(P2<>"", ABS(P2 - SUM(F2:F1087)) > 0.2)', "FF0000"),
+        ("G2:G{last_row}", 'AND(G2<>"", M2="Accept")', "EC4F28"),
+    ],
+    "validations": [
+        dict(range="M2:M1048", type="list", formula1='"Accept,Reject"', showDropDown=False, allowBlank=False,
+             showErrorMessage=True, errorTitle="Invalid Entry",
+             error="Please select either Accept or Reject from the dropdown list"),
+    ],
+}
+
+# --- Compiled style plan ---
+# Compiling resolves a layout against one workbook and one CSV header: named styles are bound
+# once and every column gets its source index and the StyleArrays to stamp on its cells, so
+# writing a row is a single pass with no per-cell style lookups.
+class ColumnPlan:
+    def __init__(self, letter, source, header, header_style, body_style, first_row_style, insert, first_row):
+        self.letter = letter
+        self.source = source
+        self.header = header
+        self.header_style = header_style
+        self.body_style = body_style
+        self.first_row_style = first_row_style
+        self.insert = insert
+        self.first_row = first_row
+
+class StylePlan:
+    def __init__(self, layout, columns):
+        self.layout = layout
+        self.columns = columns
+
+    def source(self, letter):
+        for column in self.columns:
+            if column.letter == letter:
+                return column.source
+        return None
+
+    def prepare(self, ws):
+        # Column and row dimensions have to be set before a write-only sheet gets rows
+        if "header_height" in self.layout:
+            ws.row_dimensions[1].height = self.layout["header_height"]
+        for letter, spec in self.layout["columns"].items():
+            if spec.get("auto_size"):
+                ws.column_dimensions[letter].auto_size = True
+            if "width" in spec:
+                ws.column_dimensions[letter].width = spec["width"]
+
+    def header_row(self, ws):
+        return [self.cell(ws, column.header, column.header_style) for column in self.columns]
+
+    def row(self, ws, values, row_idx):
+        cells = []
+        for column in self.columns:
+            if column.source is None:
+                value = column.insert.format(row=row_idx) if column.insert else None
+            else:
+                value = values[column.source] if column.source < len(values) else None
+            style = column.body_style
+            if row_idx == 2:
+                if column.first_row is not None:
+                    value = column.first_row
+                style = column.first_row_style
+            cells.append(self.cell(ws, value, style))
+        return cells
+
+    def cell(self, ws, value, style):
+        cell = WriteOnlyCell(ws, value)
+        cell._style = copy(style)
+        return cell
+
+    def finish(self, ws, last_row):
+        for cell_range, formula, color in self.layout.get("conditional_formats", []):
+            rule = FormulaRule(formula=[formula], fill=solid_fill(color))
+            ws.conditional_formatting.add(cell_range.format(last_row=last_row), rule)
+        for spec in self.layout.get("validations", []):
+            spec = dict(spec)
+            cell_range = spec.pop("range")
+            dv = DataValidation(**spec)
+            dv.add(cell_range)
+            ws.data_validations.append(dv)
+        ws.protection.sheet = True
+        ws.protection.set_password(SHEET_PASSWORD)
+
+# A style without a font of its own gets the workbook default (Calibri 11), which is what the
+# cells showed when they were formatted one by one; a NamedStyle would otherwise write an empty font
+def register_styles(wb, layout):
+    styles = {}
+    for name, spec in layout["styles"].items():
+        if name not in wb.named_styles:
+            wb.add_named_style(NamedStyle(name=name, **{"font": copy(DEFAULT_FONT), **spec}))
+        styles[name] = next(style for style in wb._named_styles if style.name == name).as_tuple()
+    return styles
+
+def compile_plan(layout, wb, csv_header):
+    styles = register_styles(wb, layout)
+    columns = []
+    source = 0
+    col_idx = 1
+    while source < len(csv_header) or col_idx <= layout["min_columns"]:
+        letter = get_column_letter(col_idx)
+        spec = layout["columns"].get(letter, {})
+        body_style = styles[spec.get("style", layout["default_style"])]
+        first_row_style = styles[spec["first_row_style"]] if "first_row_style" in spec else body_style
+        if "insert" in spec:
+            column_source, header = None, None
+        else:
+            column_source = source
+            header = csv_header[source] if source < len(csv_header) else None
+            source += 1
+        columns.append(ColumnPlan(
+            letter, column_source, spec.get("header", header), styles[layout["header_style"]],
+            body_style, first_row_style, spec.get("insert"), spec.get("first_row"),
+        ))
+        col_idx += 1
+    return StylePlan(layout, columns)
+
+# --- Write a whole sheet in one pass: header, styled rows, then rules and protection ---
+# chunks is an iterable of DataFrames (one for an in-memory file, many when streaming).
+# Returns the cached values to store for the row-2 totals formulas.
+def write_sheet(wb, ws, layout, csv_header, chunks, precompute=False):
+    plan = compile_plan(layout, wb, csv_header)
+    totals = layout["totals"](plan) if "totals" in layout else None
+    plan.prepare(ws)
+    ws.append(plan.header_row(ws))
+    row_idx = 1
+    for chunk in chunks:
+        if totals:
+            totals.update(chunk)
+        for values in chunk.itertuples(index=False, name=None):
+            row_idx += 1
+            ws.append(plan.row(ws, values, row_idx))
+    if row_idx == 1:
+        # No data rows: still emit the row-2 totals so the formulas are in place
+        row_idx = 2
+        ws.append(plan.row(ws, (), row_idx))
+    plan.finish(ws, row_idx)
+    if totals and (layout.get("cache_totals") == "always" or precompute):
+        return totals.values()
+    return {}
+
+def cached_columns(layout, precompute=False):
+    if not precompute:
+        return {}
+    return {letter: spec["cached_from"] for letter, spec in layout["columns"].items() if "cached_from" in spec}
+
+# --- Cached values for formula cells ---
+# openpyxl always writes formulas with an empty <v/>. This rewrites the saved package, streaming
+# the worksheet XML through in blocks of whole rows, and fills in the cached value of every formula
+# cell listed in values ({"J2": 12.5}) or in columns ({"I": "H"}: I takes the value of H in its row).
+FORMULA_CELL = re.compile(r'<c r="([A-Z]+)(\d+)"([^>]*)><f([^>]*)>([^<]*)</f><v\s*/></c>')
+VALUE_CELL = re.compile(r'<c r="[A-Z]+\d+"[^>]*><v>([^<]*)</v></c>')
+
+def cached_value_text(value):
+    if value is None or pd.isna(value):
+        return None
+    return repr(float(value))
+
+def fill_cached_values(text, values, columns):
+    def fill(match):
+        col, row = match.group(1), match.group(2)
+        coordinate = f"{col}{row}"
+        if coordinate in values:
+            value = cached_value_text(values[coordinate])
+        elif col in columns:
+            source_cell = f'<c r="{columns[col]}{row}"'
+            start = text.rfind(source_cell, 0, match.start())
+            source = VALUE_CELL.match(text, start) if start != -1 else None
+            value = source.group(1) if source else "0"
+        else:
+            return match.group(0)
+        if value is None:
+            return match.group(0)
+        return f'<c r="{coordinate}"{match.group(3)}><f{match.group(4)}>{match.group(5)}</f><v>{value}</v></c>'
+    return FORMULA_CELL.sub(fill, text)
+
+def write_cached_values(src_path, dest_path, values, columns=None, sheet="xl/worksheets/sheet1.xml"):
+    columns = columns or {}
+    with zipfile.ZipFile(src_path) as src, zipfile.ZipFile(dest_path, "w", zipfile.ZIP_DEFLATED) as dest:
+        for item in src.infolist():
+            if item.filename != sheet:
+                dest.writestr(item, src.read(item.filename))
+                continue
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            with src.open(item) as fin, dest.open(item.filename, "w", force_zip64=True) as fout:
+                pending = ""
+                while True:
+                    block = fin.read(1024 * 1024)
+                    pending += decoder.decode(block, final=not block)
+                    if block:
+                        cut = pending.rfind("</row>")
+                        if cut == -1:
+                            continue
+                        cut += len("</row>")
+                    else:
+                        cut = len(pending)
+                    fout.write(fill_cached_values(pending[:cut], values, columns).encode("utf-8"))
+                    pending = pending[cut:]
+                    if not block:
+                        break
@@ -0,0 +1,153 @@
+import os
+import time
+import sqlite3
+
+# --- SYNC MANIFEST ---
+# What robocopy.py has already copied for each source -> destination pair: size and mtime of
+# every file, and the mtime of every source directory as of its last complete pass. A directory
+# whose mtime has not moved has had no file added, removed or renamed, so its listing is skipped.
+
+# Suffix of files still being written (renamed into place when complete); never copied
+PARTIAL_SUFFIX = ".part"
+
+def pair_key(source, destination):
+    return f"{os.path.normcase(os.path.abspath(source))} -> {os.path.normcase(os.path.abspath(destination))}"
+
+class PairManifest:
+    def __init__(self, key, dirs, load_files):
+        self.key = key
+        self.dirs = dirs
+        # File entries are read per directory, only for directories that actually get listed
+        self.load_files = load_files
+        self.files = {}
+        self.loaded_dirs = set()
+        self.children = {}
+        for rel_dir in dirs:
+            if rel_dir:
+                self.children.setdefault(os.path.dirname(rel_dir), []).append(rel_dir)
+        self.file_updates = []
+        self.dir_updates = []
+
+    def ensure_loaded(self, rel_dir):
+        if rel_dir not in self.loaded_dirs:
+            self.loaded_dirs.add(rel_dir)
+            self.files.update(self.load_files(self.key, rel_dir))
+
+    def file_unchanged(self, rel_path, stat):
+        return self.is_current(rel_path, stat.st_size, stat.st_mtime_ns)
+
+    def is_current(self, rel_path, size, mtime_ns):
+        self.ensure_loaded(os.path.dirname(rel_path))
+        return self.files.get(rel_path) == (size, mtime_ns)
+
+    def dir_unchanged(self, rel_dir, stat):
+        return self.dirs.get(rel_dir) == stat.st_mtime_ns
+
+    def child_dirs(self, rel_dir):
+        return self.children.get(rel_dir, [])
+
+    # content_hash is the SHA-256 of the copied source when copies are verified. An entry that
+    # is already current is left alone, so a verify pass does not drop its recorded checksum.
+    def record_file(self, rel_path, size, mtime_ns, content_hash=None):
+        if content_hash is None and self.is_current(rel_path, size, mtime_ns):
+            return
+        self.files[rel_path] = (size, mtime_ns)
+        self.file_updates.append((self.key, rel_path, os.path.dirname(rel_path), size, mtime_ns, content_hash))
+
+    def record_dir(self, rel_dir, mtime_ns):
+        if rel_dir and rel_dir not in self.dirs:
+            self.children.setdefault(os.path.dirname(rel_dir), []).append(rel_dir)
+        self.dirs[rel_dir] = mtime_ns
+        self.dir_updates.append((self.key, rel_dir, mtime_ns))
+
+class SyncManifest:
+    def __init__(self, db_path):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # A lost update only means a file is compared (not copied) again on the next run
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS manifest_files ("
+            "pair TEXT NOT NULL, rel_path TEXT NOT NULL, rel_dir TEXT NOT NULL, "
+            "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, content_hash TEXT, PRIMARY KEY (pair, rel_path))"
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(manifest_files)")]
+        if "content_hash" not in columns:
+            self.conn.execute("ALTER TABLE manifest_files ADD COLUMN content_hash TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS manifest_files_dir ON manifest_files (pair, rel_dir)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS manifest_dirs ("
+            "pair TEXT NOT NULL, rel_dir TEXT NOT NULL, mtime_ns INTEGER NOT NULL, PRIMARY KEY (pair, rel_dir))"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS manifest_meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        self.pairs = {}
+
+    def pair(self, source, destination):
+        key = pair_key(source, destination)
+        if key not in self.pairs:
+            dirs = {
+                row[0]: row[1]
+                for row in self.conn.execute("SELECT rel_dir, mtime_ns FROM manifest_dirs WHERE pair = ?", (key,))
+            }
+            self.pairs[key] = PairManifest(key, dirs, self.load_files)
+        return self.pairs[key]
+
+    def load_files(self, key, rel_dir):
+        rows = self.conn.execute(
+            "SELECT rel_path, size, mtime_ns FROM manifest_files WHERE pair = ? AND rel_dir = ?", (key, rel_dir))
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def save(self, pair):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO manifest_files (pair, rel_path, rel_dir, size, mtime_ns, content_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                pair.file_updates,
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO manifest_dirs (pair, rel_dir, mtime_ns) VALUES (?, ?, ?)",
+                pair.dir_updates,
+            )
+        pair.file_updates = []
+        pair.dir_updates = []
+
+    # After a full verify pass, entries for files and directories that no longer exist are dropped
+    def prune(self, pair, seen_files, seen_dirs):
+        stale_files = [
+            (pair.key, row[0])
+            for row in self.conn.execute("SELECT rel_path FROM manifest_files WHERE pair = ?", (pair.key,))
+            if row[0] not in seen_files
+        ]
+        stale_dirs = [(pair.key, rel_dir) for rel_dir in pair.dirs if rel_dir not in seen_dirs]
+        with self.conn:
+            self.conn.executemany("DELETE FROM manifest_files WHERE pair = ? AND rel_path = ?", stale_files)
+            self.conn.executemany("DELETE FROM manifest_dirs WHERE pair = ? AND rel_dir = ?", stale_dirs)
+        for _, rel_path in stale_files:
+            pair.files.pop(rel_path, None)
+        for _, rel_dir in stale_dirs:
+            del pair.dirs[rel_dir]
+            siblings = pair.children.get(os.path.dirname(rel_dir), [])
+            if rel_dir in siblings:
+                siblings.remove(rel_dir)
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM manifest_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO manifest_meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def full_verify_due(self, interval_hours):
+        last = float(self.get_meta("last_full_verify", 0))
+        return time.time() - last >= interval_hours * 3600
+
+    def mark_full_verify(self):
+        self.set_meta("last_full_verify", time.time())
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,71 @@
+import os
+
+# --- SYNC PLAN ---
+# Copy jobs come from the "copy_jobs" list in config.json, or from the older bp/serum keys. Jobs
+# that copy the same tree to the same place are merged, so every distinct tree is walked once:
+# identical source and destination, or a source nested inside another job's source whose
+# destination is the matching subfolder of that job's destination.
+class SyncJob:
+    def __init__(self, name, source, destination, workers=1):
+        self.name = name
+        self.source = source
+        self.destination = destination
+        self.workers = workers
+        # (name, reason) for every job folded into this one
+        self.merged = []
+
+    def key(self):
+        return normalize_path(self.source), normalize_path(self.destination)
+
+def normalize_path(path):
+    return os.path.normcase(os.path.abspath(path))
+
+def is_within(path, parent):
+    return path == parent or path.startswith(parent.rstrip(os.sep) + os.sep)
+
+def configured_jobs(config):
+    copy_workers = config.get('copy_workers', 1)
+    if config.get('copy_jobs'):
+        return [
+            SyncJob(job.get('name', f"job{index + 1}"), job['source'], job['destination'],
+                    job.get('workers', copy_workers))
+            for index, job in enumerate(config['copy_jobs'])
+        ]
+    jobs = []
+    for name in ("bp", "serum"):
+        source = config.get(f'{name}_copy_source')
+        destination = config.get(f'{name}_copy_dest')
+        if source and destination:
+            jobs.append(SyncJob(name, source, destination, config.get(f'{name}_copy_workers', copy_workers)))
+    return jobs
+
+# Returns the reason kept already covers job, or None
+def covered_by(kept, job):
+    kept_source, kept_dest = kept.key()
+    source, dest = job.key()
+    if (source, dest) == (kept_source, kept_dest):
+        return "same source and destination"
+    if is_within(source, kept_source) and dest == os.path.join(kept_dest, os.path.relpath(source, kept_source)):
+        return f"nested in {kept.source}"
+    return None
+
+# Returns (planned jobs, rejected jobs with their reason)
+def plan_jobs(jobs):
+    planned = []
+    rejected = []
+    # Outer trees first, so a nested job always meets the job that covers it
+    for job in sorted(jobs, key=lambda job: len(job.key()[0])):
+        source, dest = job.key()
+        if is_within(dest, source):
+            # The sweep would copy the destination into itself on every run
+            rejected.append((job, "destination is inside the source"))
+            continue
+        for kept in planned:
+            reason = covered_by(kept, job)
+            if reason:
+                kept.merged.append((job.name, reason))
+                kept.workers = max(kept.workers, job.workers)
+                break
+        else:
+            planned.append(SyncJob(job.name, job.source, job.destination, job.workers))
+    return planned, rejected
@@ -0,0 +1,155 @@
+import os
+import sys
+import signal
+import threading
+import importlib.util
+import multiprocessing
+from process_tree import (ChildLimits, HELPER_PIDS_ENV, apply_rlimits, cpu_time_used, limit_started_process,
+                          stop_tree)
+
+# --- PERSISTENT TASK WORKER ---
+# A child process that imports the task scripts once and then runs their cli() entry point for
+# every request, so pandas, openpyxl and the loggers are only set up on the first run. The
+# scheduler replaces it after max_runs runs or once its memory use passes max_memory_mb. A
+# crashed worker only fails the run in progress; the next run starts a fresh one. A run that
+# passes its timeout stops the worker's whole process tree (process_tree.py).
+
+def memory_mb():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        # Without psutil or /proc, workers are only recycled by run count
+        return None
+
+def load_script(script_path, modules):
+    if script_path not in modules:
+        name = os.path.splitext(os.path.basename(script_path))[0]
+        spec = importlib.util.spec_from_file_location(name, script_path)
+        module = importlib.util.module_from_spec(spec)
+        # Registered before running so pool workers spawned by the script can import it by name
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        modules[script_path] = module
+    return modules[script_path]
+
+def exit_code(e):
+    if e.code is None:
+        return 0
+    return e.code if isinstance(e.code, int) else 1
+
+def worker_loop(conn, script_dir, helper_pids_path, limits):
+    # Same signal behaviour and process group handling as a script started with subprocess
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if hasattr(os, "setsid"):
+        os.setsid()
+    os.environ[HELPER_PIDS_ENV] = helper_pids_path
+    if os.name != "nt" and limits.memory_mb:
+        apply_rlimits(memory_mb=limits.memory_mb)
+    sys.path.insert(0, script_dir)
+    modules = {}
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        script_path, args = request
+        if os.name != "nt" and limits.cpu_seconds:
+            # Each run gets its own CPU budget on top of what the worker has used so far
+            apply_rlimits(cpu_seconds=limits.cpu_seconds, cpu_used=cpu_time_used())
+        result = None
+        try:
+            result = load_script(script_path, modules).cli(list(args))
+            code = 0
+        except SystemExit as e:
+            code = exit_code(e)
+        except Exception as e:
+            print(f"Unhandled error in {os.path.basename(script_path)}: {e}", file=sys.stderr)
+            code = 1
+        conn.send((code, result, memory_mb()))
+
+class TaskWorker:
+    def __init__(self, script_dir, max_runs=50, max_memory_mb=1024, limits=None, helper_pids_path=None):
+        self.script_dir = script_dir
+        self.max_runs = max_runs
+        self.max_memory_mb = max_memory_mb
+        # CPU and memory limits hold for every run; the timeout is passed per run
+        self.limits = limits or ChildLimits()
+        self.helper_pids_path = helper_pids_path or ""
+        self.process = None
+        self.conn = None
+        self.job_object = None
+        self.runs = 0
+        # Held by the caller for the length of a run: the worker handles one request at a time
+        self.lock = threading.Lock()
+
+    def start(self):
+        # Spawned rather than forked, so the worker starts clean on every platform and
+        # inherits none of the scheduler's threads or log handlers
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe()
+        # Not a daemon: the task scripts start process pools of their own
+        self.process = context.Process(
+            target=worker_loop, args=(child_conn, self.script_dir, self.helper_pids_path, self.limits),
+            name="task-worker")
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.runs = 0
+        # Windows: a job object for the worker's lifetime, so its CPU limit covers all its runs
+        self.job_object = limit_started_process(self.process, self.limits)
+
+    # Returns (exit code, what cli() returned, reason the worker was recycled or None);
+    # raises RuntimeError if the worker died, and TimeoutError (with how the worker was stopped)
+    # if the run took longer than timeout_seconds
+    def run(self, script_path, args=(), timeout_seconds=None):
+        if self.process is None:
+            self.start()
+        try:
+            self.conn.send((script_path, list(args)))
+            finished = self.conn.poll(timeout_seconds)
+            if finished:
+                code, result, memory = self.conn.recv()
+        except (EOFError, OSError):
+            self.process.join(5)
+            exitcode = self.process.exitcode
+            self.stop()
+            raise RuntimeError(f"task worker exited unexpectedly (exit code {exitcode})")
+        if not finished:
+            outcome = stop_tree(self.process, self.limits.grace_seconds, self.helper_pids_path)
+            self.discard()
+            raise TimeoutError(outcome)
+        self.runs += 1
+        reason = None
+        if self.runs >= self.max_runs:
+            reason = f"{self.runs} runs"
+        elif memory is not None and memory >= self.max_memory_mb:
+            reason = f"{memory:.0f} MB in use"
+        if reason:
+            self.stop()
+        return code, result, reason
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(30)
+        if self.process.is_alive():
+            stop_tree(self.process, self.limits.grace_seconds, self.helper_pids_path)
+        self.discard()
+
+    def discard(self):
+        self.conn.close()
+        self.process = None
+        self.conn = None
+        self.job_object = None
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The scripts live at the top level of the repository and are imported as plain modules
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+# robocopy.py and PythonTask.py attach their Master.log handler on import
+os.makedirs(os.path.join(REPO_DIR, "logs"), exist_ok=True)
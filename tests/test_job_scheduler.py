@@ -0,0 +1,231 @@
+import time
+import logging
+import threading
+from datetime import datetime
+
+import pytest
+
+from job_scheduler import AdaptiveSchedule, CronSchedule, IntervalSchedule, JobScheduler, ScheduledJob
+
+logger = logging.getLogger("test_job_scheduler")
+
+def cron_next(expression, *moment):
+    timestamp = datetime(*moment).timestamp()
+    return datetime.fromtimestamp(CronSchedule(expression).next(timestamp, timestamp))
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for the scheduler")
+        time.sleep(0.01)
+
+def wait_idle(scheduler, jobs):
+    wait_until(lambda: all(job.active == 0 for job in jobs) and not scheduler.threads)
+
+# --- Cron next-run times (2026-10-16 is a Friday) ---
+@pytest.mark.parametrize("moment, expected", [
+    ((2026, 10, 14, 10, 2), datetime(2026, 10, 14, 10, 5)),
+    # Exactly on a slot: the next one, never the same minute again
+    ((2026, 10, 14, 10, 5), datetime(2026, 10, 14, 10, 10)),
+    # Past the last hour of the range: first slot of the next weekday
+    ((2026, 10, 14, 19, 55), datetime(2026, 10, 15, 7, 0)),
+    ((2026, 10, 14, 6, 59), datetime(2026, 10, 14, 7, 0)),
+    # Friday evening skips the weekend
+    ((2026, 10, 16, 19, 57), datetime(2026, 10, 19, 7, 0)),
+    ((2026, 10, 17, 12, 0), datetime(2026, 10, 19, 7, 0)),
+])
+def test_cron_range_and_step(moment, expected):
+    assert cron_next("*/5 7-19 * * 1-5", *moment) == expected
+
+@pytest.mark.parametrize("weekday", ["0", "7"])
+def test_cron_sunday_is_0_or_7(weekday):
+    assert cron_next(f"30 2 * * {weekday}", 2026, 10, 14, 0, 0) == datetime(2026, 10, 18, 2, 30)
+
+def test_cron_saturday_to_sunday_range_wraps_the_week():
+    assert cron_next("0 9 * * 6-7", 2026, 10, 17, 9, 0) == datetime(2026, 10, 18, 9, 0)
+    assert cron_next("0 9 * * 6-7", 2026, 10, 18, 9, 0) == datetime(2026, 10, 24, 9, 0)
+
+def test_cron_day_of_month_or_weekday_when_both_restricted():
+    # The 1st of the month or any Monday, whichever comes first
+    assert cron_next("0 12 1 * 1", 2026, 10, 14, 0, 0) == datetime(2026, 10, 19, 12, 0)
+    assert cron_next("0 12 1 * 1", 2026, 10, 27, 0, 0) == datetime(2026, 11, 1, 12, 0)
+
+def test_cron_day_of_month_only():
+    assert cron_next("0 0 31 * *", 2026, 11, 1, 0, 0) == datetime(2026, 12, 31, 0, 0)
+
+def test_cron_lists_and_stepped_ranges():
+    schedule = CronSchedule("0,30 8-18/5 * * *")
+    assert schedule.hours == {8, 13, 18}
+    assert schedule.minutes == {0, 30}
+    assert cron_next("0,30 8-18/5 * * *", 2026, 10, 14, 13, 30) == datetime(2026, 10, 14, 18, 0)
+
+def test_cron_year_rollover():
+    assert cron_next("0 0 1 1 *", 2026, 10, 14, 0, 0) == datetime(2027, 1, 1, 0, 0)
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "* 24 * * *", "* * 0 * *", "5-1 * * * *"])
+def test_cron_rejects_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+def test_cron_that_never_matches():
+    with pytest.raises(ValueError):
+        cron_next("0 0 31 2 *", 2026, 10, 14, 0, 0)
+
+# --- Fixed-rate intervals ---
+def test_interval_slots_stay_anchored_to_the_first_run():
+    schedule = IntervalSchedule(60)
+    assert schedule.next(1000, 1010) == 1060
+    # Slots missed while busy are not made up: the next one still falls on the 60 s grid
+    assert schedule.next(1000, 1185) == 1240
+
+# --- Overlap policies ---
+def test_skip_drops_runs_that_come_due_while_busy(caplog):
+    gate = threading.Event()
+    calls = []
+    job = ScheduledJob("process", lambda: calls.append(1) or gate.wait(5), IntervalSchedule(60), overlap="skip")
+    scheduler = JobScheduler([job], logger)
+    scheduler.start(job, "scheduled")
+    wait_until(lambda: calls)
+    with caplog.at_level(logging.WARNING, logger=logger.name):
+        scheduler.start(job, "scheduled")
+    gate.set()
+    wait_idle(scheduler, [job])
+    assert len(calls) == 1
+    assert "Skipping scheduled run of process" in caplog.text
+
+def test_queue_keeps_one_more_run_for_when_the_current_one_finishes():
+    gate = threading.Event()
+    calls = []
+    job = ScheduledJob("copy", lambda: calls.append(1) or gate.wait(5), IntervalSchedule(60), overlap="queue")
+    scheduler = JobScheduler([job], logger)
+    scheduler.start(job, "scheduled")
+    wait_until(lambda: calls)
+    for _ in range(3):
+        scheduler.start(job, "scheduled")
+    assert len(calls) == 1
+    gate.set()
+    wait_until(lambda: len(calls) == 2)
+    wait_idle(scheduler, [job])
+    assert len(calls) == 2
+
+def test_concurrent_starts_another_run_alongside():
+    gate = threading.Event()
+    calls = []
+    job = ScheduledJob("report", lambda: calls.append(1) or gate.wait(5), IntervalSchedule(60), overlap="concurrent")
+    scheduler = JobScheduler([job], logger)
+    scheduler.start(job, "scheduled")
+    scheduler.start(job, "scheduled")
+    # Both runs are in progress before either is allowed to finish
+    wait_until(lambda: len(calls) == 2)
+    assert job.active == 2
+    gate.set()
+    wait_idle(scheduler, [job])
+
+def test_unknown_overlap_policy():
+    with pytest.raises(ValueError):
+        ScheduledJob("process", lambda: None, IntervalSchedule(60), overlap="drop")
+
+# --- "after" chaining ---
+def test_after_job_starts_when_its_leader_finishes():
+    order = []
+    process = ScheduledJob("process", lambda: order.append("process"), IntervalSchedule(60))
+    copy = ScheduledJob("copy", lambda: order.append("copy"), after="process")
+    report = ScheduledJob("report", lambda: order.append("report"), after="copy")
+    scheduler = JobScheduler([process, copy, report], logger)
+    scheduler.start(process, "scheduled")
+    wait_until(lambda: len(order) == 3)
+    wait_idle(scheduler, [process, copy, report])
+    assert order == ["process", "copy", "report"]
+
+def test_after_job_still_runs_when_its_leader_fails(caplog):
+    order = []
+
+    def fail():
+        order.append("process")
+        raise RuntimeError("boom")
+
+    process = ScheduledJob("process", fail, IntervalSchedule(60))
+    copy = ScheduledJob("copy", lambda: order.append("copy"), after="process")
+    scheduler = JobScheduler([process, copy], logger)
+    with caplog.at_level(logging.ERROR, logger=logger.name):
+        scheduler.start(process, "scheduled")
+        wait_until(lambda: len(order) == 2)
+        wait_idle(scheduler, [process, copy])
+    assert order == ["process", "copy"]
+    assert "Job process failed: boom" in caplog.text
+
+def test_no_new_runs_once_stopping():
+    calls = []
+    job = ScheduledJob("process", lambda: calls.append(1), IntervalSchedule(60))
+    scheduler = JobScheduler([job], logger)
+    scheduler.stopping = True
+    scheduler.start(job, "scheduled")
+    assert calls == [] and not scheduler.threads
+
+def test_run_returns_once_is_running_goes_false():
+    calls = []
+    job = ScheduledJob("process", lambda: calls.append(1), IntervalSchedule(60))
+    scheduler = JobScheduler([job], logger)
+    thread = threading.Thread(target=scheduler.run, args=(lambda: not calls,))
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert calls == [1]
+
+# --- Adaptive interval ---
+def test_adaptive_backs_off_to_the_maximum_and_resets_on_work():
+    schedule = AdaptiveSchedule(60, 600, factor=2)
+    seconds = []
+    for _ in range(5):
+        schedule.adapt(False)
+        seconds.append(schedule.seconds)
+    assert seconds == [120, 240, 480, 600, 600]
+    assert schedule.idle_runs == 5
+    assert "maximum" in schedule.adapt(False)
+    assert "minimum" in schedule.adapt(True)
+    assert schedule.seconds == 60 and schedule.idle_runs == 0
+
+def test_adaptive_maximum_is_never_below_the_minimum():
+    schedule = AdaptiveSchedule(300, 60)
+    schedule.adapt(False)
+    assert schedule.seconds == 300
+
+def adaptive_jobs():
+    process = ScheduledJob("process", lambda: None, AdaptiveSchedule(60, 3600))
+    copy = ScheduledJob("copy", lambda: None, AdaptiveSchedule(60, 3600))
+    fixed = ScheduledJob("report", lambda: None, IntervalSchedule(600))
+    now = time.time()
+    for job in (process, copy, fixed):
+        job.next_run = now + 60
+    return process, copy, fixed
+
+def test_idle_run_only_backs_off_its_own_job():
+    process, copy, fixed = adaptive_jobs()
+    scheduler = JobScheduler([process, copy, fixed], logger)
+    started = time.time()
+    scheduler.report(process, False, started)
+    assert process.schedule.seconds == 120
+    assert process.next_run == pytest.approx(started + 120, abs=1)
+    assert copy.schedule.seconds == 60
+    assert fixed.schedule.seconds == 600
+
+def test_work_found_by_any_job_tightens_every_adaptive_job():
+    process, copy, fixed = adaptive_jobs()
+    scheduler = JobScheduler([process, copy, fixed], logger)
+    for _ in range(3):
+        scheduler.report(process, False, time.time())
+        scheduler.report(copy, False, time.time())
+    assert process.schedule.seconds == copy.schedule.seconds == 480
+    copy.next_run = time.time() + 480
+    scheduler.report(process, True, time.time())
+    assert process.schedule.seconds == copy.schedule.seconds == 60
+    # The other job's pending slot is pulled in to the new interval
+    assert copy.next_run <= time.time() + 60
+    assert fixed.schedule.seconds == 600
+
+def test_unknown_outcome_leaves_the_interval_alone():
+    process, copy, fixed = adaptive_jobs()
+    scheduler = JobScheduler([process, copy, fixed], logger)
+    scheduler.report(process, None, time.time())
+    assert process.schedule.seconds == 60 and process.schedule.idle_runs == 0
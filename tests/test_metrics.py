@@ -0,0 +1,65 @@
+import os
+import time
+
+import log_archive
+import metrics as metrics_module
+from metrics import Metrics
+
+class NullLogger:
+    def warning(self, message):
+        raise AssertionError(message)
+
+def read_prom(folder, component):
+    with open(folder / f"watchdog_{component}.prom", encoding="utf-8") as f:
+        return f.read()
+
+def test_scheduler_textfile_keeps_every_job_after_each_flush(tmp_path):
+    metrics = Metrics("scheduler", str(tmp_path))
+    with metrics.span("PythonTask.py", files=0) as span:
+        span["exit_code"] = 1
+    metrics.flush(NullLogger())
+    with metrics.span("robocopy.py", files=0) as span:
+        span["exit_code"] = 0
+    metrics.flush(NullLogger())
+    prom = read_prom(tmp_path, "scheduler")
+    assert 'watchdog_stage_exit_code{component="scheduler",stage="PythonTask.py"} 1' in prom
+    assert 'watchdog_stage_exit_code{component="scheduler",stage="robocopy.py"} 0' in prom
+    assert 'watchdog_stage_duration_seconds_count{component="scheduler",stage="PythonTask.py"} 1' in prom
+
+def test_a_stage_shows_its_latest_run_only(tmp_path):
+    metrics = Metrics("scheduler", str(tmp_path))
+    for code, timed_out in ((1, True), (0, False)):
+        with metrics.span("PythonTask.py") as span:
+            span["exit_code"] = code
+            span["timed_out"] = timed_out
+        metrics.flush(NullLogger())
+    prom = read_prom(tmp_path, "scheduler")
+    assert 'watchdog_stage_exit_code{component="scheduler",stage="PythonTask.py"} 0' in prom
+    assert 'watchdog_stage_timeouts{component="scheduler",stage="PythonTask.py"} 0' in prom
+    assert prom.count('stage="PythonTask.py",quantile="0.5"') == 1
+
+def test_jsonl_is_rotated_and_maintained_with_the_logs(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics_module, "ROTATE_BYTES", 200)
+    metrics = Metrics("process", str(tmp_path))
+    for _ in range(2):
+        for index in range(5):
+            with metrics.span("file", file=f"F{index:04d}.csv"):
+                pass
+        metrics.flush(NullLogger())
+    rotated = log_archive.rotated_logs(str(tmp_path), log_archive.METRICS_REGEX)
+    assert len(rotated) == 1
+    with open(tmp_path / "metrics.jsonl", encoding="utf-8") as f:
+        assert len(f.readlines()) == 5
+
+    settled = time.time() - log_archive.SETTLE_SECONDS - 5
+    os.utime(tmp_path / rotated[0], (settled, settled))
+    assert log_archive.maintain_logs(str(tmp_path), "gzip", 90, 1024) == (1, 0)
+    assert log_archive.rotated_logs(str(tmp_path), log_archive.METRICS_REGEX) == [rotated[0] + ".gz"]
+    # Not a log: kept out of the log index and the log search
+    assert log_archive.load_index(str(tmp_path)) == {}
+
+    expired = time.time() - 91 * 86400
+    os.utime(tmp_path / (rotated[0] + ".gz"), (expired, expired))
+    assert log_archive.maintain_logs(str(tmp_path), "gzip", 90, 1024) == (0, 1)
+    assert log_archive.rotated_logs(str(tmp_path), log_archive.METRICS_REGEX) == []
+    assert (tmp_path / "metrics.jsonl").exists()
@@ -0,0 +1,95 @@
+import os
+import csv
+import sys
+import glob
+import json
+import shutil
+import sqlite3
+import subprocess
+
+from benchmark import generate_bp_csv, generate_serum_csv
+from conftest import REPO_DIR
+from master_log import LOG_SERVER_ENV
+
+GOOD_FILES = ["F0001.csv", "F0002.csv", "F0003.csv", "NZL0001.csv", "NZL0002.csv"]
+BAD_FILE = "F0004.csv"
+
+# PythonTask.py reads config.json from its own folder, so it runs from a copy of the scripts
+def setup_run(tmp_path):
+    for path in glob.glob(os.path.join(REPO_DIR, "*.py")):
+        shutil.copy(path, tmp_path)
+    with open(os.path.join(REPO_DIR, "config.json")) as f:
+        repo_config = json.load(f)
+    raw, processed = tmp_path / "raw", tmp_path / "processed"
+    for folder in (raw, processed, tmp_path / "logs"):
+        folder.mkdir()
+    config = dict(
+        repo_config,
+        raw_file_source=str(raw),
+        bp_process_dest=str(processed),
+        serum_process_dest=str(processed),
+        record_process=str(tmp_path / "Records.xlsx"),
+        record_ledger=str(tmp_path / "Records.db"),
+        scan_index_path=str(tmp_path / "Records.db"),
+        copy_queue=str(tmp_path / "copy_queue.db"),
+        metrics_folder=str(tmp_path / "logs"),
+        log_folder=str(tmp_path),
+        record_export_xlsx=False,
+        process_workers=2,
+        label_backend="none",
+        label_async=False,
+        input_stable_seconds=0,
+    )
+    with open(tmp_path / "config.json", "w") as f:
+        json.dump(config, f)
+    for index, name in enumerate(GOOD_FILES):
+        generate = generate_serum_csv if name.startswith("F") else generate_bp_csv
+        generate(str(raw / name), 50, seed=index)
+    # Right header, but a weight that is not a number
+    with open(raw / BAD_FILE, "w", newline="") as f:
+        writer = csv.writer(f)
+        with open(raw / GOOD_FILES[0]) as good:
+            writer.writerow(next(csv.reader(good)))
+        writer.writerow(["SER-0000001", "AB", "2024-01-01", 100000, "not weighed", 0.5, 2.0, 1.0, 1.0])
+    return raw, processed
+
+def run_task(tmp_path):
+    env = dict(os.environ)
+    env.pop(LOG_SERVER_ENV, None)
+    return subprocess.run([sys.executable, "PythonTask.py"], cwd=tmp_path, env=env,
+                          capture_output=True, text=True, timeout=300)
+
+def test_pool_run_with_a_corrupt_input(tmp_path):
+    raw, processed = setup_run(tmp_path)
+    result = run_task(tmp_path)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    with sqlite3.connect(tmp_path / "Records.db") as db:
+        recorded = {row[0] for row in db.execute("SELECT file_name FROM processed_files")}
+    assert recorded == set(GOOD_FILES)
+    for name in GOOD_FILES:
+        assert (processed / name.replace(".csv", ".xlsx")).exists()
+    assert not (processed / BAD_FILE.replace(".csv", ".xlsx")).exists()
+    assert not glob.glob(str(processed / "*.part"))
+
+    with open(tmp_path / "logs" / "Master.log", encoding="utf-8") as f:
+        log = f.read()
+    assert f"Error reading {BAD_FILE}" in log
+    for name in GOOD_FILES:
+        assert log.count(f"processed: {name} ->") == 1
+
+    # Each output is labelled once, by the parent; a worker that kept the labeller it
+    # inherited would label it a second time
+    with open(tmp_path / "logs" / "metrics.jsonl", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    labelled = sorted(os.path.basename(record["file"]) for record in records if record["stage"] == "label")
+    assert labelled == sorted(name.replace(".csv", ".xlsx") for name in GOOD_FILES)
+    files = {os.path.basename(record["file"]): record["ok"] for record in records if record["stage"] == "file"}
+    assert files == dict({name: True for name in GOOD_FILES}, **{BAD_FILE: False})
+
+    # The bad file is retried on the next run and still not recorded; nothing else is redone
+    result = run_task(tmp_path)
+    assert result.returncode == 0, result.stdout + result.stderr
+    with sqlite3.connect(tmp_path / "Records.db") as db:
+        assert db.execute("SELECT COUNT(*) FROM processed_files WHERE file_name = ?", (BAD_FILE,)).fetchone() == (0,)
+    assert result.stdout.count("processed:") == 0
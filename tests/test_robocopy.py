@@ -0,0 +1,148 @@
+import os
+
+import pytest
+
+import robocopy
+from robocopy import COPY_CHUNK, RESUME_MIN_BYTES, SourceChanged, atomic_copy, resume_path
+from scan_index import file_hash
+
+original_copy_range = robocopy.copy_range
+
+def write_random(path, size):
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def partial_files(dest):
+    part = dest + ".part"
+    return [path for path in (part, resume_path(part)) if os.path.exists(path)]
+
+@pytest.fixture
+def files(tmp_path):
+    src = str(tmp_path / "source.bin")
+    dest = str(tmp_path / "dest.bin")
+    with open(dest, "wb") as f:
+        f.write(b"previous version")
+    return src, dest
+
+# --- Resuming an interrupted copy of a large file ---
+def test_interrupted_large_copy_resumes_to_an_identical_file(files, monkeypatch):
+    src, dest = files
+    write_random(src, RESUME_MIN_BYTES + COPY_CHUNK)
+
+    def drop_after_two_chunks(src_f, dest_f, offset, end):
+        original_copy_range(src_f, dest_f, offset, offset + 2 * COPY_CHUNK)
+        raise OSError("network name is no longer available")
+
+    monkeypatch.setattr(robocopy, "copy_range", drop_after_two_chunks)
+    with pytest.raises(OSError):
+        atomic_copy(src, dest)
+    part = dest + ".part"
+    assert partial_files(dest) == [part, resume_path(part)]
+    assert read(dest) == b"previous version"
+
+    # The last write was cut short halfway through a chunk
+    os.truncate(part, COPY_CHUNK + COPY_CHUNK // 2)
+    offsets = []
+
+    def record_offset(src_f, dest_f, offset, end):
+        offsets.append(offset)
+        return original_copy_range(src_f, dest_f, offset, end)
+
+    monkeypatch.setattr(robocopy, "copy_range", record_offset)
+    written, resumed_from, digest = atomic_copy(src, dest, verify=True)
+    assert resumed_from == offsets[0] == COPY_CHUNK
+    assert written == os.path.getsize(src) - COPY_CHUNK
+    assert read(dest) == read(src)
+    assert digest == file_hash(src)
+    assert partial_files(dest) == []
+
+def test_partial_copy_of_another_source_version_restarts(files):
+    src, dest = files
+    write_random(src, RESUME_MIN_BYTES)
+    part = dest + ".part"
+    with open(part, "wb") as f:
+        f.write(b"\0" * 2 * COPY_CHUNK)
+    with open(resume_path(part), "w", encoding="utf-8") as f:
+        f.write('{"size": 1, "mtime_ns": 1}')
+    written, resumed_from, _ = atomic_copy(src, dest)
+    assert (written, resumed_from) == (RESUME_MIN_BYTES, 0)
+    assert read(dest) == read(src)
+    assert partial_files(dest) == []
+
+def test_interrupted_small_copy_leaves_nothing_behind(files, monkeypatch):
+    src, dest = files
+    write_random(src, 1024 * 1024)
+
+    def fail(src_f, dest_f, offset, end):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(robocopy, "copy_range", fail)
+    with pytest.raises(OSError):
+        atomic_copy(src, dest)
+    assert partial_files(dest) == []
+    assert read(dest) == b"previous version"
+
+# --- Source modified while it is being copied ---
+def touch_forward(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 5 * 10**9))
+
+def append_bytes(path):
+    with open(path, "ab") as f:
+        f.write(b"late line\n")
+
+@pytest.mark.parametrize("change", [touch_forward, append_bytes])
+@pytest.mark.parametrize("size", [4 * 1024 * 1024, RESUME_MIN_BYTES])
+def test_source_changed_between_chunks_leaves_the_destination_alone(files, monkeypatch, change, size):
+    src, dest = files
+    write_random(src, size)
+    # Small chunks, so the change lands between two of them
+    monkeypatch.setattr(robocopy, "COPY_CHUNK", 1024 * 1024)
+
+    def change_after_first_chunk(src_f, dest_f, offset, end):
+        offset = original_copy_range(src_f, dest_f, offset, offset + robocopy.COPY_CHUNK)
+        change(src)
+        return original_copy_range(src_f, dest_f, offset, end)
+
+    monkeypatch.setattr(robocopy, "copy_range", change_after_first_chunk)
+    with pytest.raises(SourceChanged):
+        atomic_copy(src, dest)
+    assert read(dest) == b"previous version"
+    assert partial_files(dest) == []
+
+# --- copy_verify ---
+def corrupt_after_copy(src_f, dest_f, offset, end):
+    reached = original_copy_range(src_f, dest_f, offset, end)
+    os.pwrite(dest_f.fileno(), b"\xff\x00\xff", 0)
+    return reached
+
+def test_checksum_mismatch_is_not_renamed_into_place(files, monkeypatch):
+    src, dest = files
+    write_random(src, 1024 * 1024)
+    monkeypatch.setattr(robocopy, "copy_range", corrupt_after_copy)
+    with pytest.raises(OSError, match="checksum mismatch"):
+        atomic_copy(src, dest, verify=True)
+    assert read(dest) == b"previous version"
+    assert partial_files(dest) == []
+
+def test_copy_verify_reports_the_mismatch_as_a_failed_copy(files, monkeypatch):
+    src, dest = files
+    write_random(src, 1024 * 1024)
+    os.utime(dest, (0, 0))
+    monkeypatch.setattr(robocopy, "copy_range", corrupt_after_copy)
+    monkeypatch.setattr(robocopy, "copy_verify", True)
+    monkeypatch.setattr(robocopy, "metrics", robocopy.Metrics("robocopy", os.path.dirname(dest), enabled=False))
+    assert robocopy.copy_if_newer(src, dest) == ("failed", None)
+    assert read(dest) == b"previous version"
+
+def test_verified_copy_returns_the_source_checksum(files):
+    src, dest = files
+    write_random(src, 1024 * 1024)
+    written, resumed_from, digest = atomic_copy(src, dest, verify=True)
+    assert (written, resumed_from) == (1024 * 1024, 0)
+    assert digest == file_hash(src) == file_hash(dest)
+    assert os.path.getmtime(dest) == os.path.getmtime(src)
@@ -0,0 +1,92 @@
+import os
+import time
+
+import scan_index
+from scan_index import ScanIndex
+
+def classify(name):
+    return "serum" if name.startswith("F") and name.endswith(".csv") else None
+
+def settle(path):
+    past = time.time() - 120
+    os.utime(path, (past, past))
+
+def make_files(folder, names):
+    for name in names:
+        (folder / name).write_text("a,b\n1,2\n")
+        settle(folder / name)
+
+def test_only_inputs_are_stat_ed(tmp_path, monkeypatch):
+    make_files(tmp_path, ["F0001.csv", "F0002.csv", "notes.txt", "export.xlsx", "G0001.csv"])
+    (tmp_path / "F_folder.csv").mkdir()
+    stat_calls = []
+    real_scandir = os.scandir
+
+    class CountingEntry:
+        def __init__(self, entry):
+            self.entry = entry
+            self.name = entry.name
+            self.path = entry.path
+
+        def is_file(self):
+            return self.entry.is_file()
+
+        def stat(self):
+            stat_calls.append(self.name)
+            return self.entry.stat()
+
+    class CountingScandir:
+        def __init__(self, path):
+            self.entries = real_scandir(path)
+
+        def __enter__(self):
+            return (CountingEntry(entry) for entry in self.entries)
+
+        def __exit__(self, *exc):
+            self.entries.close()
+
+    monkeypatch.setattr(os, "scandir", CountingScandir)
+    index = ScanIndex(str(tmp_path / "index.db"), stable_seconds=30)
+    try:
+        candidates = index.scan(str(tmp_path), classify, lambda name: False)
+    finally:
+        index.close()
+    assert [candidate.file_name for candidate in candidates] == ["F0001.csv", "F0002.csv"]
+    assert sorted(stat_calls) == ["F0001.csv", "F0002.csv"]
+
+def test_only_the_scanned_names_are_looked_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(scan_index, "LOOKUP_BATCH", 3)
+    db_path = str(tmp_path / "index.db")
+    index = ScanIndex(db_path, stable_seconds=30)
+    # History for inputs that have since been archived away
+    index.save([(f"F9{i:03d}.csv", 1, 1, None) for i in range(50)])
+    index.close()
+
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    names = [f"F{i:04d}.csv" for i in range(7)]
+    make_files(raw, names)
+    index = ScanIndex(db_path, stable_seconds=30)
+    try:
+        assert [c.file_name for c in index.scan(str(raw), classify, lambda name: False)] == names
+        for name in names[:5]:
+            index.mark_processed(name)
+        index.mark_rejected(names[5])
+        assert index.scan(str(raw), classify, lambda name: False)[0].file_name == names[6]
+        assert sorted(index.processed) == names[:5]
+        assert sorted(index.rejected) == [names[5]]
+    finally:
+        index.close()
+
+    # A new session finds the same state without loading the whole table
+    index = ScanIndex(db_path, stable_seconds=30)
+    try:
+        assert index.processed == {} and index.rejected == {}
+        assert [c.file_name for c in index.scan(str(raw), classify, lambda name: False)] == [names[6]]
+        (raw / names[5]).write_text("a,b\n1,2\n3,4\n")
+        settle(raw / names[5])
+        assert [c.file_name for c in index.scan(str(raw), classify, lambda name: False)] == names[5:]
+        # Event-driven scans filter the given names the same way
+        assert [c.file_name for c in index.scan(str(raw), classify, lambda name: False, ["notes.txt", names[6]])] == [names[6]]
+    finally:
+        index.close()
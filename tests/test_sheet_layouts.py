@@ -0,0 +1,120 @@
+import csv
+import random
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+import PythonTask
+import benchmark
+from benchmark import BP_HEADER, generate_serum_csv
+from labelling import create_label_backend
+from sheet_layouts import BP_LAYOUT, SERUM_LAYOUT
+
+@pytest.fixture
+def precompute(monkeypatch):
+    monkeypatch.setattr(PythonTask, "precompute_derived_values", True)
+    monkeypatch.setattr(PythonTask, "label_backend", create_label_backend("none"))
+
+def write_bp_csv(path, rows, sff_weight=None, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(BP_HEADER)
+        for i in range(rows):
+            net = round(rng.uniform(0.22, 0.29), 3)
+            writer.writerow([
+                f"NZL{i:09d}", "FFP", "B00001", 200000 + i, round(net + 0.03, 3), net,
+                round(net / 1.026, 2), "", "", "",
+                # Decisions are typed by hand, so the case varies; some are still blank
+                rng.choice(["Accept", "Reject", "accept", "REJECT", ""]),
+                "", "", sff_weight if (i == 0 and sff_weight is not None) else "", "",
+            ])
+    return path
+
+def build_and_reload(kind, csv_path, output_path):
+    build = PythonTask.build_serum_workbook if kind == "serum" else PythonTask.build_bp_workbook
+    layout = SERUM_LAYOUT if kind == "serum" else BP_LAYOUT
+    df = PythonTask.read_csv_file(kind, csv_path)
+    wb, cached_values = build(df)
+    PythonTask.save_workbook(wb, output_path, layout, cached_values)
+    return df, load_workbook(output_path, data_only=True).active, load_workbook(output_path).active
+
+def test_serum_total_is_cached(precompute, tmp_path):
+    csv_path = generate_serum_csv(str(tmp_path / "F0001.csv"), 60, seed=3)
+    df, values, formulas = build_and_reload("serum", csv_path, str(tmp_path / "F0001.xlsx"))
+    expected = df.groupby("Donor ID")["Litres"].max().sum()
+    assert values["J2"].value == pytest.approx(expected)
+    # The formula itself is still there for Excel to recalculate
+    assert formulas["J2"].value.text.startswith("=SUM(")
+
+@pytest.mark.parametrize("sff_weight", [None, 8.5])
+def test_bp_totals_and_volume_are_cached(precompute, tmp_path, sff_weight):
+    csv_path = write_bp_csv(str(tmp_path / "NZL0001.csv"), 40, sff_weight)
+    df, values, formulas = build_and_reload("bp", csv_path, str(tmp_path / "NZL0001.xlsx"))
+    decision = df["Decision"].fillna("").str.lower()
+    volume = df["Volume Recorded"]
+    rejected = volume[decision == "reject"].sum()
+    sff_litres = 0.0 if sff_weight is None else sff_weight * 0.959
+    accepted = volume[decision == "accept"].sum() if sff_weight is None else sff_litres - rejected
+    assert values["N2"].value == pytest.approx(rejected)
+    assert values["O2"].value == pytest.approx(accepted)
+    assert values["Q2"].value == pytest.approx(sff_litres)
+    assert formulas["N2"].value == '=SUMIF(M:M, "Reject", I:I)'
+
+    assert values["I1"].value == "Volume (L)"
+    cached_volume = [row[0] for row in values.iter_rows(min_row=2, min_col=9, max_col=9, values_only=True)]
+    assert cached_volume == pytest.approx(volume.tolist())
+    assert formulas["I2"].value == '=IF(G2="", H2, G2*0.959)'
+
+def test_bp_values_are_left_to_excel_without_precompute(monkeypatch, tmp_path):
+    monkeypatch.setattr(PythonTask, "precompute_derived_values", False)
+    monkeypatch.setattr(PythonTask, "label_backend", create_label_backend("none"))
+    csv_path = write_bp_csv(str(tmp_path / "NZL0002.csv"), 5)
+    _, values, _ = build_and_reload("bp", csv_path, str(tmp_path / "NZL0002.xlsx"))
+    assert values["N2"].value is None
+    assert values["I3"].value is None
+
+def test_bp_totals_match_across_streamed_chunks(precompute, tmp_path):
+    csv_path = write_bp_csv(str(tmp_path / "NZL0003.csv"), 45, seed=7)
+    df = PythonTask.read_csv_file("bp", csv_path)
+    _, whole = PythonTask.build_bp_workbook(df)
+    chunks = [df.iloc[start:start + 10] for start in range(0, len(df), 10)]
+    wb, streamed = PythonTask.build_workbook(BP_LAYOUT, list(df.columns), chunks, write_only=True)
+    output_path = str(tmp_path / "NZL0003.xlsx")
+    PythonTask.save_workbook(wb, output_path, BP_LAYOUT, streamed)
+    assert streamed == pytest.approx(whole)
+    assert pd.notna(whole["N2"])
+    values = load_workbook(output_path, data_only=True).active
+    assert [values[cell].value for cell in ("N2", "O2", "Q2")] == pytest.approx([whole["N2"], whole["O2"], whole["Q2"]])
+
+# --- The style plan against the per-cell format functions it replaced (benchmark.py) ---
+def cell_look(cell, with_number_format=True):
+    look = (cell.font.name, cell.font.sz, bool(cell.font.b), cell.alignment.horizontal, bool(cell.alignment.wrap_text),
+            cell.fill.fill_type, cell.fill.fgColor.rgb if cell.fill.fill_type else None, cell.protection.locked)
+    # Header cells hold text, where the number format shows nothing
+    return look + (cell.number_format,) if with_number_format else look
+
+@pytest.mark.parametrize("kind", ["serum", "bp"])
+@pytest.mark.parametrize("streaming", [False, True])
+def test_style_plan_looks_like_the_legacy_formatting(monkeypatch, tmp_path, kind, streaming):
+    monkeypatch.setattr(PythonTask, "label_backend", create_label_backend("none"))
+    generate, file_name = benchmark.GENERATORS[kind]
+    csv_path = generate(str(tmp_path / file_name), 8)
+    legacy_path, plan_path = str(tmp_path / "legacy.xlsx"), str(tmp_path / "plan.xlsx")
+    benchmark.run_round_trip(kind, csv_path, legacy_path)
+    if streaming:
+        df = PythonTask.read_csv_file(kind, csv_path)
+        layout = benchmark.BUILDERS[kind][2]
+        wb, cached_values = PythonTask.build_workbook(layout, list(df.columns), [df], write_only=True)
+        PythonTask.save_workbook(wb, plan_path, layout, cached_values)
+    else:
+        benchmark.run_single_pass(kind, csv_path, plan_path)
+    legacy, plan = load_workbook(legacy_path).active, load_workbook(plan_path).active
+    assert (plan.max_row, plan.max_column) == (legacy.max_row, legacy.max_column)
+    for row in range(1, legacy.max_row + 1):
+        for column in range(1, legacy.max_column + 1):
+            expected, actual = legacy.cell(row, column), plan.cell(row, column)
+            assert cell_look(actual, row > 1) == cell_look(expected, row > 1), actual.coordinate
+    data_cell = plan.cell(3, 1)
+    assert (data_cell.font.name, data_cell.font.sz) == ("Calibri", 11)
@@ -0,0 +1,71 @@
+import os
+
+from sync_plan import SyncJob, configured_jobs, plan_jobs
+
+def names(jobs):
+    return [job.name for job in jobs]
+
+def test_identical_jobs_are_merged(tmp_path):
+    source, dest = str(tmp_path / "src"), str(tmp_path / "dest")
+    planned, rejected = plan_jobs([SyncJob("bp", source, dest), SyncJob("bp_again", source + os.sep, dest)])
+    assert names(planned) == ["bp"]
+    assert planned[0].merged == [("bp_again", "same source and destination")]
+    assert rejected == []
+
+def test_nested_job_with_matching_destination_is_merged(tmp_path):
+    source, dest = str(tmp_path / "src"), str(tmp_path / "dest")
+    # Listed inner first: the outer tree still absorbs it
+    nested = SyncJob("serum", os.path.join(source, "serum"), os.path.join(dest, "serum"))
+    planned, rejected = plan_jobs([nested, SyncJob("all", source, dest)])
+    assert names(planned) == ["all"]
+    assert planned[0].merged == [("serum", f"nested in {source}")]
+    assert rejected == []
+
+def test_nested_job_with_another_destination_is_kept(tmp_path):
+    source, dest = str(tmp_path / "src"), str(tmp_path / "dest")
+    nested = SyncJob("serum", os.path.join(source, "serum"), str(tmp_path / "elsewhere"))
+    planned, rejected = plan_jobs([SyncJob("all", source, dest), nested])
+    assert names(planned) == ["all", "serum"]
+    assert planned[0].merged == []
+
+def test_sibling_folder_with_a_common_prefix_is_not_nested(tmp_path):
+    source, dest = str(tmp_path / "src"), str(tmp_path / "dest")
+    planned, _ = plan_jobs([SyncJob("all", source, dest), SyncJob("src2", source + "2", dest + "2")])
+    assert names(planned) == ["all", "src2"]
+
+def test_destination_inside_its_own_source_is_rejected(tmp_path):
+    source = str(tmp_path / "src")
+    job = SyncJob("loop", source, os.path.join(source, "backup"))
+    planned, rejected = plan_jobs([job, SyncJob("same", source, source)])
+    assert planned == []
+    assert [(job.name, reason) for job, reason in rejected] == [
+        ("loop", "destination is inside the source"),
+        ("same", "destination is inside the source"),
+    ]
+
+def test_merged_job_keeps_the_most_workers(tmp_path):
+    source, dest = str(tmp_path / "src"), str(tmp_path / "dest")
+    jobs = [
+        SyncJob("all", source, dest, workers=2),
+        SyncJob("bp", os.path.join(source, "bp"), os.path.join(dest, "bp"), workers=8),
+        SyncJob("again", source, dest, workers=4),
+    ]
+    planned, _ = plan_jobs(jobs)
+    assert len(planned) == 1
+    assert planned[0].workers == 8
+    # The configured jobs themselves are left as they were
+    assert [job.workers for job in jobs] == [2, 8, 4]
+
+def test_configured_jobs_from_copy_jobs_list():
+    config = {"copy_workers": 3, "copy_jobs": [
+        {"source": "a", "destination": "b"},
+        {"name": "named", "source": "c", "destination": "d", "workers": 5},
+    ]}
+    jobs = configured_jobs(config)
+    assert [(job.name, job.source, job.destination, job.workers) for job in jobs] == [
+        ("job1", "a", "b", 3), ("named", "c", "d", 5)]
+
+def test_configured_jobs_from_bp_and_serum_keys():
+    config = {"bp_copy_source": "a", "bp_copy_dest": "b", "bp_copy_workers": 4, "serum_copy_source": "c"}
+    jobs = configured_jobs(config)
+    assert [(job.name, job.workers) for job in jobs] == [("bp", 4)]
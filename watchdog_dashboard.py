@@ -9,26 +9,8 @@ import logging
 from datetime import datetime
 import sys
 import re
-from concurrent_log_handler import ConcurrentRotatingFileHandler
-
-# --- CUSTOM TIMESTAMPED ROTATING HANDLER ---
-class TimestampedConcurrentRotatingFileHandler(ConcurrentRotatingFileHandler):
-    def doRollover(self):
-        if self.stream:
-            self.stream.close()
-            self.stream = None
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        dirname, basename = os.path.split(self.baseFilename)
-        new_logname = os.path.join(dirname, f"master_{timestamp}.log")
-
-        if os.path.exists(self.baseFilename):
-            os.rename(self.baseFilename, new_logname)
-
-        # --- Backup deletion logic removed ---
-        # All timestamped logs will be kept
-
-        self.stream = self._open()
+from master_log import attach_master_log
+from log_query import LogQuery, LOGGER_NAMES, LEVELS, normalize_time
 
 # --- CONFIG & LOGGER SETUP BLOCK ---
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -49,13 +31,9 @@ log_file_path = log_path  # Use Master.log for consistency
 formatter = logging.Formatter('[%(asctime)s] [WATCHDOG][%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 logger = logging.getLogger("WATCHDOG")
 
-# --- USE CUSTOM TIMESTAMPED HANDLER ---
-file_handler = TimestampedConcurrentRotatingFileHandler(
-    log_file_path, maxBytes=20*1024*1024, encoding='utf-8'
-)
-file_handler.setFormatter(formatter)
+# --- USE CUSTOM TIMESTAMPED HANDLER (the dashboard starts the scheduler, so it always writes directly) ---
+file_handler = attach_master_log(logger, formatter, log_file_path)
 logger.setLevel(logging.INFO)
-logger.addHandler(file_handler)
 
 # (Optional) Also log to console
 stream_handler = logging.StreamHandler(sys.stdout)
@@ -81,6 +59,8 @@ class SchedulerGUI:
         self.start_button.pack(pady=5)
         self.stop_button = tk.Button(root, text="Stop Scheduler", command=self.stop_scheduler, state=tk.DISABLED)
         self.stop_button.pack(pady=5)
+        self.search_button = tk.Button(root, text="Search Logs", command=self.open_log_browser)
+        self.search_button.pack(pady=5)
         self.output_box = scrolledtext.ScrolledText(root, wrap=tk.WORD, height=15, width=70, state=tk.DISABLED)
         self.output_box.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
         # State
@@ -178,6 +158,129 @@ class SchedulerGUI:
         self.output_box.see(tk.END)
         self.output_box.config(state=tk.DISABLED)
 
+    def open_log_browser(self):
+        LogBrowser(self.root, log_query)
+
+# --- Log search window (log_query.py): Master.log and the rotated logs, one page at a time ---
+# Pages are read on a background thread; the next one is requested when the results are
+# scrolled to the bottom or "Load More" is pressed.
+log_query = LogQuery(os.path.dirname(log_file_path))
+
+class LogBrowser:
+    PAGE_LINES = 500
+
+    def __init__(self, root, query):
+        self.root = root
+        self.query = query
+        self.window = tk.Toplevel(root)
+        self.window.title("Log Search")
+        self.window.geometry("900x500")
+        controls = tk.Frame(self.window)
+        controls.pack(fill=tk.X, padx=10, pady=5)
+        tk.Label(controls, text="From").pack(side=tk.LEFT)
+        self.since_entry = tk.Entry(controls, width=20)
+        self.since_entry.insert(0, datetime.now().strftime("%Y-%m-%d"))
+        self.since_entry.pack(side=tk.LEFT, padx=5)
+        tk.Label(controls, text="To").pack(side=tk.LEFT)
+        self.until_entry = tk.Entry(controls, width=20)
+        self.until_entry.pack(side=tk.LEFT, padx=5)
+        self.logger_choice = tk.StringVar(value="All")
+        tk.OptionMenu(controls, self.logger_choice, "All", *LOGGER_NAMES).pack(side=tk.LEFT, padx=5)
+        self.level_choice = tk.StringVar(value="All")
+        tk.OptionMenu(controls, self.level_choice, "All", *LEVELS).pack(side=tk.LEFT, padx=5)
+        tk.Button(controls, text="Search", command=self.search).pack(side=tk.LEFT, padx=5)
+        self.results = scrolledtext.ScrolledText(self.window, wrap=tk.NONE, state=tk.DISABLED)
+        self.results.pack(padx=10, fill=tk.BOTH, expand=True)
+        self.results.config(yscrollcommand=self.on_scroll)
+        footer = tk.Frame(self.window)
+        footer.pack(fill=tk.X, padx=10, pady=5)
+        self.status_label = tk.Label(footer, text="Blank times search everything; dates like 2026-10-17 or 2026-10-17 08:30")
+        self.status_label.pack(side=tk.LEFT)
+        self.more_button = tk.Button(footer, text="Load More", command=self.load_more, state=tk.DISABLED)
+        self.more_button.pack(side=tk.RIGHT)
+        # State
+        self.cursor = None
+        self.loading = False
+        self.shown = 0
+        self.pages = queue.Queue()
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+    def search(self):
+        try:
+            since = normalize_time(self.since_entry.get()) if self.since_entry.get().strip() else None
+            until = normalize_time(self.until_entry.get(), until=True) if self.until_entry.get().strip() else None
+        except ValueError as e:
+            self.status_label.config(text=str(e))
+            return
+        if self.loading:
+            return
+        if self.cursor is not None:
+            self.cursor.close()
+        loggers = None if self.logger_choice.get() == "All" else [self.logger_choice.get()]
+        levels = None if self.level_choice.get() == "All" else [self.level_choice.get()]
+        self.cursor = None
+        self.shown = 0
+        self.results.config(state=tk.NORMAL)
+        self.results.delete(1.0, tk.END)
+        self.results.config(state=tk.DISABLED)
+        self.start_fetch(lambda: self.query.query(since, until, loggers, levels))
+
+    def load_more(self):
+        if self.cursor is not None and not self.cursor.done and not self.loading:
+            self.start_fetch(lambda: self.cursor)
+
+    def on_scroll(self, first, last):
+        self.results.vbar.set(first, last)
+        if float(last) >= 1.0:
+            self.load_more()
+
+    def start_fetch(self, get_cursor):
+        self.loading = True
+        self.more_button.config(state=tk.DISABLED)
+        self.status_label.config(text="Searching...")
+        threading.Thread(target=self.fetch_page, args=(get_cursor,), daemon=True).start()
+        self.root.after(100, self.show_page)
+
+    def fetch_page(self, get_cursor):
+        try:
+            cursor = get_cursor()
+            self.pages.put((cursor, cursor.fetch(self.PAGE_LINES), None))
+        except Exception as e:
+            self.pages.put((None, [], e))
+
+    def show_page(self):
+        if not self.window.winfo_exists():
+            if not self.pages.empty():
+                cursor = self.pages.get()[0]
+                if cursor is not None:
+                    cursor.close()
+            return
+        if self.pages.empty():
+            self.root.after(100, self.show_page)
+            return
+        cursor, lines, error = self.pages.get()
+        self.loading = False
+        if error is not None:
+            self.status_label.config(text=f"Search failed: {error}")
+            logger.error(f"Log search failed: {error}")
+            return
+        self.cursor = cursor
+        self.shown += len(lines)
+        if lines:
+            self.results.config(state=tk.NORMAL)
+            self.results.insert(tk.END, "\n".join(lines) + "\n")
+            self.results.config(state=tk.DISABLED)
+        if cursor.done:
+            self.status_label.config(text=f"{self.shown} line(s)")
+        else:
+            self.status_label.config(text=f"{self.shown} line(s) so far")
+            self.more_button.config(state=tk.NORMAL)
+
+    def close(self):
+        if self.cursor is not None and not self.loading:
+            self.cursor.close()
+        self.window.destroy()
+
 if __name__ == "__main__":
     try:
         root = tk.Tk()